@@ -1,3 +1,3 @@
-from .agents import CHARACTER_TAGGING_AGENT
+from .agents import CHARACTER_TAGGING_AGENT, CHARACTER_TAGGING_MODEL
 
-__all__ = ["CHARACTER_TAGGING_AGENT"]
+__all__ = ["CHARACTER_TAGGING_AGENT", "CHARACTER_TAGGING_MODEL"]
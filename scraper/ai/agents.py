@@ -1,9 +1,13 @@
 from pydantic_ai import Agent
 from scraper.ai.prompts import CHARACTER_TAGGING_PROMPT, CharacterTags
 
+CHARACTER_TAGGING_MODEL = "openrouter:x-ai/grok-4-fast"
 
+# The model is only resolved on the first run, so importing this (e.g. to override the
+# model in `bench pipeline`) doesn't need the OpenRouter client or its API key
 CHARACTER_TAGGING_AGENT = Agent(
-    "openrouter:x-ai/grok-4-fast",
+    CHARACTER_TAGGING_MODEL,
+    defer_model_check=True,
     output_type=CharacterTags,
     system_prompt=CHARACTER_TAGGING_PROMPT,
 )
@@ -4,6 +4,9 @@ import os
 DEPENDENCIES = [
     "httpx>=0.28.1",
     "modal>=1.1.4",
+    "numpy>=2.3.0",
+    "pillow>=11.3.0",
+    "psycopg[binary]>=3.2.10",
     "pydantic>=2.11.9",
     "pydantic-ai>=1.2.1",
     "supabase>=2.21.1",
@@ -11,5 +14,15 @@ DEPENDENCIES = [
 ENV = os.getenv("ENV", "development")
 SECRETS = [modal.Secret.from_name(f"fumiko-scraper-{ENV}")]
 
+# Streaming exports from `cli_export_site` are written here
+EXPORT_VOLUME = modal.Volume.from_name("fumiko-scraper-exports", create_if_missing=True)
+EXPORT_DIR = "/exports"
+
+# Listing page responses, revalidated on each crawl so unchanged pages are skipped
+HTTP_CACHE_VOLUME = modal.Volume.from_name(
+    "fumiko-scraper-http-cache", create_if_missing=True
+)
+HTTP_CACHE_DIR = "/http-cache"
+
 image = modal.Image.debian_slim(python_version="3.12").pip_install(*DEPENDENCIES)
 app = modal.App(name="fumiko-scraper", image=image, secrets=SECRETS)
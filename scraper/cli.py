@@ -1,9 +1,26 @@
+import uuid
+from pathlib import Path
 from typing import cast
 
-from scraper.app import SECRETS, app
+from pydantic import HttpUrl
+
+from scraper.app import EXPORT_DIR, EXPORT_VOLUME, SECRETS, app
+from scraper.export import NdjsonChunkWriter, iter_ndjson_gzip_lines
+from scraper.prompt_input import compact_description
 from scraper.schemas import Character
 from scraper.registry import get_scraper
-from scraper.database import create_db_client
+from scraper.sites.base import BaseScraper
+from scraper.database import get_storage
+from scraper.storage import Filter
+
+
+async def _page_characters(
+    scraper: BaseScraper, results: list[HttpUrl] | list[Character]
+) -> list[Character]:
+    """The characters of a listing page, scraping them one by one for sites that list URLs."""
+    if results and isinstance(results[0], HttpUrl):
+        return [await scraper.scrape_character(str(url)) for url in results]
+    return cast(list[Character], results)
 
 
 @app.function()
@@ -13,7 +30,7 @@ async def cli_scrape_site(url: str, first_page_only: bool = False) -> list[dict]
         cursor = None
         while True:
             results, cursor = await scraper.scrape_site(url, cursor=cursor)
-            characters = cast(list[Character], results)
+            characters = await _page_characters(scraper, results)
             all_characters.extend([c.model_dump() for c in characters])
             if first_page_only or not cursor:
                 break
@@ -21,6 +38,35 @@ async def cli_scrape_site(url: str, first_page_only: bool = False) -> list[dict]
         return all_characters
 
 
+@app.function(volumes={EXPORT_DIR: EXPORT_VOLUME}, timeout=60 * 60)
+async def cli_export_site(
+    url: str, first_page_only: bool = False, chunk_size: int = 5000
+) -> dict:
+    """
+    Like `cli_scrape_site`, but streams characters into compressed NDJSON chunks on the
+    exports volume while crawling and only returns the export's manifest.
+    """
+    export_id = uuid.uuid4().hex
+    with NdjsonChunkWriter(
+        Path(EXPORT_DIR) / export_id,
+        chunk_size=chunk_size,
+        metadata={"export_id": export_id, "site_url": url},
+    ) as writer:
+        async with get_scraper(url) as scraper:
+            cursor = None
+            pages = 0
+            while True:
+                results, cursor = await scraper.scrape_site(url, cursor=cursor)
+                writer.write(await _page_characters(scraper, results))
+                pages += 1
+                if first_page_only or not cursor:
+                    break
+
+        manifest = writer.close()
+    await EXPORT_VOLUME.commit.aio()
+    return {**manifest, "pages": pages}
+
+
 @app.function()
 async def cli_scrape_character(url: str) -> dict:
     async with get_scraper(url) as scraper:
@@ -32,26 +78,28 @@ async def cli_scrape_character(url: str) -> dict:
 async def cli_create_tags(character_id: str) -> dict:
     from scraper.ai import CHARACTER_TAGGING_AGENT
 
-    db = create_db_client()
+    db = await get_storage()
 
-    db_response = (
-        db.table("characters")
-        .select("id, name, description")
-        .eq("id", character_id)
-        .single()
-        .execute()
+    rows = await db.select(
+        "characters",
+        "id, name, description",
+        filters=[Filter("id", "eq", character_id)],
     )
 
-    if not db_response.data:
+    if not rows:
         return {"error": f"Character with ID {character_id} not found"}
 
-    character = db_response.data
+    character = rows[0]
     character_name = character["name"]
     character_description = character["description"]
 
     if not character_name or not character_description:
         return {"error": "Character must have both name and description"}
 
+    # Compacted as in create_tags_for_character, without a batch to find boilerplate in
+    character_description, _ = compact_description(
+        character_name, character_description
+    )
     llm_response = await CHARACTER_TAGGING_AGENT.run(
         f"Character Name: {character_name}\nCharacter Description: {character_description}"
     )
@@ -72,6 +120,7 @@ def main(
     url: str = "",
     character_id: str = "",
     first_page_only: bool = True,
+    sample: int = 0,
 ):
     if mode == "site":
         results = cli_scrape_site.remote(url, first_page_only)
@@ -82,6 +131,24 @@ def main(
             print(
                 f"[{i}] {name}\nDescription: {c.get('description', '')}\nCharacter URL: {page_url}\nCreator: {c.get('creator', {}).get('name')} ({c.get('creator', {}).get('site_unique_identifier')})\n=================="
             )
+    elif mode == "export-site":
+        manifest = cli_export_site.remote(url, first_page_only)
+        print(
+            f"Exported {manifest['total_characters']} characters from {manifest['pages']} pages into {len(manifest['chunks'])} chunks ({sum(c['bytes'] for c in manifest['chunks'])} bytes compressed)"
+        )
+        print(f"Export ID: {manifest['export_id']} (on the exports volume)")
+        # Without --sample, show the reservoir sample stored in the manifest
+        rows = manifest["sample"]
+        if sample and manifest["chunks"]:
+            # Stream just enough of the first chunk to read `sample` rows
+            first_chunk = f"{manifest['export_id']}/{manifest['chunks'][0]['filename']}"
+            rows = list(
+                iter_ndjson_gzip_lines(EXPORT_VOLUME.read_file(first_chunk), sample)
+            )
+        for i, c in enumerate(rows, 1):
+            print(
+                f"[{i}] {c.get('name', '')}\nCharacter URL: {c.get('url', '')}\nCreator: {c.get('creator', {}).get('name')} ({c.get('creator', {}).get('site_unique_identifier')})\n=================="
+            )
     elif mode == "character":
         result = cli_scrape_character.remote(url)
         print(result)
@@ -1,5 +1,38 @@
+# Curated synonyms, keyed by normalized tag text (lowercase, separators as spaces)
 TAG_NORMALIZATION_MAP = {
-    "sci-fi": "sci-fi",
     "sci fi": "sci-fi",
-    "sci_fi": "sci-fi",
+    "scifi": "sci-fi",
+    "science fiction": "sci-fi",
+    "romantic": "romance",
+    "romcom": "romantic comedy",
+    "rom com": "romantic comedy",
+    "funny": "comedy",
+    "humor": "comedy",
+    "humorous": "comedy",
+    "comedic": "comedy",
+    "scary": "horror",
+    "horrific": "horror",
+    "mysterious": "mystery",
+    "magical": "magic",
+    "fantastical": "fantasy",
+    "supernatural being": "supernatural",
+    "historical fiction": "historical",
+    "post apocalypse": "post-apocalyptic",
+    "post apocalyptic": "post-apocalyptic",
+    "postapocalyptic": "post-apocalyptic",
+    "slice of life": "slice-of-life",
+    "sliceoflife": "slice-of-life",
+    "tsun": "tsundere",
+    "yan": "yandere",
+    "kuudere type": "kuudere",
+    "dominance": "dominant",
+    "submission": "submissive",
+    "lgbt": "lgbtq",
+    "lgbtq+": "lgbtq",
+    "multiple characters": "multiple",
+    "rpg": "roleplay game",
+    "oc": "original character",
 }
+
+# Words whose trailing "s" is not a plural ending
+TAG_STEM_EXCEPTIONS = {"always", "news", "series", "species"}
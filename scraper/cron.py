@@ -1,33 +1,144 @@
-from typing import cast
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, cast
+from urllib.parse import urlparse
 
+import modal
+from httpx import AsyncClient
 from pydantic import HttpUrl
-from scraper.app import app
-from scraper.database import create_db_client
+from pydantic_ai.usage import RunUsage
+from scraper.app import HTTP_CACHE_DIR, HTTP_CACHE_VOLUME, app
+from scraper.database import (
+    create_pg_connection,
+    get_async_db_client,
+    get_storage,
+)
+from scraper.crud.bulk import copy_upsert_characters
 from scraper.crud.character import (
-    upsert_characters,
-    get_characters_for_tagging,
-    upsert_tags,
-    tag_character,
+    CreatorCache,
+    aupsert_characters,
+    aget_characters_for_tagging,
+    aupsert_tags,
+    atag_character,
+    amark_characters_tag_attempted,
+    aload_tag_normalizers,
+    aget_tag_usage,
+    amerge_tags,
+    arebuild_tag_facet_counts,
+    amaintain_character_stat_partitions,
+)
+from scraper.crud.cluster import (
+    aget_minhash_candidates,
+    aget_unsigned_characters,
+    apropagate_cluster_tags,
+    asave_minhash_clusters,
+)
+from scraper.crud.job import (
+    aclaim_jobs,
+    aenqueue_jobs,
+    afinish_jobs,
+    aget_job_queue_depth,
+)
+from scraper.crud.image import (
+    aget_image_sources_to_mirror,
+    aget_image_sources_to_revalidate,
+    asave_image_sources,
+)
+from scraper.crud.site import (
+    aget_crawl_schedules,
+    aget_page_tuning,
+    aget_sites,
+    asave_crawl_schedules,
+    asave_page_tuning,
+)
+from scraper.images import MirrorStats, create_image_store, mirror_images
+from scraper.executor import CallHandle, FunctionLimits, get_executor
+from scraper.dedup import (
+    cluster_near_duplicates,
+    lsh_buckets,
+    minhash_signature,
+    signature_from_hex,
+    signature_to_hex,
+)
+from scraper.llm_metrics import LlmUsageStats
+from scraper.page_size import PageRunStats, is_page_error, tune_page_size
+from scraper.prompt_input import (
+    PromptCompactionStats,
+    compact_description,
+    estimate_tokens,
+    find_boilerplate,
+)
+from scraper.jobs import (
+    SCRAPE_SITE_JOB,
+    TAG_CHARACTER_JOB,
+    hold_leases,
+    new_worker_id,
 )
-from scraper.crud.site import get_sites
 from scraper.registry import get_scraper
-from scraper.schemas import Character, TagType, CharacterForTagging
+from scraper.request_budget import RequestBudget
+from scraper.sites.base import ParsedPage
+from scraper.scheduler import (
+    PAGES_WITHOUT_NEW_TO_STOP,
+    CrawlStats,
+    count_created_since,
+    plan_crawls,
+    record_crawl,
+    record_failed_crawl,
+)
+from scraper.schemas import (
+    Character,
+    CharacterForTagging,
+    Job,
+    JobLease,
+    TaggingBatchResult,
+    TagType,
+)
+from scraper.storage import Storage, SupabaseStorage
+from scraper.tags import TagNormalizer, plan_tag_merges
+
+# "postgrest" (default) upserts through the Supabase client, "copy" streams pages into
+# Postgres directly with COPY (requires DATABASE_URL)
+INGEST_BACKEND = os.getenv("INGEST_BACKEND", "postgrest")
 
+# Leases are renewed three times per period while work runs, so these only bound how
+# long a crashed worker's jobs wait before they're claimed again
+SCRAPE_LEASE_SECONDS = 5 * 60
+TAG_LEASE_SECONDS = 5 * 60
 
-@app.function()
+# Container time that scheduled crawls may use per day, spread over sites by churn
+CRAWL_CONTAINER_HOURS_PER_DAY = float(os.getenv("CRAWL_CONTAINER_HOURS_PER_DAY", "6"))
+# Sites each crawl worker crawls at once, and the requests they may have in flight
+# between them; see `scrape_site_worker`
+CRAWL_SITES_PER_WORKER = int(os.getenv("CRAWL_SITES_PER_WORKER", "1"))
+CRAWL_WORKER_MAX_IN_FLIGHT = int(os.getenv("CRAWL_WORKER_MAX_IN_FLIGHT", "8"))
+# Times a listing page is retried after a page error (timeout, 5xx) before the crawl
+# gives up, so the page size tuner sees per-request error rates
+LISTING_PAGE_RETRIES = 2
+
+# Limits of the fanned-out functions, applied on Modal and by the local executor
+SCRAPE_CHARACTER_LIMITS = FunctionLimits(timeout=5 * 60)
+SCRAPE_SITE_WORKER_LIMITS = FunctionLimits(timeout=60 * 60)
+CREATE_TAGS_LIMITS = FunctionLimits(timeout=60 * 10)
+
+
+@app.function(**SCRAPE_CHARACTER_LIMITS.modal_options())
 async def scrape_character_url(character_url: str, site_id: str) -> None:
     """
     Scrape a single character URL and upsert it to the database.
     Returns the upserted character data or None if scraping failed.
     """
-    db = create_db_client()
+    db = await get_storage()
     async with get_scraper(character_url) as scraper:
         character = await scraper.scrape_character(character_url)
-    result = upsert_characters(db, [character], site_id)
+    result = await aupsert_characters(db, [character], site_id)
     print(f"Scraped character {character_url} {result[0] if result else None}")
 
 
-@app.function(timeout=60 * 30)
+@app.function(volumes={HTTP_CACHE_DIR: HTTP_CACHE_VOLUME}, timeout=60 * 30)
 async def scrape_site(
     site_url: str,
     site_id: str,
@@ -39,151 +150,891 @@ async def scrape_site(
     1. The scraper returns Character objects directly - these are batch upserted
     2. The scraper returns HttpUrl objects - these are queued for individual scraping
 
+    Writing a page overlaps with fetching the next one; at most one page write is in flight.
+    Listing pages are revalidated against the HTTP cache, and pages unchanged since the
+    last crawl are skipped.
+
     Returns statistics about the scraping operation.
     """
-    db = create_db_client()
-    async with get_scraper(site_url) as scraper:
+    await crawl_site(site_url, site_id)
+
+
+async def crawl_site(
+    site_url: str,
+    site_id: str,
+    max_pages: int | None = None,
+    request_budget: RequestBudget | None = None,
+) -> None:
+    """
+    The body of `scrape_site`, shared with `scrape_site_worker`.
+
+    With `max_pages`, the crawl is incremental: listings are newest first, so it stops
+    after `max_pages` pages, or once pages in a row turn up no new characters. Either
+    way, the crawl's churn and cost go into the site's crawl schedule. A crawl that fails
+    is counted there too, so the site is retried with a backoff.
+
+    With `request_budget`, the crawl's requests share it with the other crawls running
+    in the container.
+    """
+    db = await get_storage()
+    crawl_started_at = datetime.now(timezone.utc)
+    executor = get_executor()
+    pending_upsert: asyncio.Task[list[dict[str, Any]]] | None = None
+    # Pages of the pending upsert, recorded in the HTTP cache once it has succeeded
+    pending_pages: list[ParsedPage] = []
+    # Lives for the crawl, so creators seen on earlier pages aren't written again
+    creator_cache = CreatorCache()
+    site_host = urlparse(site_url).netloc
+    cache_dir = f"{HTTP_CACHE_DIR}/{site_host}"
+    tuning = await aget_page_tuning(db, site_id)
+    scraper = get_scraper(
+        site_url,
+        cache_dir,
+        page_size=tuning.page_size if tuning else None,
+        timeout=tuning.timeout_seconds if tuning else None,
+        request_budget=request_budget.for_site(site_host) if request_budget else None,
+    )
+    # Listing requests of this crawl, from which the next crawl's page size is chosen
+    page_stats = PageRunStats(page_size=scraper.page_size)
+    async with scraper:
         total_characters_upserted = 0
         total_urls_queued = 0
+        total_new_characters = 0
         pages_processed = 0
+        pages_parsed = 0
+        pages_without_new = 0
+        reached_last_page = False
         current_cursor = None
+        # Failed attempts at the current page
+        page_errors = 0
 
-        while True:
-            print(f"[{site_url}] Scraping page {pages_processed}")
-            characters_or_urls, next_cursor = await scraper.scrape_site(
-                site_url, current_cursor
-            )
-            pages_processed += 1
+        def count_new(upserted: list[dict[str, Any]]) -> None:
+            nonlocal total_new_characters, pages_without_new
+            new_characters = count_created_since(upserted, crawl_started_at)
+            total_new_characters += new_characters
+            pages_without_new = 0 if new_characters else pages_without_new + 1
 
-            if characters_or_urls and isinstance(characters_or_urls[0], Character):
-                characters = cast(list[Character], characters_or_urls)
-                upsert_characters(db, characters, site_id)
-                total_characters_upserted += len(characters)
+        pg_conn = create_pg_connection() if INGEST_BACKEND == "copy" else None
+        try:
+            while True:
+                print(f"[{site_url}] Scraping page {pages_processed}")
+                # Only time on the wire, not waits for a request slot or proxy
+                request_seconds_before = scraper.request_timer.seconds
+                bytes_before = scraper.bytes_received
+                try:
+                    characters_or_urls, next_cursor = await scraper.scrape_site(
+                        site_url, current_cursor
+                    )
+                except Exception as e:
+                    if not is_page_error(e):
+                        raise
+                    page_stats.record_error(
+                        scraper.request_timer.seconds - request_seconds_before
+                    )
+                    if page_errors >= LISTING_PAGE_RETRIES:
+                        raise
+                    page_errors += 1
+                    print(f"[{site_url}] Retrying page {pages_processed}: {e!r}")
+                    await asyncio.sleep(2**page_errors)
+                    continue
+                page_errors = 0
+                pages_processed += 1
+                parsed_pages = scraper.take_parsed_pages()
+                # Pages unchanged since the last crawl come back empty and aren't measured
+                if characters_or_urls:
+                    pages_parsed += 1
+                    page_stats.record_page(
+                        len(characters_or_urls),
+                        scraper.request_timer.seconds - request_seconds_before,
+                        scraper.bytes_received - bytes_before,
+                    )
 
-            elif characters_or_urls and isinstance(characters_or_urls[0], HttpUrl):
-                urls = cast(list[HttpUrl], characters_or_urls)
-                for url in urls:
-                    scrape_character_url.spawn(str(url), site_id)
-                total_urls_queued += len(urls)
+                if characters_or_urls and isinstance(characters_or_urls[0], Character):
+                    characters = cast(list[Character], characters_or_urls)
+                    if pending_upsert is not None:
+                        count_new(await pending_upsert)
+                        scraper.commit_parsed_pages(pending_pages)
+                    pending_pages = parsed_pages
+                    if pg_conn is not None:
+                        pending_upsert = asyncio.create_task(
+                            asyncio.to_thread(
+                                copy_upsert_characters, pg_conn, characters, site_id
+                            )
+                        )
+                    else:
+                        pending_upsert = asyncio.create_task(
+                            aupsert_characters(db, characters, site_id, creator_cache)
+                        )
+                    total_characters_upserted += len(characters)
 
-            if next_cursor is None:
-                break
-            current_cursor = next_cursor
+                elif characters_or_urls and isinstance(characters_or_urls[0], HttpUrl):
+                    urls = cast(list[HttpUrl], characters_or_urls)
+                    for url in urls:
+                        await executor.spawn(
+                            scrape_character_url,
+                            str(url),
+                            site_id,
+                            limits=SCRAPE_CHARACTER_LIMITS,
+                        )
+                    total_urls_queued += len(urls)
+                    # Scraped elsewhere, so every listed character counts as new
+                    total_new_characters += len(urls)
+                    pages_without_new = 0
+                    scraper.commit_parsed_pages(parsed_pages)
+
+                else:
+                    pages_without_new += 1
+                    scraper.commit_parsed_pages(parsed_pages)
+
+                if next_cursor is None:
+                    reached_last_page = True
+                    break
+                if max_pages is not None and (
+                    pages_processed >= max_pages
+                    or pages_without_new >= PAGES_WITHOUT_NEW_TO_STOP
+                ):
+                    break
+                current_cursor = next_cursor
+
+            if pending_upsert is not None:
+                count_new(await pending_upsert)
+                scraper.commit_parsed_pages(pending_pages)
+        except Exception:
+            # Without this, a site whose crawls keep failing would come due every run.
+            # Failing to save it mustn't hide the crawl's own error.
+            try:
+                schedule = record_failed_crawl(
+                    site_id,
+                    (await aget_crawl_schedules(db)).get(site_id),
+                    datetime.now(timezone.utc),
+                )
+                await asave_crawl_schedules(db, [schedule])
+            except Exception as e:
+                print(f"[{site_url}] Failed to record the failed crawl: {e!r}")
+            raise
+        finally:
+            # A failed page leaves the previous page's write running, and it still needs
+            # the connection
+            if pending_upsert is not None:
+                await asyncio.gather(pending_upsert, return_exceptions=True)
+            if pg_conn is not None:
+                pg_conn.close()
+            # Run locally, the cache is a plain directory
+            if not modal.is_local():
+                await HTTP_CACHE_VOLUME.commit.aio()
+            # Failed crawls are saved too, so the next one backs off. As above, a failed
+            # save is only logged, so it can't replace an error already raised.
+            next_tuning = tune_page_size(
+                site_id, scraper.page_size_range, tuning, page_stats
+            )
+            try:
+                await asave_page_tuning(db, next_tuning)
+            except Exception as e:
+                print(f"[{site_url}] Failed to save page tuning: {e!r}")
+
+    schedule = record_crawl(
+        site_id,
+        (await aget_crawl_schedules(db)).get(site_id),
+        CrawlStats(
+            started_at=crawl_started_at,
+            finished_at=datetime.now(timezone.utc),
+            pages=pages_processed,
+            parsed_pages=pages_parsed,
+            characters=total_characters_upserted + total_urls_queued,
+            new_characters=total_new_characters,
+            full=max_pages is None and reached_last_page,
+        ),
+    )
+    await asave_crawl_schedules(db, [schedule])
 
     print(
         {
             "pages_processed": pages_processed,
             "characters_upserted": total_characters_upserted,
             "urls_queued": total_urls_queued,
+            "new_characters": total_new_characters,
+            "max_pages": max_pages,
+            "creators_written": creator_cache.creators_written,
+            "creators_skipped": creator_cache.creators_skipped,
+            "page_size": page_stats.page_size,
+            "next_page_size": next_tuning.page_size,
+            "next_timeout_seconds": next_tuning.timeout_seconds,
+            "http_cache": scraper.http_cache.stats.model_dump()
+            if scraper.http_cache
+            else None,
+            # Shared by the container's crawls, so counts are cumulative
+            "proxies": [stats.model_dump() for stats in scraper.proxy_pool.stats()]
+            if scraper.proxy_pool
+            else None,
+            "request_budget": scraper.request_budget.stats().model_dump()
+            if scraper.request_budget
+            else None,
         }
     )
 
 
-# @app.function(
-#     schedule=modal.Cron("0 8 * * *", timezone="America/New_York"), timeout=60 * 10
-# )
+@app.function(
+    volumes={HTTP_CACHE_DIR: HTTP_CACHE_VOLUME},
+    **SCRAPE_SITE_WORKER_LIMITS.modal_options(),
+)
+async def scrape_site_worker(sites_per_worker: int = CRAWL_SITES_PER_WORKER) -> None:
+    """
+    Claim site crawls from the job queue and run them until none are left.
+
+    Up to `sites_per_worker` crawls run at once on the worker's event loop, taking
+    another from the queue as each finishes. Crawls spend most of their time waiting on
+    responses, so this keeps the container busy: between them they may have
+    CRAWL_WORKER_MAX_IN_FLIGHT requests in flight, shared fairly between sites (see
+    `RequestBudget`). Each crawl holds its own lease and fails, finishes and reports
+    its stats on its own.
+
+    The lease on a running crawl is renewed while it runs, so a crashed worker's crawls
+    are picked up by another worker once their leases expire.
+    """
+    db = await get_storage()
+    worker_id = new_worker_id("scrape-site")
+    request_budget = (
+        RequestBudget(CRAWL_WORKER_MAX_IN_FLIGHT) if sites_per_worker > 1 else None
+    )
+    running: set[asyncio.Task[None]] = set()
+
+    while True:
+        if len(running) < sites_per_worker:
+            jobs = await aclaim_jobs(
+                db,
+                SCRAPE_SITE_JOB,
+                worker_id,
+                limit=sites_per_worker - len(running),
+                lease_seconds=SCRAPE_LEASE_SECONDS,
+            )
+            for job in jobs:
+                running.add(
+                    asyncio.create_task(
+                        run_crawl_job(db, job, worker_id, request_budget)
+                    )
+                )
+        if not running:
+            break
+        _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+    if request_budget is not None:
+        print(
+            {"request_budget": [stats.model_dump() for stats in request_budget.stats()]}
+        )
+
+
+async def run_crawl_job(
+    db: Storage, job: Job, worker_id: str, request_budget: RequestBudget | None
+) -> None:
+    """Run one claimed crawl for `scrape_site_worker`, holding its lease until it's done."""
+    async with hold_leases(db, [job.id], worker_id, SCRAPE_LEASE_SECONDS):
+        try:
+            await crawl_site(
+                job.payload["site_url"],
+                job.payload["site_id"],
+                job.payload.get("max_pages"),
+                request_budget,
+            )
+        except Exception as e:
+            print(f"Failed to scrape {job.payload['site_url']}: {e}")
+            # Not retried from the queue: crawl_site has recorded the failure, and the
+            # crawl scheduler queues the site again once it has backed off
+            await afinish_jobs(db, [job.id], worker_id, "abandoned", str(e))
+            return
+    await afinish_jobs(db, [job.id], worker_id, "done")
+
+
+# @app.function(schedule=modal.Cron("0 * * * *"), timeout=60 * 10)
 async def scrape_sites() -> None:
     """
-    Batch scrape all sites in the database.
+    Queue crawls for the sites that are due.
+
+    This is the main entry point for scheduled scraping jobs, and runs hourly. The crawl
+    scheduler sets each site's next crawl time and depth from its rate of new characters
+    and its crawl costs, within CRAWL_CONTAINER_HOURS_PER_DAY; see `plan_crawls`.
+    It queues a crawl job for each site that is due and spawns a worker per
+    CRAWL_SITES_PER_WORKER queued jobs.
+    Sites whose crawl is still queued or running from an earlier run are not queued
+    again.
 
-    This is the main entry point for scheduled scraping jobs.
-    It fetches all sites and spawns a scraping job for each one.
+    Before queueing, the character stats history gets partitions for the coming months
+    and drops those past retention.
 
     Returns a summary of the batch operation.
     """
-    db = create_db_client()
-    sites = get_sites(db)
+    db = await get_storage()
+    sites = await aget_sites(db)
 
     if not sites:
         print("No sites found in database")
         return
 
-    for site in sites:
-        scrape_site.spawn(str(site.url), str(site.id))
+    schedules, due = plan_crawls(
+        sites,
+        await aget_crawl_schedules(db),
+        datetime.now(timezone.utc),
+        CRAWL_CONTAINER_HOURS_PER_DAY,
+    )
+    await asave_crawl_schedules(db, schedules)
+    # Crawls append to the stats history, so its next partitions must exist first
+    stat_partitions = await amaintain_character_stat_partitions(db)
+    sites_by_id = {str(site.id): site for site in sites}
+
+    jobs_queued = await aenqueue_jobs(
+        db,
+        SCRAPE_SITE_JOB,
+        [
+            {
+                "key": schedule.site_id,
+                "payload": {
+                    "site_url": str(sites_by_id[schedule.site_id].url),
+                    "site_id": schedule.site_id,
+                    "max_pages": schedule.max_pages,
+                },
+            }
+            for schedule in due
+        ],
+    )
+    executor = get_executor()
+    for _ in range(math.ceil(jobs_queued / CRAWL_SITES_PER_WORKER)):
+        await executor.spawn(scrape_site_worker, limits=SCRAPE_SITE_WORKER_LIMITS)
 
     print(
         {
             "total_sites": len(sites),
-            "sites_queued": [
-                {"id": str(site.id), "name": site.name, "url": str(site.url)}
-                for site in sites
+            "sites_due": len(due),
+            "jobs_queued": jobs_queued,
+            "stat_partitions": stat_partitions,
+            "sites": [
+                {
+                    "id": schedule.site_id,
+                    "name": sites_by_id[schedule.site_id].name,
+                    "next_crawl_at": schedule.next_crawl_at,
+                    "max_pages": schedule.max_pages,
+                    "new_per_hour": schedule.new_per_hour,
+                }
+                for schedule in schedules
             ],
+            "queue_depth": await aget_job_queue_depth(db),
         }
     )
 
+    # Only waits when the workers run in this process
+    await executor.join()
 
-@app.function(timeout=60 * 10)
-async def create_tags_for_character(characters: list[CharacterForTagging]) -> None:
+
+@app.function(**CREATE_TAGS_LIMITS.modal_options())
+async def create_tags_for_character(
+    characters: list[CharacterForTagging],
+    deadline: float | None = None,
+    token_budget: int | None = None,
+    lease: JobLease | None = None,
+    normalizers: dict[TagType, TagNormalizer] | None = None,
+) -> TaggingBatchResult:
     """
     Create tags for a batch of characters within a single container invocation.
 
-    Expects each character to have keys: id, name, description.
+    Expects each character to have keys: id, name, description. Descriptions are
+    compacted first (see `compact_description`), with lines shared by several of the
+    batch's descriptions dropped as boilerplate. Tags are then copied to the other
+    members of each character's near-duplicate cluster.
+
+    Stops before the next character once `deadline` (a Unix timestamp) has passed or the
+    LLM calls have used `token_budget` tokens; the rest stay in the queue for the next run.
+
+    With a `lease` on the characters' jobs, the leases are renewed while the batch runs and
+    each job is finished as its character is done. Characters whose lease was lost are
+    skipped, since another worker may be tagging them.
+
+    Tag names are normalized with `normalizers`, which `tag_characters` loads once per
+    run; without them, they're loaded from the tags table.
     """
-    from scraper.ai import CHARACTER_TAGGING_AGENT
+    from scraper.ai import CHARACTER_TAGGING_MODEL
 
-    db = create_db_client()
+    db = await get_storage()
+    if normalizers is None:
+        normalizers = await aload_tag_normalizers(db)
+    tagged_character_ids: list[str] = []
+    characters_failed = 0
+    llm_stats = LlmUsageStats(model=CHARACTER_TAGGING_MODEL)
+    compaction_stats = PromptCompactionStats()
+    boilerplate = find_boilerplate(character["description"] for character in characters)
+    job_ids = lease["job_ids"] if lease else {}
+    worker_id = lease["worker_id"] if lease else ""
 
-    for character in characters:
-        character_id = character["id"]
-        character_name = character["name"]
-        character_description = character["description"]
+    # Without a lease there is nothing to hold, and the background renewal exits at once
+    async with hold_leases(
+        db, job_ids.values(), worker_id, TAG_LEASE_SECONDS
+    ) as held_job_ids:
+        for character in characters:
+            if (deadline is not None and time.time() >= deadline) or (
+                token_budget is not None and llm_stats.total_tokens >= token_budget
+            ):
+                break
 
-        print(f"Creating tags for character {character_id}: {character_name}")
+            job_id = job_ids.get(character["id"])
+            if lease and job_id not in held_job_ids:
+                continue
 
-        try:
-            llm_response = await CHARACTER_TAGGING_AGENT.run(
-                f"Character Name: {character_name}\nCharacter Description: {character_description}"
-            )
+            try:
+                await tag_character_with_llm(
+                    db,
+                    character,
+                    normalizers,
+                    llm_stats,
+                    compaction_stats,
+                    boilerplate,
+                )
+                tagged_character_ids.append(character["id"])
+            except Exception as e:
+                characters_failed += 1
+                print(
+                    f"Failed to create tags for character {character['id']} ({character['name']}): {e}"
+                )
+                if job_id:
+                    held_job_ids.discard(job_id)
+                    await afinish_jobs(db, [job_id], worker_id, "failed", str(e))
+                continue
 
-            content_tag_ids = upsert_tags(
-                db, llm_response.output.content_tags, TagType.CONTENT
-            )
-            personality_tag_ids = upsert_tags(
-                db, llm_response.output.personality_tags, TagType.PERSONALITY
-            )
-            all_tag_ids = content_tag_ids + personality_tag_ids
-            tag_character(db, character_id, all_tag_ids)
+            if job_id:
+                held_job_ids.discard(job_id)
+                await afinish_jobs(db, [job_id], worker_id, "done")
 
-            print(
-                f"Created {len(all_tag_ids)} tags for character {character_id}: content={llm_response.output.content_tags}, personality={llm_response.output.personality_tags}"
-            )
-        except Exception as e:
-            print(
-                f"Failed to create tags for character {character_id} ({character_name}): {e}"
-            )
+        # Whatever the budget left over goes back to the queue
+        await afinish_jobs(db, list(held_job_ids), worker_id, "released")
+
+    if tagged_character_ids:
+        propagated = await apropagate_cluster_tags(db, tagged_character_ids)
+        print(f"Propagated {propagated} tags to near-duplicate characters")
+
+    print(
+        {
+            "llm_usage": llm_stats.summary(),
+            "prompt_compaction": compaction_stats.summary(),
+        }
+    )
+    return {
+        "characters_tagged": len(tagged_character_ids),
+        "characters_failed": characters_failed,
+        "characters_skipped": len(characters)
+        - len(tagged_character_ids)
+        - characters_failed,
+        "total_tokens": llm_stats.total_tokens,
+        "llm_usage": llm_stats.model_dump(),
+        "prompt_compaction": compaction_stats.model_dump(),
+    }
+
+
+async def tag_character_with_llm(
+    db: Storage,
+    character: CharacterForTagging,
+    normalizers: dict[TagType, TagNormalizer],
+    llm_stats: LlmUsageStats,
+    compaction_stats: PromptCompactionStats,
+    boilerplate: set[str] | frozenset[str] = frozenset(),
+) -> None:
+    """
+    Generate and store tags for one character, recording the agent run in `llm_stats`
+    and how much its description was compacted in `compaction_stats`.
+    """
+    from scraper.ai import CHARACTER_TAGGING_AGENT
+
+    character_id = character["id"]
+    character_name = character["name"]
+    character_description, truncated = compact_description(
+        character_name, character["description"], boilerplate
+    )
+    compaction_stats.record(
+        estimate_tokens(character["description"]),
+        estimate_tokens(character_description),
+        truncated,
+    )
+
+    print(f"Creating tags for character {character_id}: {character_name}")
+
+    # Passed in so that usage is counted even when the run fails
+    usage = RunUsage()
+    started_at = time.perf_counter()
+    try:
+        llm_response = await CHARACTER_TAGGING_AGENT.run(
+            f"Character Name: {character_name}\nCharacter Description: {character_description}",
+            usage=usage,
+        )
+    except Exception:
+        llm_stats.record(usage, time.perf_counter() - started_at, failed=True)
+        raise
+    llm_stats.record(usage, time.perf_counter() - started_at, failed=False)
+
+    content_tag_ids = await aupsert_tags(
+        db,
+        llm_response.output.content_tags,
+        TagType.CONTENT,
+        normalizers[TagType.CONTENT],
+    )
+    personality_tag_ids = await aupsert_tags(
+        db,
+        llm_response.output.personality_tags,
+        TagType.PERSONALITY,
+        normalizers[TagType.PERSONALITY],
+    )
+    all_tag_ids = content_tag_ids + personality_tag_ids
+    if all_tag_ids:
+        await atag_character(db, character_id, all_tag_ids)
+    else:
+        # Otherwise it stays untagged, and is queued and paid for again on every run
+        await amark_characters_tag_attempted(db, [character_id])
+
+    print(
+        f"Created {len(all_tag_ids)} tags for character {character_id}: content={llm_response.output.content_tags}, personality={llm_response.output.personality_tags}"
+    )
 
 
 # @app.function(
 #     schedule=modal.Cron("0 9 * * *", timezone="America/New_York"), timeout=60 * 30
 # )
-async def tag_characters() -> None:
+async def tag_characters(
+    token_budget: int = 5_000_000,
+    time_budget_seconds: int = 25 * 60,
+    max_concurrent_batches: int = 10,
+) -> None:
     """
-    Batch create tags for all characters that don't have tags yet.
+    Batch create tags for characters that don't have tags yet, most popular first.
 
     This runs 1 hour after the scrape_sites CRON job (9 AM vs 8 AM).
-    Processes characters in batches of 500 and spawns parallel tag creation jobs.
+    Takes characters from the tagging queue in priority order, in batches of 100, and runs
+    up to `max_concurrent_batches` tag creation jobs at once.
+
+    Untagged members of already tagged clusters get the cluster's tags without an LLM
+    call, and only one character per remaining cluster is sent for tagging.
+
+    The run stops queueing batches once `token_budget` LLM tokens are used (counting what
+    running batches are expected to use) or `time_budget_seconds` have passed, and running
+    batches stop at the same limits, so whatever is left over is the least popular work.
+
+    Characters go through the job queue: each page of the tagging queue is enqueued as
+    `tag_character` jobs (one per cluster), and batches are claimed from it with a lease.
+    Overlapping runs therefore never tag the same character twice, and characters from a
+    batch that crashed are claimed again once their lease expires.
     """
-    db = create_db_client()
+    db = await get_storage()
+    executor = get_executor()
+    deadline = time.time() + time_budget_seconds
+    worker_id = new_worker_id("tag-characters")
+
+    tags_propagated = await apropagate_cluster_tags(db)
+    # Loaded once for the run rather than by every batch
+    normalizers = await aload_tag_normalizers(db)
 
     total_characters_queued = 0
     batches_processed = 0
+    queued_cluster_ids: set[str] = set()
+    # Running batches, with how many characters each was given
+    running: list[tuple[CallHandle, int]] = []
+    totals: dict[str, int] = {
+        "characters_tagged": 0,
+        "characters_failed": 0,
+        "characters_skipped": 0,
+        "total_tokens": 0,
+    }
+    # Batches that crashed; their characters are claimed again once the leases expire
+    batches_failed = 0
+    llm_stats: LlmUsageStats | None = None
+    compaction_stats = PromptCompactionStats()
+
+    async def wait_for_oldest_batch() -> None:
+        nonlocal llm_stats, compaction_stats, batches_failed
+        call, size = running.pop(0)
+        try:
+            result: TaggingBatchResult = await call.get()
+        except Exception as e:
+            batches_failed += 1
+            print(f"Tagging batch of {size} characters failed: {e}")
+            return
+        totals["characters_tagged"] += result["characters_tagged"]
+        totals["characters_failed"] += result["characters_failed"]
+        totals["characters_skipped"] += result["characters_skipped"]
+        totals["total_tokens"] += result["total_tokens"]
+        batch_llm_stats = LlmUsageStats(**result["llm_usage"])
+        llm_stats = llm_stats.merge(batch_llm_stats) if llm_stats else batch_llm_stats
+        compaction_stats = compaction_stats.merge(
+            PromptCompactionStats(**result["prompt_compaction"])
+        )
 
-    for batch in get_characters_for_tagging(db, batch_size=100):
+    def committed_tokens() -> int:
+        # Tokens used so far, plus what running batches are expected to use at the
+        # average cost per character seen so far
+        characters_done = totals["characters_tagged"] + totals["characters_failed"]
+        if not characters_done:
+            return totals["total_tokens"]
+        tokens_per_character = totals["total_tokens"] / characters_done
+        return totals["total_tokens"] + round(
+            tokens_per_character * sum(size for _, size in running)
+        )
+
+    def budget_spent() -> bool:
+        return time.time() >= deadline or committed_tokens() >= token_budget
+
+    discovery = aget_characters_for_tagging(db, batch_size=100)
+    discovery_done = False
+
+    while True:
+        while running and (len(running) >= max_concurrent_batches or budget_spent()):
+            await wait_for_oldest_batch()
+        if budget_spent():
+            print(
+                "Tagging budget spent, leaving the rest of the queue for the next run"
+            )
+            break
+
+        if not discovery_done:
+            batch = await anext(discovery, None)
+            if batch is None:
+                discovery_done = True
+            else:
+                jobs: list[dict[str, Any]] = []
+                for c in batch:
+                    if c["cluster_id"] in queued_cluster_ids:
+                        continue
+                    if c["cluster_id"]:
+                        queued_cluster_ids.add(c["cluster_id"])
+                    character: CharacterForTagging = {
+                        "id": c["id"],
+                        "name": c["name"],
+                        "description": c["description"],
+                    }
+                    jobs.append(
+                        {
+                            # One job per cluster: tags reach the other members anyway
+                            "key": c["cluster_id"] or c["id"],
+                            "payload": character,
+                            "priority": c["tagging_priority"],
+                        }
+                    )
+                total_characters_queued += await aenqueue_jobs(
+                    db, TAG_CHARACTER_JOB, jobs
+                )
+
+        # Highest priority first, including jobs left over from earlier runs
+        claimed = await aclaim_jobs(
+            db, TAG_CHARACTER_JOB, worker_id, limit=100, lease_seconds=TAG_LEASE_SECONDS
+        )
+        if not claimed:
+            if discovery_done:
+                break
+            continue
+
+        typed_batch = [cast(CharacterForTagging, job.payload) for job in claimed]
+        lease: JobLease = {
+            "worker_id": worker_id,
+            "job_ids": {job.payload["id"]: job.id for job in claimed},
+        }
+        # A batch may use whatever is left of the budget, but no more
+        call = await executor.spawn(
+            create_tags_for_character,
+            typed_batch,
+            deadline,
+            token_budget - committed_tokens(),
+            lease,
+            normalizers,
+            limits=CREATE_TAGS_LIMITS,
+        )
+        running.append((call, len(typed_batch)))
         batches_processed += 1
 
-        # Narrow typing for batch to the expected payload
-        typed_batch: list[CharacterForTagging] = [
-            {"id": c["id"], "name": c["name"], "description": c["description"]}
-            for c in batch
-        ]
-        create_tags_for_character.spawn(typed_batch)
-        total_characters_queued += len(batch)
+        print(
+            f"Batch {batches_processed}: Claimed {len(typed_batch)} characters for tagging"
+        )
 
-        print(f"Batch {batches_processed}: Queued {len(batch)} characters for tagging")
+    while running:
+        await wait_for_oldest_batch()
 
     print(
         {
+            "tags_propagated": tags_propagated,
             "batches_processed": batches_processed,
+            "batches_failed": batches_failed,
             "total_characters_queued": total_characters_queued,
+            **totals,
+            "llm_usage": llm_stats.summary() if llm_stats else None,
+            "prompt_compaction": compaction_stats.summary(),
+            "queue_depth": await aget_job_queue_depth(db),
+        }
+    )
+
+
+@app.function(timeout=60 * 30)
+async def cluster_characters(batch_size: int = 500, max_batches: int = 200) -> None:
+    """
+    Group near-duplicate characters (forks and cross-posts) into clusters.
+
+    Signs each new or edited description with MinHash, looks up already signed characters
+    sharing an LSH bucket, and merges the ones similar enough into one cluster_id.
+    """
+    db = await get_storage()
+    batches_processed = 0
+    characters_clustered = 0
+    clusters_merged = 0
+
+    while batches_processed < max_batches:
+        batch = await aget_unsigned_characters(db, batch_size)
+        if not batch:
+            break
+
+        signatures = {}
+        unsignable_ids = []
+        for character in batch:
+            signature = minhash_signature(character["description"] or "")
+            if signature is None:
+                unsignable_ids.append(character["id"])
+            else:
+                signatures[character["id"]] = signature
+
+        buckets_by_id = {
+            character_id: lsh_buckets(signature)
+            for character_id, signature in signatures.items()
+        }
+        candidates = await aget_minhash_candidates(
+            db, list({b for buckets in buckets_by_id.values() for b in buckets})
+        )
+        indexed = [
+            {**candidate, "signature": signature_from_hex(candidate["minhash"])}
+            for candidate in candidates
+            if candidate["id"] not in signatures
+        ]
+        assignments, cluster_merges = cluster_near_duplicates(signatures, indexed)
+
+        rows = [
+            {
+                "id": character_id,
+                "minhash": signature_to_hex(signature),
+                "cluster_id": assignments[character_id],
+                "buckets": [
+                    {"band": band, "bucket": bucket}
+                    for band, bucket in buckets_by_id[character_id]
+                ],
+            }
+            for character_id, signature in signatures.items()
+        ]
+        # Nothing to compare on: mark as signed, in a cluster of their own
+        rows.extend(
+            {
+                "id": character_id,
+                "minhash": "\\x",
+                "cluster_id": character_id,
+                "buckets": [],
+            }
+            for character_id in unsignable_ids
+        )
+        await asave_minhash_clusters(db, rows, cluster_merges)
+
+        batches_processed += 1
+        characters_clustered += len(batch)
+        clusters_merged += len(cluster_merges)
+        print(
+            f"Batch {batches_processed}: clustered {len(batch)} characters, {len(set(assignments.values()))} clusters"
+        )
+
+    print(
+        {
+            "batches_processed": batches_processed,
+            "characters_clustered": characters_clustered,
+            "clusters_merged": clusters_merged,
+        }
+    )
+
+
+@app.function(timeout=60 * 10)
+async def merge_duplicate_tags(dry_run: bool = True) -> None:
+    """
+    Backfill for tag normalization: merge existing tags that now normalize to the same
+    canonical tag, moving their characters onto it.
+
+    With dry_run, only prints the planned merges and renames.
+    """
+    db = await get_storage()
+    tags = await aget_tag_usage(db)
+    merges, renames = plan_tag_merges(tags)
+
+    names_by_id = {tag["id"]: tag["name"] for tag in tags}
+    for merge in merges:
+        print(
+            f"Merge '{names_by_id[merge['source_id']]}' into '{names_by_id[merge['target_id']]}'"
+        )
+    for rename in renames:
+        print(f"Rename '{names_by_id[rename['id']]}' to '{rename['name']}'")
+
+    if not dry_run and (merges or renames):
+        await amerge_tags(db, merges, renames)
+
+    print(
+        {
+            "dry_run": dry_run,
+            "total_tags": len(tags),
+            "tags_merged": len(merges),
+            "tags_renamed": len(renames),
         }
     )
+
+
+@app.function(timeout=60 * 10)
+async def repair_tag_facet_counts() -> None:
+    """
+    Recount the per-tag and per-(tag, site) character counts from character_tags and fix
+    any that drifted from what the triggers maintain.
+    """
+    db = await get_storage()
+    print(await arebuild_tag_facet_counts(db))
+
+
+@app.function(timeout=60 * 30)
+async def mirror_avatars(batch_size: int = 200, max_batches: int = 50) -> None:
+    """
+    Mirror character and creator avatars into our own storage as thumbnails.
+
+    Avatars that were never mirrored come first, then mirrors older than a week are
+    revalidated with conditional requests.
+    """
+    db = await get_storage()
+    # With local storage, thumbnails go to IMAGE_STORE_DIR rather than a Supabase bucket
+    store = create_image_store(
+        await get_async_db_client() if isinstance(db, SupabaseStorage) else None
+    )
+    revalidate_before = datetime.now(timezone.utc) - timedelta(days=7)
+    totals = MirrorStats()
+    batches_processed = 0
+
+    with ProcessPoolExecutor() as process_pool:
+        async with AsyncClient(timeout=30.0, follow_redirects=True) as http_client:
+            # Never-mirrored avatars are paged through by URL, so those that fail are
+            # left for the next run rather than fetched again in every batch
+            after: str | None = None
+            revalidating = False
+            while batches_processed < max_batches:
+                if not revalidating:
+                    sources = await aget_image_sources_to_mirror(db, batch_size, after)
+                    if sources:
+                        after = sources[-1].source_url
+                    else:
+                        revalidating = True
+                if revalidating:
+                    sources = await aget_image_sources_to_revalidate(
+                        db, batch_size, revalidate_before
+                    )
+                if not sources:
+                    break
+
+                results, stats = await mirror_images(
+                    http_client, store, sources, process_pool
+                )
+                await asave_image_sources(db, results)
+                batches_processed += 1
+
+                print(f"Batch {batches_processed}: {stats.model_dump()}")
+                totals = MirrorStats(
+                    **{
+                        field: value + getattr(stats, field)
+                        for field, value in totals.model_dump().items()
+                    }
+                )
+
+    print({"batches_processed": batches_processed, **totals.model_dump()})
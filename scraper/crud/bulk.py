@@ -0,0 +1,149 @@
+from typing import Any
+
+from psycopg import Connection
+from psycopg.rows import dict_row
+
+from scraper.schemas import Character
+
+# Staging tables live for the duration of one transaction. Every row carries the position
+# of the character it came from (`ord`) so the merge below can reproduce the in-order
+# dedup rules of `upsert_characters` with set-based SQL.
+CREATE_STAGING_TABLES_SQL = """
+create temp table creators_staging (
+  ord integer not null,
+  name text not null,
+  image_url text,
+  urls text[] not null,
+  site_unique_identifier text not null,
+  follower_count integer
+) on commit drop;
+
+create temp table characters_staging (
+  ord integer not null,
+  name text not null,
+  description text not null,
+  url text not null,
+  image_url text not null,
+  like_count integer,
+  message_count integer,
+  chat_count integer,
+  token_count integer,
+  creator_site_unique_identifier text not null
+) on commit drop;
+"""
+
+# Creator merge rules, per site_unique_identifier:
+# - name: first occurrence wins
+# - image_url: first non-null value wins
+# - urls: union of all URLs, ordered by first appearance
+# - follower_count: maximum known value
+MERGE_CREATORS_SQL = """
+with merged as (
+  select
+    s.site_unique_identifier,
+    (array_agg(s.name order by s.ord))[1] as name,
+    (array_agg(s.image_url order by s.ord) filter (where s.image_url is not null))[1] as image_url,
+    max(s.follower_count) as follower_count
+  from creators_staging s
+  group by s.site_unique_identifier
+),
+first_seen_urls as (
+  select distinct on (s.site_unique_identifier, u.url)
+    s.site_unique_identifier, u.url, s.ord, u.idx
+  from creators_staging s, unnest(s.urls) with ordinality as u(url, idx)
+  order by s.site_unique_identifier, u.url, s.ord, u.idx
+),
+merged_urls as (
+  select site_unique_identifier, array_agg(url order by ord, idx) as urls
+  from first_seen_urls
+  group by site_unique_identifier
+)
+insert into public.creators (name, image_url, urls, site_id, site_unique_identifier, follower_count)
+select m.name, m.image_url, coalesce(u.urls, '{}'), %(site_id)s, m.site_unique_identifier, m.follower_count
+from merged m
+left join merged_urls u using (site_unique_identifier)
+on conflict (site_unique_identifier, site_id) do update set
+  name = excluded.name,
+  image_url = excluded.image_url,
+  urls = excluded.urls,
+  follower_count = excluded.follower_count
+"""
+
+# Characters are deduplicated by URL, always taking the one that appears last
+MERGE_CHARACTERS_SQL = """
+insert into public.characters (
+  name, description, url, image_url, like_count, message_count, chat_count, token_count, creator_id
+)
+select distinct on (s.url)
+  s.name, s.description, s.url, s.image_url, s.like_count, s.message_count, s.chat_count,
+  s.token_count, c.id
+from characters_staging s
+join public.creators c
+  on c.site_id = %(site_id)s and c.site_unique_identifier = s.creator_site_unique_identifier
+order by s.url, s.ord desc
+on conflict (url) do update set
+  name = excluded.name,
+  description = excluded.description,
+  image_url = excluded.image_url,
+  like_count = excluded.like_count,
+  message_count = excluded.message_count,
+  chat_count = excluded.chat_count,
+  token_count = excluded.token_count,
+  creator_id = excluded.creator_id
+returning *
+"""
+
+
+def copy_upsert_characters(
+    conn: Connection, characters: list[Character], site_id: str
+) -> list[dict[str, Any]]:
+    """
+    Upsert multiple characters by streaming them into staging tables with COPY.
+
+    Same dedup semantics as `upsert_characters`, but the merge happens in Postgres with
+    two set-based upserts instead of two JSON payloads sent through PostgREST.
+    """
+    if not characters:
+        return []
+
+    with conn.transaction(), conn.cursor(row_factory=dict_row) as cursor:
+        cursor.execute(CREATE_STAGING_TABLES_SQL)
+
+        with cursor.copy(
+            "copy creators_staging (ord, name, image_url, urls, site_unique_identifier, follower_count) from stdin"
+        ) as copy:
+            for position, character in enumerate(characters):
+                creator = character.creator
+                copy.write_row(
+                    (
+                        position,
+                        creator.name,
+                        str(creator.image_url) if creator.image_url else None,
+                        [str(url) for url in creator.urls],
+                        creator.site_unique_identifier,
+                        creator.follower_count,
+                    )
+                )
+
+        with cursor.copy(
+            "copy characters_staging (ord, name, description, url, image_url, like_count, message_count, chat_count, token_count, creator_site_unique_identifier) from stdin"
+        ) as copy:
+            for position, character in enumerate(characters):
+                copy.write_row(
+                    (
+                        position,
+                        character.name,
+                        character.description,
+                        str(character.url),
+                        str(character.image_url),
+                        character.like_count,
+                        character.message_count,
+                        character.chat_count,
+                        character.token_count,
+                        character.creator.site_unique_identifier,
+                    )
+                )
+
+        cursor.execute(MERGE_CREATORS_SQL, {"site_id": site_id})
+        cursor.execute(MERGE_CHARACTERS_SQL, {"site_id": site_id})
+        return cursor.fetchall()
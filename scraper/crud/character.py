@@ -1,22 +1,19 @@
-from typing import Any, Generator
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, AsyncGenerator, Generator, cast
 
 from supabase import Client
 
-from scraper.constants import TAG_NORMALIZATION_MAP
 from scraper.schemas import Character, CreatorInput, TagType
+from scraper.storage import Storage
+from scraper.tags import TagNormalizer
 
 
-def upsert_characters(
-    db: Client, characters: list[Character], site_id: str
+def _build_creator_rows(
+    characters: list[Character], site_id: str
 ) -> list[dict[str, Any]]:
-    """
-    Upsert multiple characters in a batch operation.
-
-    First upserts all creators, then upserts all characters with the correct creator_id.
-    """
-    if not characters:
-        return []
-
+    """Build the deduplicated creators payload for a page of characters."""
     # Deduplicate creators by site_unique_identifier within the same site to avoid Postgres
     # "ON CONFLICT DO UPDATE command cannot affect row a second time" errors
     # when multiple rows in the same payload target the same unique key.
@@ -56,7 +53,7 @@ def upsert_characters(
                 existing_creator.follower_count = incoming_creator.follower_count
 
     # Prepare payload for upsert with site_id included
-    creator_data_list: list[dict[str, Any]] = [
+    return [
         {
             "name": creator.name,
             "image_url": str(creator.image_url) if creator.image_url else None,
@@ -68,24 +65,71 @@ def upsert_characters(
         for creator in deduped_creators_by_identifier.values()
     ]
 
-    creators_response = (
-        db.table("creators")
-        .upsert(creator_data_list, on_conflict="site_id,site_unique_identifier")
-        .execute()
-    )
 
-    creator_site_unique_identifier_to_id = {
-        creator["site_unique_identifier"]: creator["id"]
-        for creator in creators_response.data
-    }
+class CreatorCache:
+    """
+    Creators written during one crawl, keyed by (site_id, site_unique_identifier), with
+    the ID each was given and a fingerprint of the row last written for it.
+
+    Prolific creators show up on many pages with the same data; with a cache, only new or
+    changed creators are upserted and the rest reuse the remembered ID.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, str], tuple[str, str]] = {}
+        self.creators_written = 0
+        self.creators_skipped = 0
+
+    @staticmethod
+    def _fingerprint(row: dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(row, sort_keys=True).encode()).hexdigest()
+
+    def partition(
+        self, rows: list[dict[str, Any]]
+    ) -> tuple[dict[str, str], list[dict[str, Any]]]:
+        """
+        Split creator rows into the IDs of unchanged creators, by site_unique_identifier,
+        and the rows that still need to be written.
+        """
+        known_ids: dict[str, str] = {}
+        changed_rows: list[dict[str, Any]] = []
+        for row in rows:
+            entry = self._entries.get((row["site_id"], row["site_unique_identifier"]))
+            if entry is not None and entry[1] == self._fingerprint(row):
+                known_ids[row["site_unique_identifier"]] = entry[0]
+            else:
+                changed_rows.append(row)
+        self.creators_skipped += len(known_ids)
+        return known_ids, changed_rows
+
+    def remember(
+        self, rows: list[dict[str, Any]], written: list[dict[str, Any]]
+    ) -> None:
+        """
+        Record the rows just written, given the upserted creators returned for them. Only
+        called once the write has succeeded, so failed writes are neither counted nor
+        cached.
+        """
+        ids = {creator["site_unique_identifier"]: creator["id"] for creator in written}
+        self.creators_written += len(rows)
+        for row in rows:
+            self._entries[(row["site_id"], row["site_unique_identifier"])] = (
+                ids[row["site_unique_identifier"]],
+                self._fingerprint(row),
+            )
+
 
+def _build_character_rows(
+    characters: list[Character], creator_site_unique_identifier_to_id: dict[str, str]
+) -> list[dict[str, Any]]:
+    """Build the deduplicated characters payload, given the upserted creator IDs."""
     # Deduplicate characters by URL, always taking the one that appears last
     deduped_characters_by_url: dict[str, Character] = {}
     for character in characters:
         url_str = str(character.url)
         deduped_characters_by_url[url_str] = character
 
-    characters_data = [
+    return [
         {
             "name": character.name,
             "description": character.description,
@@ -102,11 +146,87 @@ def upsert_characters(
         for character in deduped_characters_by_url.values()
     ]
 
+
+def upsert_characters(
+    db: Client,
+    characters: list[Character],
+    site_id: str,
+    creator_cache: CreatorCache | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Upsert multiple characters in a batch operation.
+
+    First upserts all creators, then upserts all characters with the correct creator_id.
+    With a `creator_cache`, creators unchanged since they were last written through it
+    are not upserted again.
+    """
+    if not characters:
+        return []
+
+    creator_rows = _build_creator_rows(characters, site_id)
+    creator_site_unique_identifier_to_id: dict[str, str] = {}
+    if creator_cache is not None:
+        creator_site_unique_identifier_to_id, creator_rows = creator_cache.partition(
+            creator_rows
+        )
+
+    if creator_rows:
+        creators_response = (
+            db.table("creators")
+            .upsert(creator_rows, on_conflict="site_id,site_unique_identifier")
+            .execute()
+        )
+        creators = cast(list[dict[str, Any]], creators_response.data)
+        if creator_cache is not None:
+            creator_cache.remember(creator_rows, creators)
+        creator_site_unique_identifier_to_id.update(
+            {creator["site_unique_identifier"]: creator["id"] for creator in creators}
+        )
+
     characters_response = (
-        db.table("characters").upsert(characters_data, on_conflict="url").execute()
+        db.table("characters")
+        .upsert(
+            _build_character_rows(characters, creator_site_unique_identifier_to_id),
+            on_conflict="url",
+        )
+        .execute()
     )
 
-    return characters_response.data
+    return cast(list[dict[str, Any]], characters_response.data)
+
+
+async def aupsert_characters(
+    db: Storage,
+    characters: list[Character],
+    site_id: str,
+    creator_cache: CreatorCache | None = None,
+) -> list[dict[str, Any]]:
+    """Async variant of `upsert_characters`."""
+    if not characters:
+        return []
+
+    creator_rows = _build_creator_rows(characters, site_id)
+    creator_site_unique_identifier_to_id: dict[str, str] = {}
+    if creator_cache is not None:
+        creator_site_unique_identifier_to_id, creator_rows = creator_cache.partition(
+            creator_rows
+        )
+
+    if creator_rows:
+        creators = await db.upsert(
+            "creators", creator_rows, on_conflict="site_id,site_unique_identifier"
+        )
+        if creator_cache is not None:
+            creator_cache.remember(creator_rows, creators)
+        creator_site_unique_identifier_to_id.update(
+            {creator["site_unique_identifier"]: creator["id"] for creator in creators}
+        )
+
+    return await db.upsert(
+        "characters",
+        _build_character_rows(characters, creator_site_unique_identifier_to_id),
+        on_conflict="url",
+    )
 
 
 def get_characters_for_tagging(
@@ -115,14 +235,15 @@ def get_characters_for_tagging(
     """
     Yield characters that have name and description but no tags, in batches.
 
-    Returns batches of character dictionaries with id, name, and description fields.
+    Returns batches of character dictionaries with id, name, description and cluster_id
+    fields.
     """
     offset = 0
 
     while True:
         all_characters = (
             client.table("characters")
-            .select("id, name, description")
+            .select("id, name, description, cluster_id")
             .not_.is_("name", "null")
             .not_.is_("description", "null")
             .filter("name", "neq", "")
@@ -131,10 +252,11 @@ def get_characters_for_tagging(
             .execute()
         )
 
-        if not all_characters.data:
+        characters = cast(list[dict[str, Any]], all_characters.data)
+        if not characters:
             break
 
-        character_ids = [char["id"] for char in all_characters.data]
+        character_ids = [char["id"] for char in characters]
 
         tagged_character_ids_response = (
             client.table("character_tags")
@@ -143,44 +265,207 @@ def get_characters_for_tagging(
             .execute()
         )
 
-        tagged_ids = {row["character_id"] for row in tagged_character_ids_response.data}
+        tagged_ids = {
+            row["character_id"]
+            for row in cast(list[dict[str, Any]], tagged_character_ids_response.data)
+        }
 
         untagged_characters = [
-            char for char in all_characters.data if char["id"] not in tagged_ids
+            char for char in characters if char["id"] not in tagged_ids
         ]
 
         if untagged_characters:
             yield untagged_characters
 
-        if len(all_characters.data) < batch_size:
+        if len(characters) < batch_size:
             break
 
         offset += batch_size
 
 
-def upsert_tags(db: Client, tag_names: list[str], tag_type: TagType) -> list[str]:
+async def aget_characters_for_tagging(
+    db: Storage, batch_size: int
+) -> AsyncGenerator[list[dict[str, Any]], None]:
+    """
+    Async variant of `get_characters_for_tagging`, yielding characters in tagging queue
+    order: highest `tagging_priority` (popularity and recency) first.
+
+    Untagged characters are read from the queue index and paged by their position in it,
+    so each batch is one indexed query instead of a page scan plus a lookup of its tags.
+    """
+    after: dict[str, Any] | None = None
+
+    while True:
+        untagged_characters = await db.rpc(
+            "characters_for_tagging",
+            {
+                "p_after_priority": after["tagging_priority"] if after else None,
+                "p_after_id": after["id"] if after else None,
+                "p_limit": batch_size,
+            },
+        )
+
+        if not untagged_characters:
+            break
+
+        yield untagged_characters
+
+        if len(untagged_characters) < batch_size:
+            break
+
+        after = untagged_characters[-1]
+
+
+async def aget_trending_characters(
+    db: Storage, site_id: str | None = None, limit: int = 50
+) -> list[dict[str, Any]]:
+    """
+    Get the characters gaining likes and chats fastest, optionally on one site, with
+    their recent `growth_per_day`. Ranked by the trending score kept on each character,
+    so no stats history is read.
+    """
+    return cast(
+        list[dict[str, Any]],
+        await db.rpc("trending_characters", {"p_site_id": site_id, "p_limit": limit}),
+    )
+
+
+async def aget_character_stat_history(
+    db: Storage, character_id: str, since: datetime | None = None
+) -> list[dict[str, Any]]:
+    """Get a character's chat, message and like counts after each change, oldest first."""
+    return cast(
+        list[dict[str, Any]],
+        await db.rpc(
+            "character_stat_history",
+            {
+                "p_character_id": character_id,
+                "p_since": since.isoformat() if since else None,
+            },
+        ),
+    )
+
+
+async def amaintain_character_stat_partitions(
+    db: Storage, months_ahead: int = 2, keep_months: int = 12
+) -> dict[str, list[str]]:
+    """
+    Create the stats history partitions for the next `months_ahead` months and drop
+    those older than `keep_months`, returning the partitions created and dropped.
+    """
+    return cast(
+        dict[str, list[str]],
+        await db.rpc(
+            "maintain_character_stat_partitions",
+            {"p_months_ahead": months_ahead, "p_keep_months": keep_months},
+        ),
+    )
+
+
+def _build_tag_rows(
+    tag_names: list[str], tag_type: TagType, normalizer: TagNormalizer | None
+) -> list[dict[str, Any]]:
+    """
+    Normalize tag names into rows for the tags table, one row per canonical name. Names
+    with nothing left after normalization are dropped.
+    """
+    normalizer = normalizer or TagNormalizer()
+    canonical_names = dict.fromkeys(normalizer.normalize(name) for name in tag_names)
+    return [{"name": name, "type": tag_type} for name in canonical_names if name]
+
+
+def upsert_tags(
+    db: Client,
+    tag_names: list[str],
+    tag_type: TagType,
+    normalizer: TagNormalizer | None = None,
+) -> list[str]:
     """
     Upsert tags to the tags table using composite uniqueness on (name, type).
 
-    Returns a list of tag IDs corresponding to the input tag names.
+    Names are mapped onto the normalizer's vocabulary (pass one built with
+    `aload_tag_normalizers` to match existing tags), so names that normalize to the same tag
+    share one ID. Returns the IDs of the distinct normalized tags.
     """
-    if not tag_names:
+    tag_rows = _build_tag_rows(tag_names, tag_type, normalizer)
+    if not tag_rows:
         return []
 
-    tag_data = []
-    for tag_name in tag_names:
-        normalized = tag_name.lower().strip()
+    response = db.table("tags").upsert(tag_rows, on_conflict="name,type").execute()
+
+    return [tag["id"] for tag in cast(list[dict[str, Any]], response.data)]
 
-        if normalized in TAG_NORMALIZATION_MAP:
-            normalized = TAG_NORMALIZATION_MAP[normalized]
-        else:
-            normalized = normalized.replace("-", " ").replace("_", " ")
 
-        tag_data.append({"name": normalized, "type": tag_type})
+async def aupsert_tags(
+    db: Storage,
+    tag_names: list[str],
+    tag_type: TagType,
+    normalizer: TagNormalizer | None = None,
+) -> list[str]:
+    """Async variant of `upsert_tags`."""
+    tag_rows = _build_tag_rows(tag_names, tag_type, normalizer)
+    if not tag_rows:
+        return []
+
+    tags = await db.upsert("tags", tag_rows, on_conflict="name,type")
 
-    response = db.table("tags").upsert(tag_data, on_conflict="name,type").execute()
+    return [tag["id"] for tag in tags]
 
-    return [tag["id"] for tag in response.data]
+
+async def aload_tag_normalizers(db: Storage) -> dict[TagType, TagNormalizer]:
+    """
+    Build one normalizer per tag type, seeded with every existing tag name, most-used
+    first so the most common spelling of a tag stays canonical.
+    """
+    normalizers = {tag_type: TagNormalizer() for tag_type in TagType}
+    for tag in await aget_tag_usage(db):
+        normalizers[TagType(tag["type"])].add(tag["name"])
+    return normalizers
+
+
+async def aget_tag_usage(db: Storage) -> list[dict[str, Any]]:
+    """Get every tag with its character count, most-used first."""
+    return cast(list[dict[str, Any]], await db.rpc("tag_usage_counts", {}))
+
+
+async def aget_tag_facets(
+    db: Storage,
+    site_id: str | None = None,
+    tag_type: int | None = None,
+    min_count: int = 1,
+    limit: int | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Get tags with at least `min_count` characters, most-used first, counted on one site
+    or across all of them. Reads the maintained counts, so it costs one row per tag.
+    """
+    return cast(
+        list[dict[str, Any]],
+        await db.rpc(
+            "tag_facets",
+            {
+                "p_site_id": site_id,
+                "p_type": tag_type,
+                "p_min_count": min_count,
+                "p_limit": limit,
+            },
+        ),
+    )
+
+
+async def arebuild_tag_facet_counts(db: Storage) -> dict[str, int]:
+    """Recount the tag facet counts from character_tags, returning how many rows drifted."""
+    return cast(dict[str, int], await db.rpc("rebuild_tag_facet_counts", {}))
+
+
+async def amerge_tags(
+    db: Storage, merges: list[dict[str, str]], renames: list[dict[str, str]]
+) -> None:
+    """
+    Move characters from each `source_id` tag onto its `target_id` tag and delete the
+    source, then rename tags given as `{"id", "name"}`.
+    """
+    await db.rpc("merge_tags", {"p_merges": merges, "p_renames": renames})
 
 
 def tag_character(db: Client, character_id: str, tag_ids: list[str]) -> None:
@@ -197,3 +482,27 @@ def tag_character(db: Client, character_id: str, tag_ids: list[str]) -> None:
     db.table("character_tags").upsert(
         character_tag_data, on_conflict="character_id,tag_id"
     ).execute()
+
+
+async def atag_character(db: Storage, character_id: str, tag_ids: list[str]) -> None:
+    """Async variant of `tag_character`."""
+    if not tag_ids:
+        return
+
+    character_tag_data = [
+        {"character_id": character_id, "tag_id": tag_id} for tag_id in tag_ids
+    ]
+
+    await db.upsert(
+        "character_tags", character_tag_data, on_conflict="character_id,tag_id"
+    )
+
+
+async def amark_characters_tag_attempted(db: Storage, character_ids: list[str]) -> None:
+    """
+    Take characters the model found no usable tags for out of the tagging queue, along
+    with the rest of their clusters.
+    """
+    if not character_ids:
+        return
+    await db.rpc("mark_characters_tag_attempted", {"p_character_ids": character_ids})
@@ -0,0 +1,64 @@
+from typing import Any, cast
+
+from scraper.storage import Filter, Storage
+
+
+async def aget_unsigned_characters(
+    db: Storage, batch_size: int
+) -> list[dict[str, Any]]:
+    """Get characters whose description has no MinHash signature yet."""
+    return await db.select(
+        "characters",
+        "id, description",
+        filters=[Filter("minhash", "is_null")],
+        limit=batch_size,
+    )
+
+
+async def aget_minhash_candidates(
+    db: Storage, buckets: list[tuple[int, int]]
+) -> list[dict[str, Any]]:
+    """Get signed characters (id, cluster_id, hex minhash) sharing any LSH bucket."""
+    if not buckets:
+        return []
+
+    candidates = await db.rpc(
+        "minhash_candidates",
+        {"p_buckets": [{"band": band, "bucket": bucket} for band, bucket in buckets]},
+    )
+    return cast(list[dict[str, Any]], candidates)
+
+
+async def asave_minhash_clusters(
+    db: Storage,
+    characters: list[dict[str, Any]],
+    cluster_merges: dict[str, str],
+) -> None:
+    """
+    Store signatures, buckets and clusters for characters given as
+    `{"id", "minhash", "cluster_id", "buckets": [{"band", "bucket"}]}`, and move every
+    member of an absorbed cluster into the cluster that absorbed it.
+    """
+    await db.rpc(
+        "save_minhash_clusters",
+        {
+            "p_characters": characters,
+            "p_cluster_merges": [
+                {"from_cluster_id": from_cluster_id, "to_cluster_id": to_cluster_id}
+                for from_cluster_id, to_cluster_id in cluster_merges.items()
+            ],
+        },
+    )
+
+
+async def apropagate_cluster_tags(
+    db: Storage, character_ids: list[str] | None = None
+) -> int:
+    """
+    Copy tags from tagged cluster members to untagged ones, optionally only from the given
+    characters. Returns the number of character_tags rows added.
+    """
+    inserted = await db.rpc(
+        "propagate_cluster_tags", {"p_character_ids": character_ids}
+    )
+    return cast(int, inserted)
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from scraper.images import ImageSource
+from scraper.storage import Storage
+
+
+async def aget_image_sources_to_mirror(
+    db: Storage, limit: int, after: str | None = None
+) -> list[ImageSource]:
+    """
+    Get avatars that were never mirrored, along with their stored validators, in URL
+    order after `after`. Pass the last URL of a batch to get the next one.
+    """
+    rows = await db.rpc("image_sources_to_mirror", {"p_limit": limit, "p_after": after})
+    return [ImageSource(**row) for row in rows]
+
+
+async def aget_image_sources_to_revalidate(
+    db: Storage, limit: int, revalidate_before: datetime
+) -> list[ImageSource]:
+    """Get mirrors that were last fetched before `revalidate_before`, oldest first."""
+    rows = await db.rpc(
+        "image_sources_to_revalidate",
+        {"p_limit": limit, "p_revalidate_before": revalidate_before.isoformat()},
+    )
+    return [ImageSource(**row) for row in rows]
+
+
+async def asave_image_sources(db: Storage, sources: list[ImageSource]) -> None:
+    """
+    Store the validators for each source, then point every character and creator using a
+    mirrored source at its mirror.
+    """
+    if not sources:
+        return
+
+    await db.upsert(
+        "image_sources",
+        [source.model_dump(mode="json") for source in sources],
+        on_conflict="source_url",
+    )
+
+    mirrors = [
+        {"source_url": source.source_url, "mirrored_url": source.mirrored_url}
+        for source in sources
+        if source.mirrored_url
+    ]
+    if mirrors:
+        await db.rpc("apply_image_mirrors", {"p_mirrors": mirrors})
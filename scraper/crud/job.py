@@ -0,0 +1,79 @@
+from typing import Any, cast
+
+from scraper.schemas import Job, JobOutcome
+from scraper.storage import Storage
+
+
+async def aenqueue_jobs(db: Storage, kind: str, jobs: list[dict[str, Any]]) -> int:
+    """
+    Queue jobs given as `{"key", "payload", "priority"}`. Jobs already pending or running
+    under the same key are left as they are. Returns how many were queued.
+    """
+    if not jobs:
+        return 0
+    return cast(int, await db.rpc("enqueue_jobs", {"p_kind": kind, "p_jobs": jobs}))
+
+
+async def aclaim_jobs(
+    db: Storage, kind: str, worker_id: str, limit: int, lease_seconds: int
+) -> list[Job]:
+    """Lease up to `limit` jobs to the worker, highest priority first."""
+    jobs = await db.rpc(
+        "claim_jobs",
+        {
+            "p_kind": kind,
+            "p_worker": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+        },
+    )
+    return [Job(**job) for job in jobs]
+
+
+async def aheartbeat_jobs(
+    db: Storage, job_ids: list[str], worker_id: str, lease_seconds: int
+) -> list[str]:
+    """Renew the worker's leases. Returns the IDs of the jobs it still holds."""
+    if not job_ids:
+        return []
+    return cast(
+        list[str],
+        await db.rpc(
+            "heartbeat_jobs",
+            {
+                "p_job_ids": job_ids,
+                "p_worker": worker_id,
+                "p_lease_seconds": lease_seconds,
+            },
+        ),
+    )
+
+
+async def afinish_jobs(
+    db: Storage,
+    job_ids: list[str],
+    worker_id: str,
+    outcome: JobOutcome,
+    error: str | None = None,
+) -> None:
+    """
+    Give up the worker's leases: "done" completes the jobs, "failed" retries them until
+    they run out of attempts, "abandoned" fails them without a retry (for work that is
+    retried on its own schedule) and "released" puts them back without using an attempt.
+    """
+    if not job_ids:
+        return
+    await db.rpc(
+        "finish_jobs",
+        {
+            "p_job_ids": job_ids,
+            "p_worker": worker_id,
+            "p_outcome": outcome,
+            "p_error": error,
+        },
+    )
+
+
+async def aget_job_queue_depth(db: Storage) -> list[dict[str, Any]]:
+    """Job counts by kind and status."""
+    return cast(list[dict[str, Any]], await db.rpc("job_queue_depth", {}))
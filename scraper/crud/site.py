@@ -1,9 +1,58 @@
+from datetime import datetime, timezone
+from typing import Any, cast
+
 from supabase import Client
 
-from scraper.schemas import Site
+from scraper.schemas import CrawlSchedule, PageTuning, Site
+from scraper.storage import Filter, Storage
 
 
 def get_sites(client: Client) -> list[Site]:
     """Get all enabled sites from the database."""
     response = client.table("sites").select("*").eq("is_enabled", True).execute()
-    return [Site(**site) for site in response.data]
+    return [Site(**site) for site in cast(list[dict[str, Any]], response.data)]
+
+
+async def aget_sites(db: Storage) -> list[Site]:
+    """Async variant of `get_sites`."""
+    sites = await db.select("sites", filters=[Filter("is_enabled", "eq", True)])
+    return [Site(**site) for site in sites]
+
+
+async def aget_page_tuning(db: Storage, site_id: str) -> PageTuning | None:
+    """Get the page size and timeout tuned for a site's crawls, if it has been crawled."""
+    rows = await db.select(
+        "site_page_tuning", filters=[Filter("site_id", "eq", site_id)], limit=1
+    )
+    return PageTuning(**rows[0]) if rows else None
+
+
+async def asave_page_tuning(db: Storage, tuning: PageTuning) -> None:
+    await db.upsert(
+        "site_page_tuning",
+        [
+            {
+                **tuning.model_dump(mode="json"),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+        ],
+        on_conflict="site_id",
+    )
+
+
+async def aget_crawl_schedules(db: Storage) -> dict[str, CrawlSchedule]:
+    """Get every site's crawl schedule, by site ID."""
+    rows = await db.select("site_crawl_schedule")
+    return {row["site_id"]: CrawlSchedule(**row) for row in rows}
+
+
+async def asave_crawl_schedules(db: Storage, schedules: list[CrawlSchedule]) -> None:
+    updated_at = datetime.now(timezone.utc).isoformat()
+    await db.upsert(
+        "site_crawl_schedule",
+        [
+            {**schedule.model_dump(mode="json"), "updated_at": updated_at}
+            for schedule in schedules
+        ],
+        on_conflict="site_id",
+    )
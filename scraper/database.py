@@ -1,10 +1,16 @@
 import os
 
-from supabase import create_client, Client
+from psycopg import Connection
+from supabase import acreate_client, create_client, AsyncClient, Client
 
+from scraper.storage import SQLiteStorage, Storage, SupabaseStorage
 
-def create_db_client() -> Client:
-    """Create and return a Supabase client using environment variables."""
+# Shared by every function invocation that runs in the same container
+_async_db_client: AsyncClient | None = None
+_storage: Storage | None = None
+
+
+def _get_supabase_credentials() -> tuple[str, str]:
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
@@ -13,4 +19,51 @@ def create_db_client() -> Client:
             f"Unset environment variables: {'SUPABASE_URL ' if not supabase_url else ' '}{'SUPABASE_SERVICE_ROLE_KEY' if not supabase_key else ''}"
         )
 
-    return create_client(supabase_url, supabase_key)
+    return supabase_url, supabase_key
+
+
+def create_db_client() -> Client:
+    """Create and return a Supabase client using environment variables."""
+    return create_client(*_get_supabase_credentials())
+
+
+async def get_async_db_client() -> AsyncClient:
+    """
+    Return the container-wide async Supabase client, creating it on first use.
+
+    Reusing one client keeps its HTTP connection pool warm across invocations.
+    """
+    global _async_db_client
+    if _async_db_client is None:
+        _async_db_client = await acreate_client(*_get_supabase_credentials())
+    return _async_db_client
+
+
+def create_pg_connection() -> Connection:
+    """
+    Open a direct Postgres connection using DATABASE_URL, for the COPY ingest path.
+
+    Autocommit is enabled so that each `conn.transaction()` block is its own transaction.
+    """
+    database_url = os.getenv("DATABASE_URL")
+
+    if not database_url:
+        raise EnvironmentError("Unset environment variables: DATABASE_URL")
+
+    return Connection.connect(database_url, autocommit=True)
+
+
+async def get_storage() -> Storage:
+    """
+    Return the container-wide storage backend used by the async CRUD functions.
+
+    Set STORAGE_BACKEND=sqlite to use a local SQLite database at SQLITE_PATH (in memory
+    if unset) instead of Supabase.
+    """
+    global _storage
+    if _storage is None:
+        if os.getenv("STORAGE_BACKEND", "supabase") == "sqlite":
+            _storage = SQLiteStorage(os.getenv("SQLITE_PATH", ":memory:"))
+        else:
+            _storage = SupabaseStorage(await get_async_db_client())
+    return _storage
@@ -0,0 +1,178 @@
+import hashlib
+import re
+from collections.abc import Iterable
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+MINHASH_PERMUTATIONS = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard similarity almost always share a bucket
+LSH_BANDS = 16
+LSH_ROWS_PER_BAND = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_WORDS = 3
+# Estimated Jaccard similarity above which two descriptions are the same character
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+# Fixed seed: signatures are stored and must stay comparable across runs
+_permutation_rng = np.random.RandomState(1)
+PERMUTATION_A = _permutation_rng.randint(
+    1, int(MERSENNE_PRIME), MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+PERMUTATION_B = _permutation_rng.randint(
+    0, int(MERSENNE_PRIME), MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+
+Signature = npt.NDArray[np.uint32]
+
+MARKUP = re.compile(r"<[^>]+>|\{\{[^}]*\}\}|https?://\S+|[*_#>`~|\[\]()]")
+NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_description(description: str) -> str:
+    """Drop markup, template macros, links and punctuation so forks compare on content."""
+    text = MARKUP.sub(" ", description.lower())
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def _stable_hash(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def shingle_hashes(text: str) -> npt.NDArray[np.uint64]:
+    """Hashes of the distinct word n-grams of normalized text."""
+    words = text.split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    shingles = {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+    }
+    return np.array(
+        [_stable_hash(shingle.encode()) for shingle in shingles], dtype=np.uint64
+    )
+
+
+def minhash_signature(description: str) -> Signature | None:
+    """MinHash signature of a description, or None if there is no text to compare."""
+    hashes = shingle_hashes(normalize_description(description))
+    if not hashes.size:
+        return None
+    # Universal hashing (a * x + b) mod p; uint64 overflow in the product is intentional
+    permuted = np.bitwise_and(
+        (np.outer(hashes, PERMUTATION_A) + PERMUTATION_B) % MERSENNE_PRIME, MAX_HASH
+    )
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def lsh_buckets(signature: Signature) -> list[tuple[int, int]]:
+    """(band, bucket) keys for the signature; near-duplicates share at least one."""
+    return [
+        (
+            band,
+            # Signed, so it fits a Postgres bigint
+            int.from_bytes(
+                hashlib.blake2b(
+                    signature[
+                        band * LSH_ROWS_PER_BAND : (band + 1) * LSH_ROWS_PER_BAND
+                    ].tobytes(),
+                    digest_size=8,
+                ).digest(),
+                "little",
+                signed=True,
+            ),
+        )
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate_similarity(a: Signature, b: Signature) -> float:
+    return float(np.mean(a == b))
+
+
+def signature_to_hex(signature: Signature) -> str:
+    """Encode a signature as a Postgres bytea literal."""
+    return "\\x" + signature.astype("<u4").tobytes().hex()
+
+
+def signature_from_hex(value: str) -> Signature:
+    return np.frombuffer(bytes.fromhex(value.removeprefix("\\x")), dtype="<u4").astype(
+        np.uint32
+    )
+
+
+def cluster_near_duplicates(
+    signatures: dict[str, Signature], indexed: Iterable[dict[str, Any]]
+) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Assign clusters to newly signed characters.
+
+    `signatures` holds the new characters by ID. `indexed` holds already clustered
+    characters that share an LSH bucket with any of them, as dicts with id, cluster_id and
+    a decoded `signature`. Candidate pairs from shared buckets are confirmed with the
+    estimated similarity, and connected characters form one cluster.
+
+    Returns the cluster ID for each new character, and existing cluster IDs that were
+    absorbed into another cluster, mapped to the cluster that absorbed them.
+    """
+    parent: dict[str, str] = {}
+
+    def find(node: str) -> str:
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(a: str, b: str) -> None:
+        parent[find(a)] = find(b)
+
+    all_signatures = dict(signatures)
+    cluster_by_id: dict[str, str] = {}
+    first_member_by_cluster: dict[str, str] = {}
+    for character in indexed:
+        all_signatures[character["id"]] = character["signature"]
+        cluster_by_id[character["id"]] = character["cluster_id"]
+        # Already clustered characters stay together
+        first_member = first_member_by_cluster.setdefault(
+            character["cluster_id"], character["id"]
+        )
+        union(character["id"], first_member)
+
+    members_by_bucket: dict[tuple[int, int], list[str]] = {}
+    for character_id, signature in all_signatures.items():
+        for bucket in lsh_buckets(signature):
+            members_by_bucket.setdefault(bucket, []).append(character_id)
+
+    for members in members_by_bucket.values():
+        new_members = [member for member in members if member in signatures]
+        for new_member in new_members:
+            for other in members:
+                if other == new_member or find(other) == find(new_member):
+                    continue
+                similarity = estimate_similarity(
+                    all_signatures[new_member], all_signatures[other]
+                )
+                if similarity >= NEAR_DUPLICATE_THRESHOLD:
+                    union(new_member, other)
+
+    members_by_root: dict[str, list[str]] = {}
+    for character_id in all_signatures:
+        members_by_root.setdefault(find(character_id), []).append(character_id)
+
+    assignments: dict[str, str] = {}
+    merges: dict[str, str] = {}
+    for members in members_by_root.values():
+        existing_clusters = sorted(
+            {cluster_by_id[m] for m in members if m in cluster_by_id}
+        )
+        # Reuse an existing cluster ID (the smallest, for determinism), or start a new one
+        cluster_id = existing_clusters[0] if existing_clusters else min(members)
+        for member in members:
+            if member in signatures:
+                assignments[member] = cluster_id
+        for absorbed in existing_clusters[1:]:
+            merges[absorbed] = cluster_id
+
+    return assignments, merges
@@ -0,0 +1,127 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from typing import Any, NamedTuple
+
+import modal
+
+
+class FunctionLimits(NamedTuple):
+    """Limits of a fanned-out function, applied by Modal and by `LocalExecutor` alike."""
+
+    timeout: int
+    # Most calls running at once; None leaves it to the executor
+    max_concurrency: int | None = None
+
+    def modal_options(self) -> dict[str, Any]:
+        """Keyword arguments for `app.function`."""
+        if self.max_concurrency is None:
+            return {"timeout": self.timeout}
+        return {"timeout": self.timeout, "max_containers": self.max_concurrency}
+
+
+class CallHandle(ABC):
+    @abstractmethod
+    async def get(self) -> Any:
+        """Wait for the call and return its result, raising its exception if it failed."""
+        ...
+
+
+class Executor(ABC):
+    """Runs the pipeline's fan-outs: Modal function calls spawned from other functions."""
+
+    @abstractmethod
+    async def spawn(
+        self, function: modal.Function, *args: Any, limits: FunctionLimits
+    ) -> CallHandle: ...
+
+    async def join(self) -> None:
+        """Wait for every spawned call that runs in this process."""
+        return None
+
+
+class ModalCallHandle(CallHandle):
+    def __init__(self, call: modal.FunctionCall):
+        self.call = call
+
+    async def get(self) -> Any:
+        return await self.call.get.aio()
+
+
+class ModalExecutor(Executor):
+    """Spawns each call in its own Modal container; limits come from `app.function`."""
+
+    async def spawn(
+        self, function: modal.Function, *args: Any, limits: FunctionLimits
+    ) -> CallHandle:
+        return ModalCallHandle(await function.spawn.aio(*args))
+
+
+class LocalCallHandle(CallHandle):
+    def __init__(self, task: asyncio.Task[Any]):
+        self.task = task
+
+    async def get(self) -> Any:
+        return await self.task
+
+
+class LocalExecutor(Executor):
+    """
+    Runs calls as tasks on the current event loop, so the whole pipeline fits in one
+    process. Each function gets its own concurrency limit (`limits.max_concurrency`, or
+    `default_max_concurrency`), and calls are cancelled once they exceed `limits.timeout`.
+    """
+
+    def __init__(self, default_max_concurrency: int = 16):
+        self.default_max_concurrency = default_max_concurrency
+        self._semaphores: dict[modal.Function, asyncio.Semaphore] = {}
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    async def spawn(
+        self, function: modal.Function, *args: Any, limits: FunctionLimits
+    ) -> CallHandle:
+        task = asyncio.create_task(
+            self._run(function, args, limits), name=repr(function)
+        )
+        self._tasks.add(task)
+        return LocalCallHandle(task)
+
+    async def _run(
+        self, function: modal.Function, args: tuple[Any, ...], limits: FunctionLimits
+    ) -> Any:
+        semaphore = self._semaphores.setdefault(
+            function,
+            asyncio.Semaphore(limits.max_concurrency or self.default_max_concurrency),
+        )
+        async with semaphore:
+            return await asyncio.wait_for(function.local(*args), limits.timeout)
+
+    async def join(self) -> None:
+        # Calls can spawn more calls, so keep going until nothing is left
+        while self._tasks:
+            tasks = list(self._tasks)
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            self._tasks.difference_update(tasks)
+            for task, result in zip(tasks, results):
+                if isinstance(result, BaseException):
+                    print(f"Local call to {task.get_name()} failed: {result!r}")
+
+
+# Shared by every function invocation that runs in the same container or process
+_executor: Executor | None = None
+
+
+def get_executor() -> Executor:
+    """
+    Return the process-wide executor: Modal by default, or `LocalExecutor` with
+    EXECUTOR_BACKEND=local (its concurrency from LOCAL_EXECUTOR_CONCURRENCY).
+    """
+    global _executor
+    if _executor is None:
+        if os.getenv("EXECUTOR_BACKEND", "modal") == "local":
+            _executor = LocalExecutor(
+                int(os.getenv("LOCAL_EXECUTOR_CONCURRENCY", "16"))
+            )
+        else:
+            _executor = ModalExecutor()
+    return _executor
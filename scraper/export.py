@@ -0,0 +1,128 @@
+import gzip
+import json
+import random
+import zlib
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from scraper.schemas import Character
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class NdjsonChunkWriter:
+    """
+    Write characters as gzip-compressed NDJSON, rotating to a new file every `chunk_size`
+    rows, so memory use stays constant however large the crawl is.
+
+    Closing writes a manifest with per-chunk counts, totals and a small reservoir sample,
+    which is enough to inspect an export without reading the chunks. Use it as a context
+    manager, so the open chunk is closed even if the export fails.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        chunk_size: int = 5000,
+        sample_size: int = 5,
+        metadata: dict[str, Any] | None = None,
+    ):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.metadata = metadata or {}
+        self.chunks: list[dict[str, Any]] = []
+        self.total = 0
+        self.sample: list[dict[str, Any]] = []
+        self._file: gzip.GzipFile | None = None
+        # Holds the open chunk, so it's closed however the export ends
+        self._chunk_stack = ExitStack()
+        self._rng = random.Random(0)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exception_type: type[BaseException] | None,
+        exception: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        # Closed without a manifest when the export failed before `close`
+        self._chunk_stack.close()
+        self._file = None
+
+    def write(self, characters: Iterable[Character]) -> None:
+        for character in characters:
+            file = self._file
+            if file is None or self.chunks[-1]["count"] >= self.chunk_size:
+                file = self._open_next_chunk()
+
+            row = character.model_dump(mode="json")
+            file.write(json.dumps(row, ensure_ascii=False).encode() + b"\n")
+            self.chunks[-1]["count"] += 1
+            self.total += 1
+
+            # Reservoir sampling keeps a uniform sample in constant memory
+            if len(self.sample) < self.sample_size:
+                self.sample.append(row)
+            else:
+                index = self._rng.randrange(self.total)
+                if index < self.sample_size:
+                    self.sample[index] = row
+
+    def close(self) -> dict[str, Any]:
+        """Finish the last chunk and write the manifest. Returns the manifest."""
+        self._close_chunk()
+        manifest = {
+            **self.metadata,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "total_characters": self.total,
+            "chunks": self.chunks,
+            "sample": self.sample,
+        }
+        (self.directory / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2))
+        return manifest
+
+    def _open_next_chunk(self) -> gzip.GzipFile:
+        self._close_chunk()
+        filename = f"part-{len(self.chunks):05d}.ndjson.gz"
+        file = self._chunk_stack.enter_context(
+            gzip.GzipFile(self.directory / filename, "wb")
+        )
+        self._file = file
+        self.chunks.append({"filename": filename, "count": 0, "bytes": 0})
+        return file
+
+    def _close_chunk(self) -> None:
+        if self._file is None:
+            return
+        self._chunk_stack.close()
+        self._file = None
+        chunk = self.chunks[-1]
+        chunk["bytes"] = (self.directory / chunk["filename"]).stat().st_size
+
+
+def iter_ndjson_gzip_lines(
+    compressed_chunks: Iterable[bytes], limit: int | None = None
+) -> Iterator[dict[str, Any]]:
+    """
+    Decode rows from a gzip NDJSON byte stream as it arrives, stopping after `limit` rows
+    without consuming the rest of the stream.
+    """
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    buffer = b""
+    emitted = 0
+    for compressed in compressed_chunks:
+        buffer += decompressor.decompress(compressed)
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if limit is not None and emitted >= limit:
+                return
+            yield json.loads(line)
+            emitted += 1
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, cast
+
+from httpx import AsyncBaseTransport, AsyncByteStream, Headers, Request, Response
+from pydantic import BaseModel, computed_field
+
+# Extension set on every cached GET response, e.g. `response.extensions["http_cache"]`
+CACHE_EXTENSION = "http_cache"
+# Annotations attached to the cached entry with `HttpResponseCache.annotate`
+ANNOTATIONS_EXTENSION = "http_cache_annotations"
+# Values of the extension
+CACHE_MISS = "miss"
+CACHE_NOT_MODIFIED = "not_modified"
+CACHE_UNCHANGED = "unchanged"
+CACHE_CHANGED = "changed"
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class HttpCacheStats(BaseModel):
+    requests: int = 0
+    # No cached copy to revalidate against
+    misses: int = 0
+    # Upstream answered 304 Not Modified to a conditional request
+    not_modified: int = 0
+    # Downloaded in full, but the body hashes to the cached copy
+    unchanged: int = 0
+    changed: int = 0
+    evicted: int = 0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def hit_rate(self) -> float:
+        if not self.requests:
+            return 0.0
+        return round((self.not_modified + self.unchanged) / self.requests, 4)
+
+
+class HttpResponseCache:
+    """
+    On-disk store of GET responses with their validators, bounded by `max_bytes`.
+
+    Each entry is a body file plus a JSON file with headers, ETag/Last-Modified, a hash of
+    the decoded body, when it was last used and any annotations attached by the caller.
+    The least recently used entries are evicted once the bodies exceed `max_bytes`.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.stats = HttpCacheStats()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # key -> (body size, last used), loaded once so eviction doesn't rescan the disk
+        self._index: dict[str, tuple[int, float]] = {}
+        for meta_path in self.directory.glob("*.json"):
+            meta = json.loads(meta_path.read_text())
+            self._index[meta_path.stem] = (meta["size"], meta["last_used"])
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def load(self, key: str) -> tuple[dict[str, Any], bytes] | None:
+        if key not in self._index:
+            return None
+        meta = json.loads((self.directory / f"{key}.json").read_text())
+        return meta, (self.directory / f"{key}.body").read_bytes()
+
+    def save(self, key: str, meta: dict[str, Any], body: bytes | None = None) -> None:
+        """Write an entry's metadata, and its body if given, marking it as just used."""
+        meta["last_used"] = time.time()
+        if body is not None:
+            (self.directory / f"{key}.body").write_bytes(body)
+            meta["size"] = len(body)
+        (self.directory / f"{key}.json").write_text(json.dumps(meta))
+        self._index[key] = (meta["size"], meta["last_used"])
+        if body is not None:
+            self._evict()
+
+    def annotate(self, url: str, content_hash: str, **annotations: Any) -> None:
+        """
+        Attach values to the cached entry of a URL, returned on later requests. Nothing is
+        attached if the entry no longer holds the body hashing to `content_hash`.
+        """
+        key = self.key(url)
+        entry = self.load(key)
+        if entry is None or entry[0]["content_hash"] != content_hash:
+            return
+        meta, _ = entry
+        meta["annotations"] = {**meta.get("annotations", {}), **annotations}
+        self.save(key, meta)
+
+    def _evict(self) -> None:
+        total = sum(size for size, _ in self._index.values())
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            (self.directory / f"{key}.body").unlink(missing_ok=True)
+            (self.directory / f"{key}.json").unlink(missing_ok=True)
+            del self._index[key]
+            total -= size
+            self.stats.evicted += 1
+
+
+class CachingTransport(AsyncBaseTransport):
+    """
+    Wraps a transport so GET requests revalidate against an `HttpResponseCache`.
+
+    Requests for cached URLs are sent with If-None-Match/If-Modified-Since. A 304 is
+    answered from the cache as a 200, and every GET response carries whether it is new,
+    changed, unchanged or not modified in `response.extensions["http_cache"]`, together
+    with the entry's annotations under `response.extensions["http_cache_annotations"]`.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport, cache: HttpResponseCache):
+        self.transport = transport
+        self.cache = cache
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        self.cache.stats.requests += 1
+        key = self.cache.key(str(request.url))
+        entry = self.cache.load(key)
+        if entry is not None:
+            meta, _ = entry
+            if meta["etag"]:
+                request.headers["if-none-match"] = meta["etag"]
+            if meta["last_modified"]:
+                request.headers["if-modified-since"] = meta["last_modified"]
+
+        response = await self.transport.handle_async_request(request)
+        # Raw (still content-encoded) bytes, so the cached copy can be replayed as-is
+        stream = cast(AsyncByteStream, response.stream)
+        try:
+            raw_body = b"".join([chunk async for chunk in stream])
+        finally:
+            await stream.aclose()
+
+        if entry is not None and response.status_code == 304:
+            meta, cached_body = entry
+            self.cache.stats.not_modified += 1
+            self.cache.save(key, meta)
+            return self._replay(request, meta, cached_body, CACHE_NOT_MODIFIED)
+
+        if response.status_code != 200:
+            return Response(
+                response.status_code,
+                headers=response.headers,
+                content=raw_body,
+                request=request,
+                extensions=response.extensions,
+            )
+
+        content_hash = hashlib.sha256(
+            Response(200, headers=response.headers, content=raw_body).read()
+        ).hexdigest()
+        if entry is None:
+            status = CACHE_MISS
+            self.cache.stats.misses += 1
+            annotations = {}
+        elif entry[0]["content_hash"] == content_hash:
+            status = CACHE_UNCHANGED
+            self.cache.stats.unchanged += 1
+            annotations = entry[0].get("annotations", {})
+        else:
+            status = CACHE_CHANGED
+            self.cache.stats.changed += 1
+            # Annotations describe the old content
+            annotations = {}
+
+        meta = {
+            "url": str(request.url),
+            "headers": list(response.headers.multi_items()),
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_hash": content_hash,
+            "annotations": annotations,
+        }
+        self.cache.save(key, meta, raw_body)
+        return self._replay(request, meta, raw_body, status)
+
+    def _replay(
+        self, request: Request, meta: dict[str, Any], body: bytes, status: str
+    ) -> Response:
+        return Response(
+            200,
+            headers=Headers(meta["headers"]),
+            content=body,
+            request=request,
+            extensions={
+                CACHE_EXTENSION: status,
+                ANNOTATIONS_EXTENSION: meta.get("annotations", {}),
+            },
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
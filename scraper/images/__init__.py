@@ -0,0 +1,17 @@
+from .pipeline import ImageSource, MirrorStats, mirror_images
+from .storage import (
+    ImageStore,
+    LocalDirectoryStore,
+    SupabaseImageStore,
+    create_image_store,
+)
+
+__all__ = [
+    "ImageSource",
+    "MirrorStats",
+    "mirror_images",
+    "ImageStore",
+    "LocalDirectoryStore",
+    "SupabaseImageStore",
+    "create_image_store",
+]
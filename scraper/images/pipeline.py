@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from io import BytesIO
+
+from httpx import AsyncClient, HTTPError
+from PIL import Image, ImageOps
+from pydantic import BaseModel
+
+from scraper.images.storage import ImageStore
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_CONTENT_TYPE = "image/webp"
+
+
+class ImageSource(BaseModel):
+    """
+    A remote image and what we knew about it the last time it was fetched.
+
+    The validators (etag, last_modified) and content_hash let unchanged images be skipped.
+    """
+
+    source_url: str
+    etag: str | None = None
+    last_modified: str | None = None
+    content_hash: str | None = None
+    mirrored_url: str | None = None
+    fetched_at: datetime | None = None
+    # Consecutive failed fetches; sources that keep failing are eventually skipped
+    failure_count: int = 0
+
+
+class MirrorStats(BaseModel):
+    requested: int = 0
+    # Upstream answered 304 Not Modified
+    not_modified: int = 0
+    downloaded: int = 0
+    # Downloaded, but the bytes hash to what we already mirrored
+    unchanged: int = 0
+    # New content whose thumbnail already existed in the store
+    deduplicated: int = 0
+    thumbnails_created: int = 0
+    failed: int = 0
+
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_SIZE) -> bytes:
+    """
+    Center-crop and resize an image into a square WebP thumbnail.
+
+    CPU-bound, so it runs in a process pool rather than on the event loop.
+    """
+    with Image.open(BytesIO(data)) as image:
+        oriented = ImageOps.exif_transpose(image)
+        thumbnail = ImageOps.fit(
+            oriented.convert("RGBA"), (size, size), Image.Resampling.LANCZOS
+        )
+    output = BytesIO()
+    thumbnail.save(output, format="WEBP", quality=80)
+    return output.getvalue()
+
+
+async def mirror_images(
+    http_client: AsyncClient,
+    store: ImageStore,
+    sources: list[ImageSource],
+    process_pool: Executor,
+    concurrency: int = 16,
+) -> tuple[list[ImageSource], MirrorStats]:
+    """
+    Download, thumbnail and store a batch of remote images.
+
+    Requests are conditional on the validators from the previous fetch, and thumbnails are
+    keyed by the SHA-256 of the original bytes, so an image is only processed when its
+    content actually changed and identical avatars are only stored once.
+
+    Returns the updated sources and counters for the batch.
+    """
+    stats = MirrorStats(requested=len(sources))
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    # One thumbnail task per content hash, so concurrent duplicates share the work
+    thumbnails_by_hash: dict[str, asyncio.Task[str]] = {}
+
+    async def store_thumbnail(content_hash: str, data: bytes) -> str:
+        key = f"{content_hash[:2]}/{content_hash}.webp"
+        if await store.exists(key):
+            stats.deduplicated += 1
+        else:
+            thumbnail = await loop.run_in_executor(process_pool, make_thumbnail, data)
+            await store.put(key, thumbnail, THUMBNAIL_CONTENT_TYPE)
+            stats.thumbnails_created += 1
+        return await store.public_url(key)
+
+    def failed(source: ImageSource) -> ImageSource:
+        stats.failed += 1
+        return source.model_copy(
+            update={
+                "failure_count": source.failure_count + 1,
+                "fetched_at": datetime.now(timezone.utc),
+            }
+        )
+
+    async def mirror(source: ImageSource) -> ImageSource:
+        headers: dict[str, str] = {}
+        if source.mirrored_url and source.etag:
+            headers["if-none-match"] = source.etag
+        if source.mirrored_url and source.last_modified:
+            headers["if-modified-since"] = source.last_modified
+
+        async with semaphore:
+            try:
+                response = await http_client.get(source.source_url, headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except HTTPError as e:
+                print(f"Failed to download image {source.source_url}: {e}")
+                return failed(source)
+
+        fetched_at = datetime.now(timezone.utc)
+        if response.status_code == 304:
+            stats.not_modified += 1
+            return source.model_copy(
+                update={"fetched_at": fetched_at, "failure_count": 0}
+            )
+
+        stats.downloaded += 1
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        validators = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_hash": content_hash,
+            "fetched_at": fetched_at,
+            "failure_count": 0,
+        }
+        if content_hash == source.content_hash and source.mirrored_url:
+            stats.unchanged += 1
+            return source.model_copy(update=validators)
+
+        if content_hash not in thumbnails_by_hash:
+            thumbnails_by_hash[content_hash] = asyncio.create_task(
+                store_thumbnail(content_hash, response.content)
+            )
+        mirrored_url = await thumbnails_by_hash[content_hash]
+        return source.model_copy(update={**validators, "mirrored_url": mirrored_url})
+
+    # Anything else that goes wrong with a source, like an unreadable or truncated image,
+    # a decompression bomb or a failed upload, fails only that source, so a bad image
+    # can't hold up the rest of its batch on every run
+    results = await asyncio.gather(
+        *(mirror(source) for source in sources), return_exceptions=True
+    )
+    mirrored: list[ImageSource] = []
+    for source, result in zip(sources, results):
+        if isinstance(result, ImageSource):
+            mirrored.append(result)
+        elif isinstance(result, Exception):
+            print(f"Failed to mirror image {source.source_url}: {result!r}")
+            mirrored.append(failed(source))
+        else:
+            raise result
+    return mirrored, stats
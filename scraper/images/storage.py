@@ -0,0 +1,86 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from supabase import AsyncClient
+
+
+class ImageStore(ABC):
+    """
+    Where mirrored images are written. Keys are content-addressed, so a key that already
+    exists never needs to be written again.
+    """
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes, content_type: str) -> None: ...
+
+    @abstractmethod
+    async def public_url(self, key: str) -> str: ...
+
+
+class LocalDirectoryStore(ImageStore):
+    """
+    Store images in a local directory. Useful for local runs and tests; pass `base_url` if
+    the directory is served over HTTP, otherwise file:// URLs are returned.
+    """
+
+    def __init__(self, root: str | Path, base_url: str | None = None):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    async def exists(self, key: str) -> bool:
+        return (self.root / key).exists()
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(path.write_bytes, data)
+
+    async def public_url(self, key: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{key}"
+        return (self.root / key).resolve().as_uri()
+
+
+class SupabaseImageStore(ImageStore):
+    """Store images in a public Supabase Storage bucket."""
+
+    def __init__(self, client: AsyncClient, bucket: str):
+        self.bucket = client.storage.from_(bucket)
+
+    async def exists(self, key: str) -> bool:
+        return await self.bucket.exists(key)
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        await self.bucket.upload(
+            key,
+            data,
+            {
+                "content-type": content_type,
+                "cache-control": "31536000",
+                "upsert": "true",
+            },
+        )
+
+    async def public_url(self, key: str) -> str:
+        return await self.bucket.get_public_url(key)
+
+
+def create_image_store(client: AsyncClient | None) -> ImageStore:
+    """
+    Use IMAGE_STORE_DIR (and optionally IMAGE_STORE_BASE_URL) for a local directory store,
+    otherwise the Supabase bucket named by IMAGE_STORE_BUCKET (default "avatars"), which
+    needs a `client`.
+    """
+    local_dir = os.getenv("IMAGE_STORE_DIR")
+    if local_dir:
+        return LocalDirectoryStore(local_dir, os.getenv("IMAGE_STORE_BASE_URL"))
+    if client is None:
+        raise EnvironmentError(
+            "Unset environment variables: IMAGE_STORE_DIR (needed without Supabase)"
+        )
+    return SupabaseImageStore(client, os.getenv("IMAGE_STORE_BUCKET", "avatars"))
@@ -0,0 +1,59 @@
+import asyncio
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+
+from scraper.crud.job import aheartbeat_jobs
+from scraper.storage import Storage
+
+# Job kinds
+SCRAPE_SITE_JOB = "scrape_site"
+TAG_CHARACTER_JOB = "tag_character"
+
+
+def new_worker_id(name: str) -> str:
+    return f"{name}-{uuid.uuid4().hex[:12]}"
+
+
+@asynccontextmanager
+async def hold_leases(
+    db: Storage, job_ids: Iterable[str], worker_id: str, lease_seconds: int
+) -> AsyncIterator[set[str]]:
+    """
+    Renew the worker's leases on the given jobs in the background, three times per lease
+    period, for as long as the block runs.
+
+    Yields the set of job IDs still held; IDs are removed from it when a renewal finds the
+    lease was lost (it expired and another worker may have claimed the job). A failed
+    renewal is retried on the next beat, and once a whole lease period passes without one,
+    every lease counts as lost.
+    """
+    held = set(job_ids)
+
+    async def renew() -> None:
+        renewed_at = time.monotonic()
+        while held:
+            await asyncio.sleep(lease_seconds / 3)
+            beat_at = time.monotonic()
+            try:
+                renewed = set(
+                    await aheartbeat_jobs(db, list(held), worker_id, lease_seconds)
+                )
+            except Exception as e:
+                print(f"Worker {worker_id} failed to renew its leases: {e}")
+                if time.monotonic() - renewed_at >= lease_seconds:
+                    print(f"Worker {worker_id} lost the lease on {len(held)} jobs")
+                    held.clear()
+                continue
+            renewed_at = beat_at
+            lost = held - renewed
+            if lost:
+                print(f"Worker {worker_id} lost the lease on {len(lost)} jobs")
+                held.difference_update(lost)
+
+    task = asyncio.create_task(renew())
+    try:
+        yield held
+    finally:
+        task.cancel()
@@ -0,0 +1,140 @@
+from bisect import bisect_left
+
+from pydantic import BaseModel, Field
+from pydantic_ai.usage import RunUsage
+
+# Upper bounds of the histogram buckets; the last bucket holds everything above
+LATENCY_BUCKETS_SECONDS: list[float] = [0.5, 1, 2, 4, 8, 16, 32, 64]
+INPUT_TOKEN_BUCKETS: list[float] = [
+    250,
+    500,
+    1_000,
+    2_000,
+    4_000,
+    8_000,
+    16_000,
+    32_000,
+]
+
+# USD per million (input, output) tokens, used for cost estimates
+MODEL_PRICES_PER_MILLION_TOKENS = {
+    "openrouter:x-ai/grok-4-fast": (0.20, 0.50),
+}
+
+
+class Histogram(BaseModel):
+    """Fixed-bucket histogram, cheap to merge across batches and runs."""
+
+    bounds: list[float]
+    # One count per bound, plus one for values above the last bound
+    counts: list[int] = Field(default_factory=list)
+    total: float = 0
+
+    def model_post_init(self, context: object) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        return Histogram(
+            bounds=self.bounds,
+            counts=[a + b for a, b in zip(self.counts, other.counts)],
+            total=self.total + other.total,
+        )
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th quantile (inf past the last bound)."""
+        count = sum(self.counts)
+        if not count:
+            return None
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= q * count:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class LlmUsageStats(BaseModel):
+    """
+    Token usage, latency and retries of agent runs, aggregated per batch and per run.
+
+    Output validation retries are the model requests a run made beyond the first.
+    """
+
+    model: str
+    runs: int = 0
+    failed_runs: int = 0
+    requests: int = 0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_seconds: Histogram = Field(
+        default_factory=lambda: Histogram(bounds=LATENCY_BUCKETS_SECONDS)
+    )
+    input_tokens_per_run: Histogram = Field(
+        default_factory=lambda: Histogram(bounds=INPUT_TOKEN_BUCKETS)
+    )
+
+    def record(self, usage: RunUsage, latency_seconds: float, failed: bool) -> None:
+        self.runs += 1
+        self.failed_runs += int(failed)
+        self.requests += usage.requests
+        self.retries += max(usage.requests - 1, 0)
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.latency_seconds.record(latency_seconds)
+        self.input_tokens_per_run.record(usage.input_tokens)
+
+    def merge(self, other: "LlmUsageStats") -> "LlmUsageStats":
+        return LlmUsageStats(
+            model=self.model,
+            runs=self.runs + other.runs,
+            failed_runs=self.failed_runs + other.failed_runs,
+            requests=self.requests + other.requests,
+            retries=self.retries + other.retries,
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            latency_seconds=self.latency_seconds.merge(other.latency_seconds),
+            input_tokens_per_run=self.input_tokens_per_run.merge(
+                other.input_tokens_per_run
+            ),
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def estimated_cost_usd(self) -> float | None:
+        prices = MODEL_PRICES_PER_MILLION_TOKENS.get(self.model)
+        if prices is None:
+            return None
+        input_price, output_price = prices
+        return (
+            self.input_tokens * input_price + self.output_tokens * output_price
+        ) / 1e6
+
+    def summary(self) -> dict[str, object]:
+        """Headline numbers for logs."""
+        cost = self.estimated_cost_usd()
+        return {
+            "model": self.model,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+            "retries": self.retries,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "mean_latency_seconds": round(self.latency_seconds.total / self.runs, 3)
+            if self.runs
+            else None,
+            "p50_latency_seconds": self.latency_seconds.quantile(0.5),
+            "p95_latency_seconds": self.latency_seconds.quantile(0.95),
+            "p95_input_tokens": self.input_tokens_per_run.quantile(0.95),
+            "estimated_cost_usd": round(cost, 4) if cost is not None else None,
+            "estimated_cost_per_run_usd": round(cost / self.runs, 6)
+            if cost is not None and self.runs
+            else None,
+        }
@@ -0,0 +1,159 @@
+from httpx import HTTPStatusError, TransportError
+from pydantic import BaseModel
+
+from scraper.schemas import PageSizeObservation, PageTuning
+
+# Page sizes failing more often than this are stepped down from
+MAX_ERROR_RATE = 0.05
+# Pages larger than this take long to transfer and parse, so sizes aren't grown past it
+MAX_PAGE_BYTES = 8 * 1024 * 1024
+# Timeouts are this multiple of the slowest page expected at the chosen size
+TIMEOUT_HEADROOM = 3.0
+MIN_TIMEOUT_SECONDS = 10.0
+MAX_TIMEOUT_SECONDS = 120.0
+# Weight of the latest crawl in each page size's moving averages
+SMOOTHING = 0.5
+
+
+class PageRunStats(BaseModel):
+    """Listing requests of one crawl, as measured by `crawl_site`."""
+
+    page_size: int | None
+    pages: int = 0
+    items: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    slowest_page_seconds: float = 0.0
+    errors: int = 0
+
+    def record_page(self, items: int, seconds: float, bytes: int) -> None:
+        self.pages += 1
+        self.items += items
+        self.seconds += seconds
+        self.bytes += bytes
+        self.slowest_page_seconds = max(self.slowest_page_seconds, seconds)
+
+    def record_error(self, seconds: float) -> None:
+        # A timed-out request took at least this long, so it raises the next timeout too
+        self.errors += 1
+        self.slowest_page_seconds = max(self.slowest_page_seconds, seconds)
+
+    @property
+    def error_rate(self) -> float:
+        requests = self.pages + self.errors
+        return self.errors / requests if requests else 0.0
+
+
+def is_page_error(error: Exception) -> bool:
+    """Whether a failed listing request says the page size or timeout is too much."""
+    if isinstance(error, TransportError):
+        return True
+    return isinstance(error, HTTPStatusError) and error.response.status_code >= 500
+
+
+def _update_observation(
+    observation: PageSizeObservation, run: PageRunStats
+) -> PageSizeObservation:
+    def average(previous: float, latest: float) -> float:
+        if not observation.runs:
+            return latest
+        return (1 - SMOOTHING) * previous + SMOOTHING * latest
+
+    items_per_second = run.items / run.seconds if run.seconds else 0.0
+    # A crawl that failed before its first page only tells us about errors and latency
+    return PageSizeObservation(
+        runs=observation.runs + 1,
+        items_per_second=average(observation.items_per_second, items_per_second)
+        if run.pages
+        else observation.items_per_second,
+        error_rate=average(observation.error_rate, run.error_rate),
+        bytes_per_page=average(observation.bytes_per_page, run.bytes / run.pages)
+        if run.pages
+        else observation.bytes_per_page,
+        slowest_page_seconds=max(
+            average(observation.slowest_page_seconds, run.slowest_page_seconds),
+            run.slowest_page_seconds,
+        ),
+    )
+
+
+def _timeout(slowest_page_seconds: float) -> float:
+    return min(
+        max(slowest_page_seconds * TIMEOUT_HEADROOM, MIN_TIMEOUT_SECONDS),
+        MAX_TIMEOUT_SECONDS,
+    )
+
+
+def tune_page_size(
+    site_id: str,
+    page_size_range: tuple[int, int] | None,
+    previous: PageTuning | None,
+    run: PageRunStats,
+) -> PageTuning:
+    """
+    Choose the page size and request timeout for a site's next crawl from this crawl's
+    listing requests, folded into per-size moving averages.
+
+    The size steps down by half while it fails more than `MAX_ERROR_RATE` of requests.
+    Otherwise the healthy size with the most items per second wins, and is doubled to
+    try the next size up while that one hasn't been measured yet and its pages would
+    stay under `MAX_PAGE_BYTES`. Sizes are kept within `page_size_range`; sites without
+    one only get their timeout tuned. Until a crawl has been measured, the timeout is
+    left to the scraper.
+    """
+    if page_size_range is None or run.page_size is None:
+        return PageTuning(
+            site_id=site_id,
+            page_size=None,
+            timeout_seconds=_timeout(run.slowest_page_seconds)
+            if run.pages
+            else (previous.timeout_seconds if previous else None),
+        )
+
+    low, high = page_size_range
+    observations = dict(previous.observations) if previous else {}
+    if run.pages or run.errors:
+        observations[run.page_size] = _update_observation(
+            observations.get(run.page_size, PageSizeObservation()), run
+        )
+
+    current = observations.get(run.page_size)
+    if current is not None and current.error_rate > MAX_ERROR_RATE:
+        page_size = max(low, run.page_size // 2)
+    else:
+        healthy = {
+            size: observation
+            for size, observation in observations.items()
+            if low <= size <= high and observation.error_rate <= MAX_ERROR_RATE
+        }
+        if not healthy:
+            page_size = min(max(run.page_size, low), high)
+        else:
+            page_size = max(healthy, key=lambda size: healthy[size].items_per_second)
+            larger = min(page_size * 2, high)
+            if (
+                larger > page_size
+                and larger not in observations
+                and healthy[page_size].bytes_per_page * larger / page_size
+                <= MAX_PAGE_BYTES
+            ):
+                page_size = larger
+
+    # Scale the slowest page seen at the nearest measured size to the chosen size
+    measured = [size for size in observations if observations[size].runs]
+    timeout_seconds: float | None
+    if measured:
+        nearest = min(measured, key=lambda size: abs(size - page_size))
+        slowest = observations[nearest].slowest_page_seconds * max(
+            1.0, page_size / nearest
+        )
+        timeout_seconds = _timeout(slowest)
+    else:
+        timeout_seconds = previous.timeout_seconds if previous else None
+
+    return PageTuning(
+        site_id=site_id,
+        page_size=page_size,
+        timeout_seconds=timeout_seconds,
+        observations=observations,
+    )
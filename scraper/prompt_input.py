@@ -0,0 +1,187 @@
+import html
+import math
+import re
+from collections import Counter
+from collections.abc import Iterable
+
+from pydantic import BaseModel
+
+# Descriptions are cut to about this many tokens before they're sent for tagging
+DESCRIPTION_TOKEN_BUDGET = 1_000
+# Lines found in at least this many descriptions of a batch are creator boilerplate
+# (credits, links, disclaimers) rather than anything about the character
+BOILERPLATE_MIN_DESCRIPTIONS = 3
+# Shorter lines, like "Personality:" headings, are shared without being boilerplate
+BOILERPLATE_MIN_LENGTH = 20
+
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+MARKUP = [
+    # Markdown images, then links reduced to their text
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), " "),
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"<[a-zA-Z/!][^>\n]*>"), " "),
+    (re.compile(r"https?://\S+|www\.\S+"), " "),
+    (re.compile(r"[*_~`|]+"), ""),
+    (re.compile(r"^[ \t]*(?:#{1,6}|>+|[-+]{1,2}(?= ))[ \t]*", re.MULTILINE), ""),
+]
+# "<START>" opens each example chat, and turns start with the speaker
+EXAMPLE_START = re.compile(r"^\s*<start>", re.IGNORECASE)
+EXAMPLE_TURN = re.compile(
+    r"^\s*(?:\{\{(?:user|char)\}\}|user|you|char)\s*:", re.IGNORECASE
+)
+# Lines opening a new section of a card ("# Scenario", "[Personality]", "Likes:"),
+# which end an example chat
+SECTION_HEADING = re.compile(
+    r"^\s*(?:#{1,6}\s|\[[^\]\n]+\]\s*$|[A-Za-z][\w' ]{0,38}:\s*$)"
+)
+USER_PLACEHOLDER = re.compile(r"\{\{user\}\}|<user>", re.IGNORECASE)
+CHAR_PLACEHOLDER = re.compile(r"\{\{char\}\}|<(?:bot|char)>", re.IGNORECASE)
+HAS_WORD = re.compile(r"\w")
+
+
+class PromptCompactionStats(BaseModel):
+    """Description tokens before and after compaction, aggregated per batch and per run."""
+
+    descriptions: int = 0
+    truncated: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    def record(self, tokens_before: int, tokens_after: int, truncated: bool) -> None:
+        self.descriptions += 1
+        self.truncated += int(truncated)
+        self.tokens_before += tokens_before
+        self.tokens_after += tokens_after
+
+    def merge(self, other: "PromptCompactionStats") -> "PromptCompactionStats":
+        return PromptCompactionStats(
+            descriptions=self.descriptions + other.descriptions,
+            truncated=self.truncated + other.truncated,
+            tokens_before=self.tokens_before + other.tokens_before,
+            tokens_after=self.tokens_after + other.tokens_after,
+        )
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def summary(self) -> dict[str, object]:
+        """Headline numbers for logs."""
+        return {
+            "descriptions": self.descriptions,
+            "truncated": self.truncated,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "saved_fraction": round(self.tokens_saved / self.tokens_before, 3)
+            if self.tokens_before
+            else None,
+        }
+
+
+def _piece_tokens(piece: str) -> int:
+    if piece.isascii():
+        return math.ceil(len(piece) / 6)
+    # Other scripts take far more tokens per character
+    return math.ceil(len(piece) / 2)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: common English words are one token each,
+    longer ones one per six letters, and every punctuation mark one more.
+    """
+    return sum(_piece_tokens(piece) for piece in TOKEN_PIECES.findall(text))
+
+
+def _line_key(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def _drop_example_dialogue(lines: list[str]) -> list[str]:
+    """
+    Drop example chats: each `<START>` block up to the next section heading (or the end
+    of the description), along with speaker turns found outside one.
+    """
+    kept: list[str] = []
+    in_example = False
+    for line in lines:
+        if EXAMPLE_START.match(line):
+            in_example = True
+        elif EXAMPLE_TURN.match(line):
+            pass
+        elif in_example and SECTION_HEADING.match(line):
+            in_example = False
+            kept.append(line)
+        elif not in_example:
+            kept.append(line)
+    return kept
+
+
+def _strip_markup(description: str, drop_examples: bool = True) -> list[str]:
+    # Placeholders look like HTML tags in some cards, so they're settled first
+    text = USER_PLACEHOLDER.sub("{{user}}", html.unescape(description))
+    text = CHAR_PLACEHOLDER.sub("{{char}}", text)
+    if drop_examples:
+        text = "\n".join(_drop_example_dialogue(text.splitlines()))
+    for pattern, replacement in MARKUP:
+        text = pattern.sub(replacement, text)
+    return [" ".join(line.split()) for line in text.splitlines()]
+
+
+def find_boilerplate(descriptions: Iterable[str]) -> set[str]:
+    """
+    Lines, normalized, that appear in at least `BOILERPLATE_MIN_DESCRIPTIONS` of the
+    descriptions, for `compact_description` to drop.
+    """
+    counts: Counter[str] = Counter()
+    for description in descriptions:
+        # Counted with example chats kept, as credits often follow the last one
+        counts.update(
+            {
+                _line_key(line)
+                for line in _strip_markup(description, drop_examples=False)
+                if len(line) >= BOILERPLATE_MIN_LENGTH
+            }
+        )
+    return {
+        line for line, count in counts.items() if count >= BOILERPLATE_MIN_DESCRIPTIONS
+    }
+
+
+def _truncate(text: str, token_budget: int) -> str:
+    tokens = 0
+    for match in TOKEN_PIECES.finditer(text):
+        tokens += _piece_tokens(match.group())
+        if tokens > token_budget:
+            return text[: match.start()].rstrip() + " …"
+    return text
+
+
+def compact_description(
+    name: str,
+    description: str,
+    boilerplate: set[str] | frozenset[str] = frozenset(),
+    token_budget: int = DESCRIPTION_TOKEN_BUDGET,
+) -> tuple[str, bool]:
+    """
+    Cut a character description down to what tagging needs, returning it and whether
+    it had to be truncated.
+
+    Drops HTML and Markdown markup, links, example dialogue, lines without words,
+    repeated lines and `boilerplate` lines, fills in {{char}} and {{user}}, then keeps
+    the first `token_budget` tokens by `estimate_tokens`.
+    """
+    seen: set[str] = set()
+    lines: list[str] = []
+    for line in _strip_markup(description):
+        key = _line_key(line)
+        if not HAS_WORD.search(line) or key in seen or key in boilerplate:
+            continue
+        seen.add(key)
+        line = CHAR_PLACEHOLDER.sub(name, line)
+        lines.append(USER_PLACEHOLDER.sub("the user", line))
+
+    compacted = "\n".join(lines)
+    truncated = _truncate(compacted, token_budget)
+    return truncated, truncated != compacted
@@ -1,3 +1,6 @@
+from typing import Callable
+
+from scraper.request_budget import SiteRequestBudget
 from scraper.sites.base import BaseScraper
 from scraper.sites.chub import ChubScraper
 from scraper.sites.janitor import JanitorScraper
@@ -5,13 +8,65 @@ from scraper.sites.wyvern import WyvernScraper
 from scraper.sites.pygmalion import PygmalionScraper
 
 
-def get_scraper(url: str) -> BaseScraper:
+# Scrapers registered at runtime by domain, e.g. stand-in sites for local benchmarks
+ScraperFactory = Callable[[str | None, SiteRequestBudget | None], BaseScraper]
+_registered_scrapers: dict[str, ScraperFactory] = {}
+
+
+def register_scraper(domain: str, factory: ScraperFactory) -> None:
+    """
+    Use `factory(cache_dir, request_budget)` for URLs containing `domain`, ahead of the
+    built-in sites.
+    """
+    _registered_scrapers[domain] = factory
+
+
+def get_scraper(
+    url: str,
+    cache_dir: str | None = None,
+    page_size: int | None = None,
+    timeout: float | None = None,
+    request_budget: SiteRequestBudget | None = None,
+) -> BaseScraper:
+    """
+    Return the scraper for a site URL. With `cache_dir`, listing responses are cached
+    there and revalidated on later runs. `page_size` and `timeout` override the
+    scraper's defaults, e.g. with the values tuned for the site. With `request_budget`,
+    its requests share the budget with other crawls in the container.
+    """
+    for domain, factory in _registered_scrapers.items():
+        if domain in url:
+            return factory(cache_dir, request_budget)
     if "chub.ai" in url:
-        return ChubScraper(use_proxy=True)
+        return ChubScraper(
+            use_proxy=True,
+            timeout=timeout or 10.0,
+            cache_dir=cache_dir,
+            page_size=page_size,
+            request_budget=request_budget,
+        )
     if "janitorai.com" in url:
-        return JanitorScraper(use_proxy=True)
+        return JanitorScraper(
+            use_proxy=True,
+            timeout=timeout or 10.0,
+            cache_dir=cache_dir,
+            request_budget=request_budget,
+        )
     if "wyvern.chat" in url:
-        return WyvernScraper(use_proxy=False, timeout=60.0)
+        return WyvernScraper(
+            use_proxy=False,
+            timeout=timeout or 60.0,
+            cache_dir=cache_dir,
+            page_size=page_size,
+            request_budget=request_budget,
+        )
     if "pygmalion.chat" in url:
-        return PygmalionScraper(use_proxy=True, timeout=30.0)
+        # Listing pages are POSTs, which are never cached
+        return PygmalionScraper(
+            use_proxy=True,
+            timeout=timeout or 30.0,
+            cache_dir=cache_dir,
+            page_size=page_size,
+            request_budget=request_budget,
+        )
     raise ValueError(f"No scraper found for URL: {url}")
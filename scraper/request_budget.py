@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from typing import cast
+
+from httpx import AsyncBaseTransport, AsyncByteStream, Request, Response
+from pydantic import BaseModel
+
+
+class SiteRequestStats(BaseModel):
+    site: str
+    requests: int
+    in_flight: int
+    peak_in_flight: int
+    # Time requests spent waiting for a slot
+    wait_seconds: float
+
+
+class SiteRequestBudget:
+    """One site's share of a `RequestBudget`, held by that site's scraper."""
+
+    def __init__(self, budget: "RequestBudget", site: str):
+        self.budget = budget
+        self.site = site
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        # When the site was last given a slot, in grants
+        self.last_granted = 0
+
+    async def acquire(self) -> None:
+        await self.budget._acquire(self)
+
+    def release(self) -> None:
+        self.budget._release(self)
+
+    def stats(self) -> SiteRequestStats:
+        return SiteRequestStats(
+            site=self.site,
+            requests=self.requests,
+            in_flight=self.in_flight,
+            peak_in_flight=self.peak_in_flight,
+            wait_seconds=round(self.wait_seconds, 3),
+        )
+
+
+class RequestBudget:
+    """
+    Caps the requests in flight across every crawl running in a container.
+
+    Once the budget is full, requests queue per site, and each freed slot goes to the
+    waiting site with the fewest requests in flight (the one served longest ago on
+    ties). Every site with requests waiting gets an equal share, so one with a deep
+    backlog can't starve the rest.
+    """
+
+    def __init__(self, max_in_flight: int):
+        if max_in_flight < 1:
+            raise ValueError("A request budget needs at least one slot")
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.sites: dict[str, SiteRequestBudget] = {}
+        self._grants = 0
+
+    def for_site(self, site: str) -> SiteRequestBudget:
+        if site not in self.sites:
+            self.sites[site] = SiteRequestBudget(self, site)
+        return self.sites[site]
+
+    async def _acquire(self, site: SiteRequestBudget) -> None:
+        started_at = time.perf_counter()
+        if self.in_flight < self.max_in_flight and not any(
+            waiting.waiters for waiting in self.sites.values()
+        ):
+            self._grant(site)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        site.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled just after being given a slot, which goes to the next site
+            if future.done() and not future.cancelled():
+                self._release(site)
+            elif future in site.waiters:
+                site.waiters.remove(future)
+            raise
+        site.wait_seconds += time.perf_counter() - started_at
+
+    def _grant(self, site: SiteRequestBudget) -> None:
+        self._grants += 1
+        self.in_flight += 1
+        site.in_flight += 1
+        site.requests += 1
+        site.peak_in_flight = max(site.peak_in_flight, site.in_flight)
+        site.last_granted = self._grants
+
+    def _release(self, site: SiteRequestBudget) -> None:
+        self.in_flight -= 1
+        site.in_flight -= 1
+        while self.in_flight < self.max_in_flight:
+            waiting = [s for s in self.sites.values() if s.waiters]
+            if not waiting:
+                return
+            next_site = min(waiting, key=lambda s: (s.in_flight, s.last_granted))
+            future = next_site.waiters.popleft()
+            if future.cancelled():
+                continue
+            self._grant(next_site)
+            future.set_result(None)
+
+    def stats(self) -> list[SiteRequestStats]:
+        return [site.stats() for site in self.sites.values()]
+
+
+class _ReleasingStream(AsyncByteStream):
+    def __init__(self, stream: AsyncByteStream, release: Callable[[], None]):
+        self.stream = stream
+        self.release: Callable[[], None] | None = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+
+class BudgetedTransport(AsyncBaseTransport):
+    """
+    Holds a slot of a site's request budget for each request, from sending it until its
+    response is closed.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport, budget: SiteRequestBudget):
+        self.transport = transport
+        self.budget = budget
+
+    async def handle_async_request(self, request: Request) -> Response:
+        await self.budget.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.budget.release()
+            raise
+        return Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(
+                cast(AsyncByteStream, response.stream), self.budget.release
+            ),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
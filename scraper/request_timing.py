@@ -0,0 +1,63 @@
+import time
+from collections.abc import AsyncIterator
+from typing import cast
+
+from httpx import AsyncBaseTransport, AsyncByteStream, Request, Response
+
+
+class RequestTimer:
+    """Time spent on the wire by a scraper's requests, from sending until fully read."""
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+
+
+class _TimedStream(AsyncByteStream):
+    def __init__(self, stream: AsyncByteStream, timer: RequestTimer, started_at: float):
+        self.stream = stream
+        self.timer = timer
+        self.started_at: float | None = started_at
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.started_at is not None:
+                self.timer.seconds += time.perf_counter() - self.started_at
+                self.started_at = None
+
+
+class TimedTransport(AsyncBaseTransport):
+    """
+    Adds the time each request takes, until its response is closed, to a `RequestTimer`.
+
+    Wraps the transport that talks to the network, so time spent waiting in the
+    transports around it (for a request budget slot or a proxy) isn't counted.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport, timer: RequestTimer):
+        self.transport = transport
+        self.timer = timer
+
+    async def handle_async_request(self, request: Request) -> Response:
+        started_at = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.timer.seconds += time.perf_counter() - started_at
+            raise
+        return Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_TimedStream(
+                cast(AsyncByteStream, response.stream), self.timer, started_at
+            ),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
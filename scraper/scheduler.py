@@ -0,0 +1,215 @@
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from pydantic import BaseModel
+
+from scraper.schemas import CrawlSchedule, Site
+
+# Crawls run at least this often, and at most this rarely
+MIN_CRAWL_INTERVAL = timedelta(hours=1)
+MAX_CRAWL_INTERVAL = timedelta(days=7)
+# Every site is crawled in full this often, refreshing counts on older characters
+FULL_CRAWL_INTERVAL = timedelta(days=7)
+# Assumed until a site has been measured
+DEFAULT_NEW_PER_HOUR = 10.0
+DEFAULT_SECONDS_PER_PAGE = 2.0
+DEFAULT_CHARACTERS_PER_PAGE = 100.0
+# Container start-up and the like, paid once per crawl
+CRAWL_OVERHEAD_SECONDS = 15.0
+# Incremental crawls stop after this many pages in a row without new characters
+PAGES_WITHOUT_NEW_TO_STOP = 2
+# Incremental crawls stop after this multiple of the pages expected new characters fill
+DEPTH_HEADROOM = 2.0
+# Weight of the latest crawl in each site's moving averages
+SMOOTHING = 0.3
+
+
+class CrawlStats(BaseModel):
+    """One crawl of a site, as measured by `crawl_site`."""
+
+    started_at: datetime
+    finished_at: datetime
+    pages: int
+    # Pages unchanged since the last crawl are skipped without being parsed
+    parsed_pages: int
+    characters: int
+    new_characters: int
+    # Whether the crawl went through every page, rather than stopping early
+    full: bool
+
+
+def count_created_since(rows: list[dict[str, Any]], since: datetime) -> int:
+    """How many upserted rows were inserted (rather than updated) at or after `since`."""
+    # SQLite stores whole seconds without a zone
+    since = since.replace(microsecond=0)
+    count = 0
+    for row in rows:
+        # Strings from PostgREST and SQLite, datetimes from COPY ingest
+        created_at = row["created_at"]
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if created_at >= since:
+            count += 1
+    return count
+
+
+def record_crawl(
+    site_id: str, previous: CrawlSchedule | None, stats: CrawlStats
+) -> CrawlSchedule:
+    """Fold a finished crawl into the site's churn rate and crawl costs."""
+
+    def average(old: float | None, latest: float) -> float:
+        if old is None:
+            return latest
+        return (1 - SMOOTHING) * old + SMOOTHING * latest
+
+    schedule = previous.model_copy() if previous else CrawlSchedule(site_id=site_id)
+    # The first crawl finds every character, so only later ones measure churn
+    if previous is not None and previous.last_crawl_at is not None:
+        hours = (stats.started_at - previous.last_crawl_at).total_seconds() / 3600
+        if hours > 0:
+            schedule.new_per_hour = average(
+                previous.new_per_hour, stats.new_characters / hours
+            )
+    if stats.pages:
+        seconds = (stats.finished_at - stats.started_at).total_seconds()
+        schedule.seconds_per_page = average(
+            schedule.seconds_per_page, seconds / stats.pages
+        )
+    if stats.parsed_pages:
+        schedule.characters_per_page = average(
+            schedule.characters_per_page, stats.characters / stats.parsed_pages
+        )
+    schedule.last_crawl_at = stats.started_at
+    schedule.failed_crawls = 0
+    if stats.full:
+        schedule.last_full_crawl_at = stats.started_at
+        schedule.full_crawl_pages = stats.pages
+    return schedule
+
+
+def record_failed_crawl(
+    site_id: str, previous: CrawlSchedule | None, failed_at: datetime
+) -> CrawlSchedule:
+    """Count a crawl that failed, so `plan_crawls` backs off from the site."""
+    schedule = previous.model_copy() if previous else CrawlSchedule(site_id=site_id)
+    schedule.failed_crawls += 1
+    schedule.last_failed_at = failed_at
+    return schedule
+
+
+def plan_crawls(
+    sites: list[Site],
+    schedules: dict[str, CrawlSchedule],
+    now: datetime,
+    container_hours_per_day: float,
+) -> tuple[list[CrawlSchedule], list[CrawlSchedule]]:
+    """
+    Set each site's next crawl time and depth within `container_hours_per_day`, and
+    return every site's schedule along with those due now.
+
+    A day's crawling costs the weekly full crawls, the pages new characters fill (the
+    same however often a site is crawled), and a fixed cost per crawl: overhead plus the
+    pages without new characters that end an incremental crawl. What the budget leaves
+    for the fixed costs is spread so that crawls per day go with
+    sqrt(new characters per hour / fixed cost per crawl), which keeps the most characters
+    fresh for the time spent: busy sites are crawled often, quiet ones rarely.
+
+    After a failed crawl, a site waits twice the minimum interval before it's tried
+    again, doubling with each failure in a row up to the maximum interval.
+    """
+    known_rates = [
+        schedule.new_per_hour
+        for schedule in schedules.values()
+        if schedule.new_per_hour is not None
+    ]
+    default_rate = (
+        sum(known_rates) / len(known_rates) if known_rates else DEFAULT_NEW_PER_HOUR
+    )
+
+    planned = [
+        (
+            schedules.get(str(site.id)) or CrawlSchedule(site_id=str(site.id))
+        ).model_copy()
+        for site in sites
+    ]
+
+    def rate(schedule: CrawlSchedule) -> float:
+        return max(
+            schedule.new_per_hour
+            if schedule.new_per_hour is not None
+            else default_rate,
+            0.0,
+        )
+
+    def seconds_per_page(schedule: CrawlSchedule) -> float:
+        return schedule.seconds_per_page or DEFAULT_SECONDS_PER_PAGE
+
+    def characters_per_page(schedule: CrawlSchedule) -> float:
+        return schedule.characters_per_page or DEFAULT_CHARACTERS_PER_PAGE
+
+    def fixed_cost(schedule: CrawlSchedule) -> float:
+        return CRAWL_OVERHEAD_SECONDS + PAGES_WITHOUT_NEW_TO_STOP * seconds_per_page(
+            schedule
+        )
+
+    budget_seconds = container_hours_per_day * 3600
+    full_crawl_days = FULL_CRAWL_INTERVAL / timedelta(days=1)
+    for schedule in planned:
+        budget_seconds -= (
+            (schedule.full_crawl_pages or 0)
+            * seconds_per_page(schedule)
+            / full_crawl_days
+        )
+        budget_seconds -= (
+            rate(schedule)
+            * 24
+            / characters_per_page(schedule)
+            * seconds_per_page(schedule)
+        )
+    # Crawls per day are k * sqrt(rate / fixed cost), costing k * sum(sqrt(rate * fixed cost))
+    cost_per_k = sum(
+        math.sqrt(rate(schedule) * fixed_cost(schedule)) for schedule in planned
+    )
+    k = max(budget_seconds, 0.0) / cost_per_k if cost_per_k else 0.0
+
+    due: list[CrawlSchedule] = []
+    for schedule in planned:
+        crawls_per_day = k * math.sqrt(rate(schedule) / fixed_cost(schedule))
+        interval = (
+            timedelta(days=1 / crawls_per_day) if crawls_per_day else MAX_CRAWL_INTERVAL
+        )
+        interval = min(max(interval, MIN_CRAWL_INTERVAL), MAX_CRAWL_INTERVAL)
+        schedule.next_crawl_at = (
+            schedule.last_crawl_at + interval if schedule.last_crawl_at else now
+        )
+        if schedule.failed_crawls and schedule.last_failed_at is not None:
+            backoff = min(
+                MIN_CRAWL_INTERVAL * 2**schedule.failed_crawls, MAX_CRAWL_INTERVAL
+            )
+            schedule.next_crawl_at = max(
+                schedule.next_crawl_at, schedule.last_failed_at + backoff
+            )
+
+        if (
+            schedule.last_full_crawl_at is None
+            or now - schedule.last_full_crawl_at >= FULL_CRAWL_INTERVAL
+        ):
+            schedule.max_pages = None
+        else:
+            # Crawls that run late have more to catch up on
+            since_last_crawl = max(
+                interval, now - (schedule.last_crawl_at or schedule.last_full_crawl_at)
+            )
+            expected_new = rate(schedule) * since_last_crawl.total_seconds() / 3600
+            schedule.max_pages = (
+                math.ceil(expected_new * DEPTH_HEADROOM / characters_per_page(schedule))
+                + PAGES_WITHOUT_NEW_TO_STOP
+            )
+
+        if schedule.next_crawl_at <= now:
+            due.append(schedule)
+    return planned, due
@@ -1,6 +1,7 @@
+from datetime import datetime
 from pydantic import BaseModel, HttpUrl, UUID4
 from enum import IntEnum
-from typing import Optional, TypedDict
+from typing import Any, Literal, Optional, TypedDict
 
 
 class Site(BaseModel):
@@ -10,6 +11,47 @@ class Site(BaseModel):
     is_enabled: bool
 
 
+class PageSizeObservation(BaseModel):
+    """Moving averages of a site's listing requests at one page size, across crawls."""
+
+    runs: int = 0
+    items_per_second: float = 0.0
+    # Failed listing requests (timeouts, dropped connections, 5xx) per request
+    error_rate: float = 0.0
+    bytes_per_page: float = 0.0
+    slowest_page_seconds: float = 0.0
+
+
+class PageTuning(BaseModel):
+    """Listing page size and request timeout for a site's next crawl."""
+
+    site_id: str
+    # None when the server decides the page size
+    page_size: Optional[int] = None
+    # None leaves the timeout to the scraper
+    timeout_seconds: Optional[float] = None
+    observations: dict[int, PageSizeObservation] = {}
+
+
+class CrawlSchedule(BaseModel):
+    """A site's measured churn and crawl costs, and when and how deep to crawl it next."""
+
+    site_id: str
+    next_crawl_at: Optional[datetime] = None
+    # Pages the next crawl may go through; None for a full crawl
+    max_pages: Optional[int] = None
+    # Moving averages over previous crawls
+    new_per_hour: Optional[float] = None
+    seconds_per_page: Optional[float] = None
+    characters_per_page: Optional[float] = None
+    full_crawl_pages: Optional[int] = None
+    last_crawl_at: Optional[datetime] = None
+    last_full_crawl_at: Optional[datetime] = None
+    # Crawls failed in a row since the last one that finished, and when the latest failed
+    failed_crawls: int = 0
+    last_failed_at: Optional[datetime] = None
+
+
 class CreatorInput(BaseModel):
     """Creator data from scrapers, without id or site_id which are determined during upsert."""
 
@@ -53,3 +95,40 @@ class CharacterForTagging(TypedDict):
     id: str
     name: str
     description: str
+
+
+class TaggingBatchResult(TypedDict):
+    characters_tagged: int
+    characters_failed: int
+    # Left untagged because the batch's budget ran out
+    characters_skipped: int
+    total_tokens: int
+    # `LlmUsageStats` of the batch's agent runs, as a dict
+    llm_usage: dict[str, Any]
+    # `PromptCompactionStats` of the batch's descriptions, as a dict
+    prompt_compaction: dict[str, Any]
+
+
+class Job(BaseModel):
+    """A leased unit of work from the jobs table."""
+
+    id: str
+    kind: str
+    # Identifies the work; one job per (kind, key)
+    key: str
+    payload: dict[str, Any]
+    priority: float
+    attempts: int
+    leased_by: str | None = None
+    lease_expires_at: datetime | None = None
+
+
+JobOutcome = Literal["done", "failed", "abandoned", "released"]
+
+
+class JobLease(TypedDict):
+    """Jobs leased to a worker, passed along to the function doing the work."""
+
+    worker_id: str
+    # Job ID by the ID of the item it covers
+    job_ids: dict[str, str]
@@ -1,44 +1,96 @@
 from abc import ABC, abstractmethod
-from typing import TypeAlias, Optional
+from typing import NamedTuple, TypeAlias, Optional
+import hashlib
 import os
 
 from pydantic import HttpUrl
-from httpx import AsyncClient
+from httpx import AsyncBaseTransport, AsyncClient, AsyncHTTPTransport, Response
 
+from scraper.http_cache import (
+    ANNOTATIONS_EXTENSION,
+    CACHE_EXTENSION,
+    CACHE_NOT_MODIFIED,
+    CACHE_UNCHANGED,
+    DEFAULT_MAX_BYTES,
+    CachingTransport,
+    HttpResponseCache,
+)
+from scraper.proxies import ProxyPool, ProxyPoolTransport, get_proxy_pool
+from scraper.request_budget import BudgetedTransport, SiteRequestBudget
+from scraper.request_timing import RequestTimer, TimedTransport
 from scraper.schemas import Character
 
 ScraperCursorType: TypeAlias = int | None
 
 
+class ParsedPage(NamedTuple):
+    """A listing page parsed by `scrape_site`, as staged by `remember_page`."""
+
+    url: str
+    content_hash: str
+    next_cursor: ScraperCursorType
+
+
 class BaseScraper(ABC):
+    # Listing page sizes the site accepts, and the size used until one has been tuned.
+    # None for sites whose server decides the page size.
+    page_size_range: tuple[int, int] | None = None
+    default_page_size: int | None = None
+
     def __init__(
         self,
         use_proxy: bool = False,
         timeout: float = 10.0,
+        cache_dir: str | None = None,
+        page_size: int | None = None,
+        request_budget: SiteRequestBudget | None = None,
     ):
-        if not use_proxy:
-            self.http_client = AsyncClient(timeout=timeout)
+        """
+        With `cache_dir`, GET responses are cached there and revalidated with conditional
+        requests; see `page_unchanged`. HTTP_CACHE_MAX_BYTES bounds the cache size.
+
+        With `use_proxy`, requests go through the container's proxy pool; see
+        `proxies.get_proxy_pool`.
+
+        `page_size` is clamped to `page_size_range`, and ignored by sites without one.
+
+        With `request_budget`, each request that goes out to the network (or proxy) waits
+        for a slot of the budget shared by the container's crawls.
+        """
+        self.page_size = self.default_page_size
+        if self.page_size_range is not None and page_size is not None:
+            low, high = self.page_size_range
+            self.page_size = min(max(page_size, low), high)
+        # Listing pages parsed since the last `take_parsed_pages`
+        self.parsed_pages: list[ParsedPage] = []
+        # Response bytes received and time spent on requests, for measuring page sizes
+        self.bytes_received = 0
+        self.request_timer = RequestTimer()
+        event_hooks = {"response": [self._count_bytes]}
+        self.proxy_pool: ProxyPool | None = None
+        transport: AsyncBaseTransport
+        if use_proxy:
+            self.proxy_pool = get_proxy_pool()
+            transport = ProxyPoolTransport(self.proxy_pool, self.request_timer)
         else:
-            host, port = (
-                os.getenv("PROXY_HOST"),
-                os.getenv("PROXY_PORT"),
-            )
-            if not host or not port:
-                raise EnvironmentError(
-                    f"Proxy variables are not set. PROXY_HOST: {host}, PROXY_PORT: {port}"
-                )
-            username, password = (
-                os.getenv("PROXY_USERNAME"),
-                os.getenv("PROXY_PASSWORD"),
-            )
-            if not username or not password:
-                raise EnvironmentError(
-                    f"Proxy credentials are not set. PROXY_USERNAME: {username}, PROXY_PASSWORD: {password}"
-                )
-            self.http_client = AsyncClient(
-                timeout=timeout,
-                proxy=f"http://{username}:{password}@{host}:{port}",
+            transport = TimedTransport(AsyncHTTPTransport(), self.request_timer)
+        self.request_budget = request_budget
+        if request_budget is not None:
+            transport = BudgetedTransport(transport, request_budget)
+
+        self.http_cache: HttpResponseCache | None = None
+        if cache_dir is not None:
+            self.http_cache = HttpResponseCache(
+                cache_dir, int(os.getenv("HTTP_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
             )
+            transport = CachingTransport(transport, self.http_cache)
+        self.http_client = AsyncClient(
+            timeout=timeout, transport=transport, event_hooks=event_hooks
+        )
+
+    async def _count_bytes(self, response: Response) -> None:
+        await response.aread()
+        self.bytes_received += len(response.content)
 
     async def __aenter__(self):
         return self
@@ -46,6 +98,54 @@ class BaseScraper(ABC):
     async def __aexit__(self, exception_type, exception_value, traceback):
         await self.http_client.aclose()
 
+    def page_unchanged(self, response: Response) -> tuple[bool, ScraperCursorType]:
+        """
+        Whether a listing page is the same as when it was last parsed, and the next cursor
+        recorded for it then. Unchanged pages don't need to be parsed or upserted again.
+
+        Pages are cached by their full URL, page size included, and listings are newest
+        first, so any new character shifts every page after it. Expect hits mostly on
+        quiet sites and on the stable tail of deep crawls, and few the crawl after the
+        page size is retuned; the crawl reports `http_cache.hit_rate`.
+        """
+        if response.extensions.get(CACHE_EXTENSION) not in (
+            CACHE_NOT_MODIFIED,
+            CACHE_UNCHANGED,
+        ):
+            return False, None
+        annotations = response.extensions.get(ANNOTATIONS_EXTENSION, {})
+        if "next_cursor" not in annotations:
+            return False, None
+        return True, annotations["next_cursor"]
+
+    def remember_page(self, response: Response, next_cursor: ScraperCursorType) -> None:
+        """
+        Stage a parsed listing page for `page_unchanged` on later runs. It's only recorded
+        once the caller passes it to `commit_parsed_pages`, after its characters have been
+        written, so a page whose write failed is parsed again next time.
+        """
+        if self.http_cache is not None:
+            self.parsed_pages.append(
+                ParsedPage(
+                    str(response.request.url),
+                    hashlib.sha256(response.content).hexdigest(),
+                    next_cursor,
+                )
+            )
+
+    def take_parsed_pages(self) -> list[ParsedPage]:
+        """The pages staged by `remember_page` since the last call."""
+        pages, self.parsed_pages = self.parsed_pages, []
+        return pages
+
+    def commit_parsed_pages(self, pages: list[ParsedPage]) -> None:
+        if self.http_cache is None:
+            return
+        for page in pages:
+            self.http_cache.annotate(
+                page.url, page.content_hash, next_cursor=page.next_cursor
+            )
+
     @abstractmethod
     async def scrape_character(self, character_url: str) -> Character:
         """
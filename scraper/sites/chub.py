@@ -12,6 +12,9 @@ class ChubScraper(BaseScraper):
     https://chub.ai/
     """
 
+    page_size_range = (100, 1000)
+    default_page_size = 500
+
     async def scrape_character(self, character_url: str) -> Character:
         """
         TODO: Implement this.
@@ -23,9 +26,8 @@ class ChubScraper(BaseScraper):
     async def scrape_site(
         self, site_url: str, cursor: ScraperCursorType = None
     ) -> tuple[list[HttpUrl] | list[Character], ScraperCursorType]:
-        page_size = 500
         page = cursor or 1
-        api_url = f"https://gateway.chub.ai/search?excludetopics=&search=&page={page}&first={page_size}&namespace=characters&nsfw=true&nsfw_only=false&sort=created_at&include_forks=true&min_tags=0&nsfl=true&count=true"
+        api_url = f"https://gateway.chub.ai/search?excludetopics=&search=&page={page}&first={self.page_size}&namespace=characters&nsfw=true&nsfw_only=false&sort=created_at&include_forks=true&min_tags=0&nsfl=true&count=true"
 
         response = await self.http_client.get(
             api_url,
@@ -50,6 +52,9 @@ class ChubScraper(BaseScraper):
             f"Scraped '{api_url}': {response.status_code}, {response.text[:100]}{'...' if len(response.text) > 100 else ''}"
         )
         response.raise_for_status()
+        unchanged, cached_next_page = self.page_unchanged(response)
+        if unchanged:
+            return [], cached_next_page
         payload = response.json()
 
         data = payload.get("data", {})
@@ -102,4 +107,5 @@ class ChubScraper(BaseScraper):
                 )
             )
         next_page: int | None = page + 1 if len(nodes) > 0 else None
+        self.remember_page(response, next_page)
         return characters, next_page
@@ -48,6 +48,9 @@ class JanitorScraper(BaseScraper):
             f"Scraped '{api_url}': {response.status_code}, {response.text[:100]}{'...' if len(response.text) > 100 else ''}"
         )
         response.raise_for_status()
+        unchanged, cached_next_page = self.page_unchanged(response)
+        if unchanged:
+            return [], cached_next_page
         payload = response.json()
 
         items = payload.get("data", []) or []
@@ -101,4 +104,5 @@ class JanitorScraper(BaseScraper):
 
         # Paginate while there are items; stop when empty
         next_page: int | None = page + 1 if len(items) > 0 else None
+        self.remember_page(response, next_page)
         return characters, next_page
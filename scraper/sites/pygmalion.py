@@ -9,6 +9,9 @@ class PygmalionScraper(BaseScraper):
     https://pygmalion.chat/
     """
 
+    page_size_range = (25, 200)
+    default_page_size = 100
+
     async def scrape_character(self, character_url: str) -> Character:
         """
         Pygmalion scraper does not implement per-character scraping. Use scrape_site.
@@ -21,7 +24,7 @@ class PygmalionScraper(BaseScraper):
         self, site_url: str, cursor: ScraperCursorType = None
     ) -> tuple[list[HttpUrl] | list[Character], ScraperCursorType]:
         page = cursor or 1
-        page_size = 100
+        page_size = cast(int, self.page_size)
         api_url = "https://server.pygmalion.chat/galatea.v1.PublicCharacterService/CharacterSearch"
 
         response = await self.http_client.post(
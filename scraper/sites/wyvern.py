@@ -9,6 +9,9 @@ class WyvernScraper(BaseScraper):
     https://wyvern.chat/
     """
 
+    page_size_range = (25, 200)
+    default_page_size = 100
+
     async def scrape_character(self, character_url: str) -> Character:
         """
         Wyvern scraper does not implement per-character scraping. Use scrape_site.
@@ -21,8 +24,7 @@ class WyvernScraper(BaseScraper):
         self, site_url: str, cursor: ScraperCursorType = None
     ) -> tuple[list[HttpUrl] | list[Character], ScraperCursorType]:
         page = cursor or 1
-        limit = 100
-        api_url = f"https://api.wyvern.chat/exploreSearch/characters?page={page}&limit={limit}&sort=created_at&order=DESC"
+        api_url = f"https://api.wyvern.chat/exploreSearch/characters?page={page}&limit={self.page_size}&sort=created_at&order=DESC"
 
         response = await self.http_client.get(
             api_url,
@@ -47,6 +49,9 @@ class WyvernScraper(BaseScraper):
             f"Scraped '{api_url}': {response.status_code}, {response.text[:100]}{'...' if len(response.text) > 100 else ''}"
         )
         response.raise_for_status()
+        unchanged, cached_next_page = self.page_unchanged(response)
+        if unchanged:
+            return [], cached_next_page
         payload = response.json()
 
         items = payload.get("results", []) or []
@@ -104,4 +109,5 @@ class WyvernScraper(BaseScraper):
             )
 
         next_page: int | None = page + 1 if payload.get("hasMore") else None
+        self.remember_page(response, next_page)
         return characters, next_page
@@ -0,0 +1,5 @@
+from .base import Filter, Storage
+from .sqlite_storage import SQLiteStorage
+from .supabase_storage import SupabaseStorage
+
+__all__ = ["Filter", "Storage", "SQLiteStorage", "SupabaseStorage"]
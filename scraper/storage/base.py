@@ -0,0 +1,44 @@
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Any, Literal, NamedTuple
+
+
+class Filter(NamedTuple):
+    """A column condition, e.g. `Filter("name", "neq", "")` or `Filter("minhash", "is_null")`."""
+
+    column: str
+    operator: Literal["eq", "neq", "in", "is_null", "not_null"]
+    value: Any = None
+
+
+class Storage(ABC):
+    """
+    Table-level operations the CRUD functions are written against.
+
+    Implementations must follow PostgREST semantics: `upsert` inserts rows or, on a
+    conflict over `on_conflict`, updates the columns present in the payload, and fails
+    if two rows in one payload target the same conflict key. Database functions defined
+    in the migrations are called through `rpc`.
+    """
+
+    @abstractmethod
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Sequence[Filter] = (),
+        order_by: str | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+        offset: int | None = None,
+    ) -> list[dict[str, Any]]: ...
+
+    @abstractmethod
+    async def upsert(
+        self, table: str, rows: list[dict[str, Any]], on_conflict: str
+    ) -> list[dict[str, Any]]:
+        """Upsert rows and return them as stored."""
+        ...
+
+    @abstractmethod
+    async def rpc(self, function: str, params: dict[str, Any]) -> Any: ...
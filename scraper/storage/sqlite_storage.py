@@ -0,0 +1,1021 @@
+import json
+import math
+import re
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from scraper.storage.base import Filter, Storage
+
+# Mirrors the tables in supabase/migrations that the scraper reads and writes
+SCHEMA = """
+create table if not exists sites (
+  id text primary key,
+  name text not null,
+  url text not null,
+  is_enabled integer not null default 1,
+  created_at text not null default current_timestamp
+);
+
+create table if not exists creators (
+  id text primary key,
+  name text not null,
+  image_url text,
+  mirrored_image_url text,
+  urls text not null default '[]',
+  site_id text not null references sites(id) on delete cascade,
+  site_unique_identifier text not null,
+  follower_count integer,
+  created_at text not null default current_timestamp,
+  unique (site_id, site_unique_identifier)
+);
+
+create table if not exists characters (
+  id text primary key,
+  name text not null,
+  description text not null,
+  url text not null unique,
+  image_url text not null,
+  mirrored_image_url text,
+  chat_count integer,
+  message_count integer,
+  like_count integer,
+  token_count integer,
+  creator_id text not null references creators(id) on delete cascade,
+  cluster_id text,
+  minhash blob,
+  tagging_priority real not null default 0,
+  tagged_at text,
+  trending_score real,
+  created_at text not null default current_timestamp
+);
+
+create index if not exists characters_creator_id_idx on characters(creator_id);
+create index if not exists characters_image_url_idx on characters(image_url);
+create index if not exists characters_cluster_id_idx on characters(cluster_id);
+create index if not exists characters_tagging_queue_idx
+  on characters(tagging_priority desc, id desc)
+  where tagged_at is null and name <> '' and description <> '';
+create index if not exists characters_trending_idx
+  on characters(trending_score desc) where trending_score is not null;
+
+create table if not exists tags (
+  id text primary key,
+  name text not null,
+  type integer not null,
+  unique (name, type)
+);
+
+create table if not exists character_tags (
+  character_id text not null references characters(id) on delete cascade,
+  tag_id text not null references tags(id) on delete cascade,
+  primary key (character_id, tag_id)
+);
+
+create index if not exists character_tags_tag_id_idx on character_tags(tag_id);
+
+create table if not exists image_sources (
+  source_url text primary key,
+  etag text,
+  last_modified text,
+  content_hash text,
+  mirrored_url text,
+  fetched_at text,
+  failure_count integer not null default 0
+);
+
+create trigger if not exists characters_reset_mirrored_image_url
+  after update of image_url on characters
+  for each row when new.image_url is not old.image_url
+  begin
+    update characters set mirrored_image_url = null where id = new.id;
+  end;
+
+create trigger if not exists creators_reset_mirrored_image_url
+  after update of image_url on creators
+  for each row when new.image_url is not old.image_url
+  begin
+    update creators set mirrored_image_url = null where id = new.id;
+  end;
+
+create table if not exists character_minhash_buckets (
+  band integer not null,
+  bucket integer not null,
+  character_id text not null references characters(id) on delete cascade,
+  primary key (band, bucket, character_id)
+);
+
+create index if not exists character_minhash_buckets_character_id_idx
+  on character_minhash_buckets(character_id);
+
+create trigger if not exists characters_insert_tagging_priority
+  after insert on characters
+  for each row
+  begin
+    update characters
+    set tagging_priority = character_tagging_priority(
+      new.like_count, new.chat_count, new.created_at
+    )
+    where id = new.id;
+  end;
+
+create trigger if not exists characters_update_tagging_priority
+  after update of like_count, chat_count on characters
+  for each row
+  begin
+    update characters
+    set tagging_priority = character_tagging_priority(
+      new.like_count, new.chat_count, new.created_at
+    )
+    where id = new.id;
+  end;
+
+create trigger if not exists character_tags_mark_tagged
+  after insert on character_tags
+  for each row
+  begin
+    update characters set tagged_at = current_timestamp
+    where id = new.character_id and tagged_at is null;
+  end;
+
+create table if not exists site_page_tuning (
+  site_id text primary key references sites(id) on delete cascade,
+  page_size integer,
+  timeout_seconds real,
+  observations text not null default '{}',
+  updated_at text not null default current_timestamp
+);
+
+create table if not exists site_crawl_schedule (
+  site_id text primary key references sites(id) on delete cascade,
+  next_crawl_at text,
+  max_pages integer,
+  new_per_hour real,
+  seconds_per_page real,
+  characters_per_page real,
+  full_crawl_pages integer,
+  last_crawl_at text,
+  last_full_crawl_at text,
+  failed_crawls integer not null default 0,
+  last_failed_at text,
+  updated_at text not null default current_timestamp
+);
+
+create table if not exists jobs (
+  id text primary key,
+  kind text not null,
+  key text not null,
+  payload text not null default '{}',
+  priority real not null default 0,
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  max_attempts integer not null default 3,
+  leased_by text,
+  lease_expires_at text,
+  last_error text,
+  created_at text not null default current_timestamp,
+  updated_at text not null default current_timestamp,
+  completed_at text,
+  unique (kind, key)
+);
+
+create index if not exists jobs_pending_idx
+  on jobs(kind, priority desc, created_at) where status = 'pending';
+
+create trigger if not exists characters_reset_minhash
+  after update of description on characters
+  for each row when new.description is not old.description
+  begin
+    update characters set minhash = null where id = new.id;
+  end;
+
+create table if not exists tag_counts (
+  tag_id text primary key references tags(id) on delete cascade,
+  character_count integer not null default 0
+);
+
+create table if not exists tag_site_counts (
+  tag_id text not null references tags(id) on delete cascade,
+  site_id text not null references sites(id) on delete cascade,
+  character_count integer not null default 0,
+  primary key (tag_id, site_id)
+);
+
+create trigger if not exists character_tags_count_inserted
+  after insert on character_tags
+  for each row
+  begin
+    insert into tag_counts (tag_id, character_count) values (new.tag_id, 1)
+    on conflict (tag_id) do update set character_count = character_count + 1;
+    insert into tag_site_counts (tag_id, site_id, character_count)
+    select new.tag_id, cr.site_id, 1
+    from characters c join creators cr on cr.id = c.creator_id
+    where c.id = new.character_id
+    on conflict (tag_id, site_id) do update set character_count = character_count + 1;
+  end;
+
+create trigger if not exists character_tags_count_deleted
+  after delete on character_tags
+  for each row
+  begin
+    update tag_counts set character_count = character_count - 1
+    where tag_id = old.tag_id;
+    update tag_site_counts set character_count = character_count - 1
+    where tag_id = old.tag_id and site_id = (
+      select cr.site_id from characters c join creators cr on cr.id = c.creator_id
+      where c.id = old.character_id
+    );
+  end;
+
+create trigger if not exists characters_uncount_tag_sites
+  before delete on characters
+  for each row
+  begin
+    update tag_site_counts set character_count = character_count - 1
+    where site_id = (select site_id from creators where id = old.creator_id)
+      and tag_id in (select tag_id from character_tags where character_id = old.id);
+  end;
+
+create trigger if not exists characters_move_tag_site_counts
+  after update of creator_id on characters
+  for each row when new.creator_id is not old.creator_id
+  begin
+    update tag_site_counts set character_count = character_count - 1
+    where site_id = (select site_id from creators where id = old.creator_id)
+      and site_id is not (select site_id from creators where id = new.creator_id)
+      and tag_id in (select tag_id from character_tags where character_id = new.id);
+    insert into tag_site_counts (tag_id, site_id, character_count)
+    select ct.tag_id, ncr.site_id, 1
+    from character_tags ct, creators ocr, creators ncr
+    where ct.character_id = new.id
+      and ocr.id = old.creator_id and ncr.id = new.creator_id
+      and ncr.site_id is not ocr.site_id
+    on conflict (tag_id, site_id) do update set character_count = character_count + 1;
+  end;
+
+create table if not exists character_stat_snapshots (
+  character_id text not null references characters(id) on delete cascade,
+  captured_at text not null default current_timestamp,
+  chat_delta integer not null default 0,
+  message_delta integer not null default 0,
+  like_delta integer not null default 0
+);
+
+create index if not exists character_stat_snapshots_character_id_idx
+  on character_stat_snapshots(character_id, captured_at);
+
+create trigger if not exists characters_record_inserted_stats
+  after insert on characters
+  for each row
+  when coalesce(new.chat_count, 0) <> 0 or coalesce(new.message_count, 0) <> 0
+    or coalesce(new.like_count, 0) <> 0
+  begin
+    insert into character_stat_snapshots (character_id, chat_delta, message_delta, like_delta)
+    values (
+      new.id, coalesce(new.chat_count, 0), coalesce(new.message_count, 0),
+      coalesce(new.like_count, 0)
+    );
+  end;
+
+create trigger if not exists characters_record_updated_stats
+  after update of chat_count, message_count, like_count on characters
+  for each row
+  when coalesce(new.chat_count, 0) <> coalesce(old.chat_count, 0)
+    or coalesce(new.message_count, 0) <> coalesce(old.message_count, 0)
+    or coalesce(new.like_count, 0) <> coalesce(old.like_count, 0)
+  begin
+    insert into character_stat_snapshots (character_id, chat_delta, message_delta, like_delta)
+    values (
+      new.id,
+      coalesce(new.chat_count, 0) - coalesce(old.chat_count, 0),
+      coalesce(new.message_count, 0) - coalesce(old.message_count, 0),
+      coalesce(new.like_count, 0) - coalesce(old.like_count, 0)
+    );
+    update characters
+    set trending_score = character_trending_score(
+      old.trending_score,
+      2 * max(coalesce(new.like_count, 0) - coalesce(old.like_count, 0), 0)
+        + max(coalesce(new.chat_count, 0) - coalesce(old.chat_count, 0), 0),
+      current_timestamp
+    )
+    where id = new.id;
+  end;
+"""
+
+# Postgres array columns, stored as JSON text
+JSON_COLUMNS = {
+    "creators": {"urls"},
+    "jobs": {"payload"},
+    "site_page_tuning": {"observations"},
+}
+# Tables whose uuid primary key is filled in by a database default in Postgres
+GENERATED_ID_TABLES = {"sites", "creators", "characters", "tags"}
+
+IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+# Half-life of growth in characters' trending scores
+TRENDING_HALF_LIFE_SECONDS = 3 * 24 * 3600
+
+
+def _character_tagging_priority(
+    like_count: int | None, chat_count: int | None, created_at: str
+) -> float:
+    """Same as the character_tagging_priority database function."""
+    created = datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc)
+    age_seconds = max((datetime.now(timezone.utc) - created).total_seconds(), 0)
+    return (
+        2 * math.log1p(max(like_count or 0, 0))
+        + math.log1p(max(chat_count or 0, 0))
+        + 3 * 2 ** (-age_seconds / 2592000)
+    )
+
+
+def _character_trending_score(
+    score: float | None, growth: float, at: str
+) -> float | None:
+    """Same as the character_trending_score database function."""
+    if growth <= 0:
+        return score
+    added = math.log(growth) + _trending_half_lives(
+        datetime.fromisoformat(at).replace(tzinfo=timezone.utc)
+    ) * math.log(2)
+    if score is None:
+        return added
+    return max(score, added) + math.log1p(math.exp(-abs(score - added)))
+
+
+def _trending_half_lives(at: datetime) -> float:
+    return (at.timestamp() - 1735689600) / TRENDING_HALF_LIFE_SECONDS
+
+
+def _quote(identifier: str) -> str:
+    if not IDENTIFIER.match(identifier):
+        raise ValueError(f"Invalid identifier: {identifier!r}")
+    return f'"{identifier}"'
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage in a local SQLite database (":memory:" by default), for running and
+    benchmarking the pipeline without a Supabase project.
+
+    Upserts are one multi-row `INSERT ... ON CONFLICT DO UPDATE` per call and, like
+    Postgres, reject payloads that would update the same row twice. Every database
+    function the scraper calls is implemented; MinHash signatures are stored as their
+    "\\x"-prefixed hex text.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function(
+            "character_tagging_priority",
+            3,
+            _character_tagging_priority,
+        )
+        self.connection.create_function(
+            "character_trending_score",
+            3,
+            _character_trending_score,
+            deterministic=True,
+        )
+        self.connection.execute("pragma foreign_keys = on")
+        self.connection.execute("pragma journal_mode = wal")
+        self.connection.executescript(SCHEMA)
+        # Database functions by name, called with their parameters as keywords
+        self._functions: dict[str, Callable[..., Any]] = {
+            "characters_for_tagging": self._characters_for_tagging,
+            "tag_usage_counts": self._tag_usage_counts,
+            "tag_facets": self._tag_facets,
+            "rebuild_tag_facet_counts": self._rebuild_tag_facet_counts,
+            "trending_characters": self._trending_characters,
+            "character_stat_history": self._character_stat_history,
+            "maintain_character_stat_partitions": self._maintain_character_stat_partitions,
+            "merge_tags": self._merge_tags,
+            "minhash_candidates": self._minhash_candidates,
+            "save_minhash_clusters": self._save_minhash_clusters,
+            "propagate_cluster_tags": self._propagate_cluster_tags,
+            "mark_characters_tag_attempted": self._mark_characters_tag_attempted,
+            "image_sources_to_mirror": self._image_sources_to_mirror,
+            "image_sources_to_revalidate": self._image_sources_to_revalidate,
+            "apply_image_mirrors": self._apply_image_mirrors,
+            "enqueue_jobs": self._enqueue_jobs,
+            "claim_jobs": self._claim_jobs,
+            "heartbeat_jobs": self._heartbeat_jobs,
+            "finish_jobs": self._finish_jobs,
+            "job_queue_depth": self._job_queue_depth,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Sequence[Filter] = (),
+        order_by: str | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+        offset: int | None = None,
+    ) -> list[dict[str, Any]]:
+        column_list = (
+            "*"
+            if columns.strip() == "*"
+            else ", ".join(_quote(c.strip()) for c in columns.split(","))
+        )
+        sql = f"select {column_list} from {_quote(table)}"
+        conditions: list[str] = []
+        params: list[Any] = []
+        for column, operator, value in filters:
+            if operator == "eq":
+                conditions.append(f"{_quote(column)} = ?")
+                params.append(value)
+            elif operator == "neq":
+                conditions.append(f"{_quote(column)} <> ?")
+                params.append(value)
+            elif operator == "in":
+                conditions.append(
+                    f"{_quote(column)} in ({', '.join('?' for _ in value)})"
+                )
+                params.extend(value)
+            elif operator == "is_null":
+                conditions.append(f"{_quote(column)} is null")
+            elif operator == "not_null":
+                conditions.append(f"{_quote(column)} is not null")
+        if conditions:
+            sql += " where " + " and ".join(conditions)
+        if order_by:
+            sql += f" order by {_quote(order_by)} {'desc' if descending else 'asc'}"
+        if limit is not None or offset is not None:
+            sql += " limit ? offset ?"
+            params.extend([limit if limit is not None else -1, offset or 0])
+
+        rows = self.connection.execute(sql, params).fetchall()
+        return [self._decode(table, row) for row in rows]
+
+    async def upsert(
+        self, table: str, rows: list[dict[str, Any]], on_conflict: str
+    ) -> list[dict[str, Any]]:
+        if not rows:
+            return []
+
+        conflict_columns = [c.strip() for c in on_conflict.split(",")]
+        # Nulls never conflict, as in Postgres
+        conflict_keys = [
+            key
+            for key in (tuple(row.get(c) for c in conflict_columns) for row in rows)
+            if None not in key
+        ]
+        if len(set(conflict_keys)) < len(conflict_keys):
+            raise ValueError(
+                f"ON CONFLICT DO UPDATE command cannot affect row a second time ({table})"
+            )
+
+        # Like PostgREST, columns missing from some rows are written as null
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        generate_id = table in GENERATED_ID_TABLES and "id" not in columns
+        insert_columns = (["id"] if generate_id else []) + columns
+        update_columns = [c for c in columns if c not in conflict_columns]
+
+        placeholders = f"({', '.join('?' for _ in insert_columns)})"
+        sql = (
+            f"insert into {_quote(table)} ({', '.join(map(_quote, insert_columns))}) "
+            f"values {', '.join(placeholders for _ in rows)} "
+            f"on conflict ({', '.join(map(_quote, conflict_columns))}) do "
+        )
+        if update_columns:
+            sql += "update set " + ", ".join(
+                f"{_quote(c)} = excluded.{_quote(c)}" for c in update_columns
+            )
+        else:
+            # Keep `returning` working for existing rows
+            sql += f"update set {_quote(conflict_columns[0])} = excluded.{_quote(conflict_columns[0])}"
+        sql += " returning *"
+
+        params: list[Any] = []
+        for row in rows:
+            if generate_id:
+                params.append(str(uuid.uuid4()))
+            params.extend(self._encode(table, c, row.get(c)) for c in columns)
+
+        with self.connection:
+            returned = self.connection.execute(sql, params).fetchall()
+        return [self._decode(table, row) for row in returned]
+
+    async def rpc(self, function: str, params: dict[str, Any]) -> Any:
+        if function not in self._functions:
+            raise NotImplementedError(f"{function} is not available in SQLiteStorage")
+        return self._functions[function](**params)
+
+    def _characters_for_tagging(
+        self, p_after_priority: float | None, p_after_id: str | None, p_limit: int
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select c.id, c.name, c.description, c.cluster_id, c.tagging_priority
+            from characters c
+            where c.tagged_at is null
+              and c.name <> '' and c.description <> ''
+              and (? is null or (c.tagging_priority, c.id) < (?, ?))
+            order by c.tagging_priority desc, c.id desc
+            limit ?
+            """,
+            (p_after_id, p_after_priority, p_after_id, p_limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _tag_usage_counts(self) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select tags.id, tags.name, tags.type,
+              coalesce(tc.character_count, 0) as character_count
+            from tags
+            left join tag_counts tc on tc.tag_id = tags.id
+            order by character_count desc, tags.name
+            """
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _tag_facets(
+        self,
+        p_site_id: str | None = None,
+        p_type: int | None = None,
+        p_min_count: int = 1,
+        p_limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        counts = (
+            "select tag_id, character_count from tag_counts"
+            if p_site_id is None
+            else "select tag_id, character_count from tag_site_counts where site_id = :site_id"
+        )
+        rows = self.connection.execute(
+            f"""
+            select t.id, t.name, t.type, c.character_count
+            from ({counts}) c
+            join tags t on t.id = c.tag_id
+            where c.character_count >= max(:min_count, 1)
+              and (:type is null or t.type = :type)
+            order by c.character_count desc, t.name
+            limit coalesce(:limit, -1)
+            """,
+            {
+                "site_id": p_site_id,
+                "type": p_type,
+                "min_count": p_min_count,
+                "limit": p_limit,
+            },
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _rebuild_tag_facet_counts(self) -> dict[str, int]:
+        actual = {
+            "tag_counts": (
+                ("tag_id",),
+                """
+                select tag_id, count(*) as character_count
+                from character_tags group by tag_id
+                """,
+            ),
+            "tag_site_counts": (
+                ("tag_id", "site_id"),
+                """
+                select ct.tag_id, cr.site_id, count(*) as character_count
+                from character_tags ct
+                join characters c on c.id = ct.character_id
+                join creators cr on cr.id = c.creator_id
+                group by ct.tag_id, cr.site_id
+                """,
+            ),
+        }
+        fixed: dict[str, int] = {}
+        with self.connection:
+            for table, (key, query) in actual.items():
+                columns = ", ".join(key)
+                counts = {
+                    tuple(row[:-1]): row[-1]
+                    for row in self.connection.execute(query).fetchall()
+                }
+                stored = {
+                    tuple(row[:-1]): row[-1]
+                    for row in self.connection.execute(
+                        f"select {columns}, character_count from {table}"
+                    ).fetchall()
+                }
+                stale = [k for k in stored if k not in counts]
+                self.connection.executemany(
+                    f"delete from {table} where "
+                    + " and ".join(f"{column} = ?" for column in key),
+                    stale,
+                )
+                drifted = [
+                    (*k, count) for k, count in counts.items() if stored.get(k) != count
+                ]
+                self.connection.executemany(
+                    f"""
+                    insert into {table} ({columns}, character_count)
+                    values ({", ".join("?" for _ in key)}, ?)
+                    on conflict ({columns}) do update
+                    set character_count = excluded.character_count
+                    """,
+                    drifted,
+                )
+                fixed[f"{table}_fixed"] = len(drifted) + sum(
+                    1 for k in stale if stored[k] != 0
+                )
+        return fixed
+
+    def _trending_characters(
+        self, p_site_id: str | None = None, p_limit: int = 50
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select c.id, c.name, c.url, c.image_url, c.chat_count, c.message_count,
+              c.like_count, c.trending_score
+            from characters c
+            join creators cr on cr.id = c.creator_id
+            where c.trending_score is not null
+              and (:site_id is null or cr.site_id = :site_id)
+            order by c.trending_score desc
+            limit :limit
+            """,
+            {"site_id": p_site_id, "limit": p_limit},
+        ).fetchall()
+        now = _trending_half_lives(datetime.now(timezone.utc)) * math.log(2)
+        return [
+            {
+                **dict(row),
+                "growth_per_day": math.exp(row["trending_score"] - now)
+                * math.log(2)
+                * 86400
+                / TRENDING_HALF_LIFE_SECONDS,
+            }
+            for row in rows
+        ]
+
+    def _character_stat_history(
+        self, p_character_id: str, p_since: str | None = None
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select s.captured_at,
+              coalesce(c.chat_count, 0) - coalesce(sum(s.chat_delta) over later, 0)
+                as chat_count,
+              coalesce(c.message_count, 0) - coalesce(sum(s.message_delta) over later, 0)
+                as message_count,
+              coalesce(c.like_count, 0) - coalesce(sum(s.like_delta) over later, 0)
+                as like_count
+            from character_stat_snapshots s
+            join characters c on c.id = s.character_id
+            where s.character_id = :character_id
+              and (:since is null or s.captured_at >= datetime(:since))
+            window later as (
+              order by s.captured_at desc, s.rowid desc
+              rows between unbounded preceding and 1 preceding
+            )
+            order by s.captured_at, s.rowid
+            """,
+            {"character_id": p_character_id, "since": p_since},
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _maintain_character_stat_partitions(
+        self, p_months_ahead: int = 2, p_keep_months: int = 12
+    ) -> dict[str, list[str]]:
+        # One unpartitioned table here, so old history is deleted row by row
+        with self.connection:
+            self.connection.execute(
+                """
+                delete from character_stat_snapshots
+                where captured_at < datetime('now', 'start of month', ?)
+                """,
+                (f"-{p_keep_months} months",),
+            )
+        return {"created": [], "dropped": []}
+
+    def _merge_tags(
+        self, p_merges: list[dict[str, str]], p_renames: list[dict[str, str]]
+    ) -> None:
+        with self.connection:
+            for merge in p_merges:
+                self.connection.execute(
+                    """
+                    insert into character_tags (character_id, tag_id)
+                    select character_id, ? from character_tags where tag_id = ?
+                    on conflict do nothing
+                    """,
+                    (merge["target_id"], merge["source_id"]),
+                )
+                self.connection.execute(
+                    "delete from tags where id = ?", (merge["source_id"],)
+                )
+            self.connection.executemany(
+                "update tags set name = ? where id = ?",
+                [(rename["name"], rename["id"]) for rename in p_renames],
+            )
+
+    def _minhash_candidates(
+        self, p_buckets: list[dict[str, int]]
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select c.id, c.cluster_id, c.minhash
+            from characters c
+            where c.id in (
+              select b.character_id
+              from character_minhash_buckets b
+              join json_each(?) k
+                on b.band = json_extract(k.value, '$.band')
+                and b.bucket = json_extract(k.value, '$.bucket')
+            )
+            and c.minhash is not null
+            """,
+            (json.dumps(p_buckets),),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _save_minhash_clusters(
+        self, p_characters: list[dict[str, Any]], p_cluster_merges: list[dict[str, str]]
+    ) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "delete from character_minhash_buckets where character_id = ?",
+                [(character["id"],) for character in p_characters],
+            )
+            self.connection.executemany(
+                """
+                insert into character_minhash_buckets (band, bucket, character_id)
+                values (?, ?, ?)
+                on conflict do nothing
+                """,
+                [
+                    (bucket["band"], bucket["bucket"], character["id"])
+                    for character in p_characters
+                    for bucket in character["buckets"]
+                ],
+            )
+            self.connection.executemany(
+                "update characters set minhash = ?, cluster_id = ? where id = ?",
+                [
+                    (character["minhash"], character["cluster_id"], character["id"])
+                    for character in p_characters
+                ],
+            )
+            self.connection.executemany(
+                "update characters set cluster_id = ? where cluster_id = ?",
+                [
+                    (merge["to_cluster_id"], merge["from_cluster_id"])
+                    for merge in p_cluster_merges
+                ],
+            )
+
+    def _mark_characters_tag_attempted(self, p_character_ids: list[str]) -> None:
+        placeholders = ", ".join("?" for _ in p_character_ids)
+        with self.connection:
+            self.connection.execute(
+                f"""
+                update characters set tagged_at = current_timestamp
+                where tagged_at is null
+                  and (
+                    id in ({placeholders})
+                    or cluster_id in (
+                      select cluster_id from characters
+                      where id in ({placeholders}) and cluster_id is not null
+                    )
+                  )
+                """,
+                [*p_character_ids, *p_character_ids],
+            )
+
+    def _propagate_cluster_tags(self, p_character_ids: list[str] | None) -> int:
+        sources_filter = ""
+        params: list[Any] = []
+        if p_character_ids is not None:
+            sources_filter = f"and c.id in ({', '.join('?' for _ in p_character_ids)})"
+            params.extend(p_character_ids)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"""
+                insert into character_tags (character_id, tag_id)
+                with sources as (
+                  select min(c.id) as id, c.cluster_id
+                  from characters c
+                  where c.cluster_id is not null {sources_filter}
+                    and exists (select 1 from character_tags t where t.character_id = c.id)
+                  group by c.cluster_id
+                )
+                select m.id, ct.tag_id
+                from sources s
+                join characters m on m.cluster_id = s.cluster_id and m.id <> s.id
+                join character_tags ct on ct.character_id = s.id
+                where not exists (select 1 from character_tags t where t.character_id = m.id)
+                on conflict do nothing
+                """,
+                params,
+            )
+        # Not total_changes, which also counts the rows the character_tags triggers write
+        return cursor.rowcount
+
+    def _image_sources_to_mirror(
+        self, p_limit: int, p_after: str | None = None, p_max_failures: int = 3
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            with pending as (
+              select image_url from characters where mirrored_image_url is null
+              union
+              select image_url from creators
+              where mirrored_image_url is null and image_url is not null
+            )
+            select p.image_url as source_url, s.etag, s.last_modified, s.content_hash,
+              s.mirrored_url, s.fetched_at, coalesce(s.failure_count, 0) as failure_count
+            from pending p
+            left join image_sources s on s.source_url = p.image_url
+            where (:after is null or p.image_url > :after)
+              and coalesce(s.failure_count, 0) < :max_failures
+            order by p.image_url
+            limit :limit
+            """,
+            {"after": p_after, "max_failures": p_max_failures, "limit": p_limit},
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _image_sources_to_revalidate(
+        self, p_limit: int, p_revalidate_before: str, p_max_failures: int = 3
+    ) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select * from image_sources
+            where datetime(fetched_at) < datetime(?) and failure_count < ?
+            order by datetime(fetched_at)
+            limit ?
+            """,
+            (p_revalidate_before, p_max_failures, p_limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _apply_image_mirrors(self, p_mirrors: list[dict[str, str]]) -> None:
+        with self.connection:
+            for table in ("characters", "creators"):
+                self.connection.executemany(
+                    f"""
+                    update {table} set mirrored_image_url = ?
+                    where image_url = ? and mirrored_image_url is not ?
+                    """,
+                    [
+                        (
+                            mirror["mirrored_url"],
+                            mirror["source_url"],
+                            mirror["mirrored_url"],
+                        )
+                        for mirror in p_mirrors
+                    ],
+                )
+
+    def _enqueue_jobs(self, p_kind: str, p_jobs: list[dict[str, Any]]) -> int:
+        changes_before = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany(
+                """
+                insert into jobs (id, kind, key, payload, priority)
+                values (?, ?, ?, ?, ?)
+                on conflict (kind, key) do update
+                set payload = excluded.payload,
+                  priority = excluded.priority,
+                  status = 'pending',
+                  attempts = case when jobs.status = 'done' then 0 else jobs.attempts end,
+                  leased_by = null,
+                  lease_expires_at = null,
+                  last_error = null,
+                  completed_at = null,
+                  updated_at = current_timestamp
+                where jobs.status in ('done', 'failed')
+                """,
+                [
+                    (
+                        str(uuid.uuid4()),
+                        p_kind,
+                        job["key"],
+                        json.dumps(job.get("payload") or {}),
+                        job.get("priority") or 0,
+                    )
+                    for job in p_jobs
+                ],
+            )
+        return self.connection.total_changes - changes_before
+
+    def _claim_jobs(
+        self, p_kind: str, p_worker: str, p_limit: int, p_lease_seconds: int
+    ) -> list[dict[str, Any]]:
+        # A single connection serializes claims, so there is nothing to skip-lock
+        now = datetime.now(timezone.utc)
+        expires_at = (now + timedelta(seconds=p_lease_seconds)).isoformat()
+        with self.connection:
+            self.connection.execute(
+                """
+                update jobs
+                set status = 'failed', last_error = 'Lease expired', leased_by = null
+                where kind = ? and status = 'running' and lease_expires_at < ?
+                  and attempts >= max_attempts
+                """,
+                (p_kind, now.isoformat()),
+            )
+            rows = self.connection.execute(
+                """
+                update jobs
+                set status = 'running', attempts = attempts + 1, leased_by = ?,
+                  lease_expires_at = ?, updated_at = current_timestamp
+                where id in (
+                  select id from jobs
+                  where kind = ?
+                    and (status = 'pending' or (status = 'running' and lease_expires_at < ?))
+                  order by priority desc, created_at
+                  limit ?
+                )
+                returning *
+                """,
+                (p_worker, expires_at, p_kind, now.isoformat(), p_limit),
+            ).fetchall()
+        jobs = [self._decode("jobs", row) for row in rows]
+        return sorted(jobs, key=lambda job: (-job["priority"], job["created_at"]))
+
+    def _heartbeat_jobs(
+        self, p_job_ids: list[str], p_worker: str, p_lease_seconds: int
+    ) -> list[str]:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=p_lease_seconds)
+        with self.connection:
+            rows = self.connection.execute(
+                f"""
+                update jobs
+                set lease_expires_at = ?, updated_at = current_timestamp
+                where id in ({", ".join("?" for _ in p_job_ids)})
+                  and leased_by = ? and status = 'running'
+                returning id
+                """,
+                (expires_at.isoformat(), *p_job_ids, p_worker),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def _finish_jobs(
+        self,
+        p_job_ids: list[str],
+        p_worker: str,
+        p_outcome: str,
+        p_error: str | None = None,
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                f"""
+                update jobs
+                set status = case
+                    when ? = 'done' then 'done'
+                    when ? = 'abandoned' then 'failed'
+                    when ? = 'failed' and attempts >= max_attempts then 'failed'
+                    else 'pending'
+                  end,
+                  attempts = case when ? = 'released' then attempts - 1 else attempts end,
+                  last_error = case when ? in ('failed', 'abandoned') then ? else last_error end,
+                  completed_at = case when ? = 'done' then current_timestamp else completed_at end,
+                  leased_by = null,
+                  lease_expires_at = null,
+                  updated_at = current_timestamp
+                where id in ({", ".join("?" for _ in p_job_ids)})
+                  and leased_by = ? and status = 'running'
+                """,
+                (
+                    p_outcome,
+                    p_outcome,
+                    p_outcome,
+                    p_outcome,
+                    p_outcome,
+                    p_error,
+                    p_outcome,
+                    *p_job_ids,
+                    p_worker,
+                ),
+            )
+
+    def _job_queue_depth(self) -> list[dict[str, Any]]:
+        rows = self.connection.execute(
+            """
+            select kind, status, count(*) as jobs
+            from jobs
+            group by kind, status
+            order by kind, status
+            """
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _encode(self, table: str, column: str, value: Any) -> Any:
+        if column in JSON_COLUMNS.get(table, ()):
+            return json.dumps(value if value is not None else [])
+        return value
+
+    def _decode(self, table: str, row: sqlite3.Row) -> dict[str, Any]:
+        decoded = dict(row)
+        for column in JSON_COLUMNS.get(table, ()):
+            if column in decoded and decoded[column] is not None:
+                decoded[column] = json.loads(decoded[column])
+        return decoded
@@ -0,0 +1,59 @@
+from collections.abc import Sequence
+from typing import Any, cast
+
+from supabase import AsyncClient
+
+from scraper.storage.base import Filter, Storage
+
+
+class SupabaseStorage(Storage):
+    """Storage backed by the Supabase (PostgREST) API. This is the production backend."""
+
+    def __init__(self, client: AsyncClient):
+        self.client = client
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Sequence[Filter] = (),
+        order_by: str | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+        offset: int | None = None,
+    ) -> list[dict[str, Any]]:
+        query = self.client.table(table).select(columns)
+        for column, operator, value in filters:
+            if operator == "eq":
+                query = query.eq(column, value)
+            elif operator == "neq":
+                query = query.neq(column, value)
+            elif operator == "in":
+                query = query.in_(column, value)
+            elif operator == "is_null":
+                query = query.is_(column, "null")
+            elif operator == "not_null":
+                query = query.not_.is_(column, "null")
+        if order_by:
+            query = query.order(order_by, desc=descending)
+        if offset is not None:
+            query = query.range(offset, offset + (limit or 1000) - 1)
+        elif limit is not None:
+            query = query.limit(limit)
+
+        response = await query.execute()
+        return cast(list[dict[str, Any]], response.data)
+
+    async def upsert(
+        self, table: str, rows: list[dict[str, Any]], on_conflict: str
+    ) -> list[dict[str, Any]]:
+        response = (
+            await self.client.table(table)
+            .upsert(rows, on_conflict=on_conflict)
+            .execute()
+        )
+        return cast(list[dict[str, Any]], response.data)
+
+    async def rpc(self, function: str, params: dict[str, Any]) -> Any:
+        response = await self.client.rpc(function, params).execute()
+        return response.data
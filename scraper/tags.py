@@ -0,0 +1,118 @@
+import re
+import unicodedata
+from collections.abc import Iterable
+from typing import Any
+
+from scraper.constants import TAG_NORMALIZATION_MAP, TAG_STEM_EXCEPTIONS
+
+# Letters and digits of any script are kept, so "pokémon" and non-Latin tags survive
+NON_TAG_CHARACTERS = re.compile(r"[^\w&+' ]+")
+
+
+def normalize_tag_text(name: str) -> str:
+    """Lowercase, turn separators into spaces and drop stray punctuation."""
+    text = unicodedata.normalize("NFKC", name).lower().strip()
+    text = text.replace("-", " ").replace("_", " ").replace("/", " ")
+    return " ".join(NON_TAG_CHARACTERS.sub("", text).split())
+
+
+def stem_word(word: str) -> str:
+    """Strip English plural endings. Only used to build lookup keys, never shown."""
+    if len(word) <= 3 or word in TAG_STEM_EXCEPTIONS:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("lves"):
+        return word[:-3] + "f"
+    if word.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is", "os")):
+        return word[:-1]
+    return word
+
+
+def tag_key(text: str) -> str:
+    """Lookup key for normalized tag text: stemmed words with spacing removed."""
+    return "".join(stem_word(word) for word in text.split())
+
+
+class TagNormalizer:
+    """
+    Maps tag names onto a canonical vocabulary.
+
+    A name is resolved, in order, through the curated TAG_NORMALIZATION_MAP and an exact
+    match on its stemmed key, so plurals, spacing and separators fold together. Names a
+    single edit apart are left alone, since many are distinct tags ("kidnapper" and
+    "kidnapped"); known misspellings go in the curated map instead.
+
+    Names that match nothing become canonical themselves. Canonical names registered first
+    win ties, so seed the normalizer with the most-used tags first.
+    """
+
+    def __init__(self, canonical_names: Iterable[str] = ()):
+        self._canonical_by_key: dict[str, str] = {}
+        for name in canonical_names:
+            self.add(name)
+
+    def add(self, name: str) -> str:
+        """Register an existing tag name. Returns the canonical name it resolves to."""
+        key = tag_key(self._curated_text(name))
+        if key not in self._canonical_by_key:
+            self._canonical_by_key[key] = name
+        return self._canonical_by_key[key]
+
+    def normalize(self, name: str) -> str:
+        """
+        Resolve a tag name to its canonical form, registering it if it is new. Names
+        with nothing left after normalization resolve to "".
+        """
+        text = self._curated_text(name)
+        key = tag_key(text)
+        if not key:
+            return ""
+
+        canonical = self._canonical_by_key.get(key)
+        if canonical is not None:
+            return canonical
+
+        self._canonical_by_key[key] = text
+        return text
+
+    def _curated_text(self, name: str) -> str:
+        text = normalize_tag_text(name)
+        return TAG_NORMALIZATION_MAP.get(text, text)
+
+
+def plan_tag_merges(
+    tags: list[dict[str, Any]],
+) -> tuple[list[dict[str, str]], list[dict[str, str]]]:
+    """
+    Plan the backfill that collapses existing duplicate tags.
+
+    Expects tags with id, name and type, most-used first, so the most-used spelling in each
+    cluster becomes canonical unless a curated name applies. Returns merges as
+    `{"source_id", "target_id"}` and renames as `{"id", "name"}`.
+    """
+    normalizers: dict[int, TagNormalizer] = {}
+    clusters: dict[tuple[int, str], list[dict[str, Any]]] = {}
+    for tag in tags:
+        normalizer = normalizers.setdefault(tag["type"], TagNormalizer())
+        canonical = normalizer.normalize(tag["name"])
+        # Left as they are: there's no name to merge them under
+        if not canonical:
+            continue
+        clusters.setdefault((tag["type"], canonical), []).append(tag)
+
+    merges: list[dict[str, str]] = []
+    renames: list[dict[str, str]] = []
+    for (_, canonical), cluster in clusters.items():
+        target = next((tag for tag in cluster if tag["name"] == canonical), cluster[0])
+        if target["name"] != canonical:
+            renames.append({"id": target["id"], "name": canonical})
+        merges.extend(
+            {"source_id": tag["id"], "target_id": target["id"]}
+            for tag in cluster
+            if tag is not target
+        )
+
+    return merges, renames
@@ -0,0 +1 @@
+uv run python -m scraper.bench "$@"
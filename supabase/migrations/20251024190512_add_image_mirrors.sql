@@ -0,0 +1,137 @@
+-- Mirrored thumbnail URLs for character and creator avatars
+alter table public.characters add column mirrored_image_url text;
+alter table public.creators add column mirrored_image_url text;
+
+-- Partial indexes for finding avatars that still need to be mirrored
+create index if not exists characters_unmirrored_image_url_idx
+  on public.characters(image_url) where mirrored_image_url is null;
+create index if not exists creators_unmirrored_image_url_idx
+  on public.creators(image_url) where mirrored_image_url is null and image_url is not null;
+
+-- For applying a mirror to every character that shares a source image
+create index if not exists characters_image_url_idx on public.characters(image_url);
+
+-- One row per remote image URL, with the validators from the last fetch
+create table if not exists public.image_sources (
+  source_url text primary key,
+  etag text,
+  last_modified text,
+  -- SHA-256 of the original bytes; thumbnails are stored under this hash
+  content_hash text,
+  mirrored_url text,
+  fetched_at timestamptz,
+  failure_count integer not null default 0
+);
+
+create index if not exists image_sources_fetched_at_idx on public.image_sources(fetched_at);
+
+-- Internal bookkeeping, only accessed with the service role
+alter table public.image_sources enable row level security;
+
+-- When a scrape changes a row's avatar, its old mirror no longer applies
+create or replace function public.reset_mirrored_image_url()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.image_url is distinct from old.image_url then
+    new.mirrored_image_url := null;
+  end if;
+  return new;
+end;
+$$;
+
+create trigger characters_reset_mirrored_image_url
+  before update of image_url on public.characters
+  for each row execute procedure public.reset_mirrored_image_url();
+
+create trigger creators_reset_mirrored_image_url
+  before update of image_url on public.creators
+  for each row execute procedure public.reset_mirrored_image_url();
+
+-- Avatars that were never mirrored, in URL order after p_after, so the mirroring job
+-- pages through them by key. Sources that keep failing are skipped.
+create or replace function public.image_sources_to_mirror(
+  p_limit integer,
+  p_after text default null,
+  p_max_failures integer default 3
+)
+returns setof public.image_sources
+language sql
+stable
+as $$
+  with pending as (
+    select image_url from (
+      (
+        select distinct image_url from public.characters c
+        where mirrored_image_url is null and (p_after is null or image_url > p_after)
+          and not exists (
+            select 1 from public.image_sources s
+            where s.source_url = c.image_url and s.failure_count >= p_max_failures
+          )
+        order by image_url
+        limit p_limit
+      )
+      union
+      (
+        select distinct image_url from public.creators c
+        where mirrored_image_url is null and image_url is not null
+          and (p_after is null or image_url > p_after)
+          and not exists (
+            select 1 from public.image_sources s
+            where s.source_url = c.image_url and s.failure_count >= p_max_failures
+          )
+        order by image_url
+        limit p_limit
+      )
+    ) u
+    order by image_url
+    limit p_limit
+  )
+  select
+    p.image_url, s.etag, s.last_modified, s.content_hash, s.mirrored_url, s.fetched_at,
+    coalesce(s.failure_count, 0)
+  from pending p
+  left join public.image_sources s on s.source_url = p.image_url
+  order by p.image_url;
+$$;
+
+-- Mirrors last fetched before p_revalidate_before, oldest first. Fetching a source moves
+-- its fetched_at forward, so repeated calls move on by themselves.
+create or replace function public.image_sources_to_revalidate(
+  p_limit integer,
+  p_revalidate_before timestamptz,
+  p_max_failures integer default 3
+)
+returns setof public.image_sources
+language sql
+stable
+as $$
+  select * from public.image_sources
+  where fetched_at < p_revalidate_before and failure_count < p_max_failures
+  order by fetched_at
+  limit p_limit;
+$$;
+
+-- Point every character and creator that uses a source image at its mirror
+create or replace function public.apply_image_mirrors(p_mirrors jsonb)
+returns void
+language sql
+as $$
+  update public.characters c
+  set mirrored_image_url = m.mirrored_url
+  from jsonb_to_recordset(p_mirrors) as m(source_url text, mirrored_url text)
+  where c.image_url = m.source_url
+    and c.mirrored_image_url is distinct from m.mirrored_url;
+
+  update public.creators c
+  set mirrored_image_url = m.mirrored_url
+  from jsonb_to_recordset(p_mirrors) as m(source_url text, mirrored_url text)
+  where c.image_url = m.source_url
+    and c.mirrored_image_url is distinct from m.mirrored_url;
+$$;
+
+-- Public bucket for the thumbnails
+insert into storage.buckets (id, name, public)
+values ('avatars', 'avatars', true)
+on conflict (id) do nothing;
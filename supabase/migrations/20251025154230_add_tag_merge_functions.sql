@@ -0,0 +1,42 @@
+-- Every tag with its character count, most-used first. Returned as one JSON array so the
+-- result isn't cut off by the API row limit.
+create or replace function public.tag_usage_counts()
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(t order by t.character_count desc, t.name), '[]'::jsonb)
+  from (
+    select tags.id, tags.name, tags.type, count(ct.character_id) as character_count
+    from public.tags
+    left join public.character_tags ct on ct.tag_id = tags.id
+    group by tags.id
+  ) t;
+$$;
+
+-- Merge duplicate tags: move each source tag's characters onto its target, delete the
+-- sources, then apply renames. Runs as one transaction.
+create or replace function public.merge_tags(p_merges jsonb, p_renames jsonb)
+returns void
+language plpgsql
+as $$
+begin
+  create temp table tag_merges on commit drop as
+    select source_id, target_id
+    from jsonb_to_recordset(p_merges) as m(source_id uuid, target_id uuid);
+
+  insert into public.character_tags (character_id, tag_id)
+  select ct.character_id, m.target_id
+  from public.character_tags ct
+  join tag_merges m on m.source_id = ct.tag_id
+  on conflict (character_id, tag_id) do nothing;
+
+  -- Cascades to the source tags' character_tags rows
+  delete from public.tags t using tag_merges m where t.id = m.source_id;
+
+  update public.tags t
+  set name = r.name
+  from jsonb_to_recordset(p_renames) as r(id uuid, name text)
+  where t.id = r.id;
+end;
+$$;
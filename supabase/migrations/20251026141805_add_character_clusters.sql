@@ -0,0 +1,125 @@
+-- Near-duplicate clusters (forks and cross-posts) found with MinHash/LSH.
+-- cluster_id is the ID of one of the cluster's characters; singletons point at themselves.
+alter table public.characters add column cluster_id uuid;
+alter table public.characters add column minhash bytea;
+
+create index if not exists characters_cluster_id_idx on public.characters(cluster_id);
+-- Characters still waiting to be signed and clustered
+create index if not exists characters_unsigned_idx on public.characters(id) where minhash is null;
+
+-- LSH index: one row per (band, bucket) a character's signature hashes into
+create table if not exists public.character_minhash_buckets (
+  band smallint not null,
+  bucket bigint not null,
+  character_id uuid not null references public.characters(id) on delete cascade,
+  primary key (band, bucket, character_id)
+);
+
+create index if not exists character_minhash_buckets_character_id_idx
+  on public.character_minhash_buckets(character_id);
+
+-- Internal index, only accessed with the service role
+alter table public.character_minhash_buckets enable row level security;
+
+-- A changed description needs a new signature; the cluster is kept until then
+create or replace function public.reset_character_minhash()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.description is distinct from old.description then
+    new.minhash := null;
+  end if;
+  return new;
+end;
+$$;
+
+create trigger characters_reset_minhash
+  before update of description on public.characters
+  for each row execute procedure public.reset_character_minhash();
+
+-- Signed characters sharing any of the given (band, bucket) keys
+create or replace function public.minhash_candidates(p_buckets jsonb)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(jsonb_build_object(
+    'id', c.id, 'cluster_id', c.cluster_id, 'minhash', c.minhash
+  )), '[]'::jsonb)
+  from public.characters c
+  where c.id in (
+    select b.character_id
+    from public.character_minhash_buckets b
+    join jsonb_to_recordset(p_buckets) as k(band smallint, bucket bigint)
+      on k.band = b.band and k.bucket = b.bucket
+  )
+  and c.minhash is not null;
+$$;
+
+-- Store signatures, LSH buckets and cluster assignments, then re-point absorbed clusters
+create or replace function public.save_minhash_clusters(p_characters jsonb, p_cluster_merges jsonb)
+returns void
+language plpgsql
+as $$
+begin
+  create temp table minhash_rows on commit drop as
+    select id, decode(substr(minhash, 3), 'hex') as minhash, cluster_id, buckets
+    from jsonb_to_recordset(p_characters)
+      as r(id uuid, minhash text, cluster_id uuid, buckets jsonb);
+
+  delete from public.character_minhash_buckets b using minhash_rows r
+  where b.character_id = r.id;
+
+  insert into public.character_minhash_buckets (band, bucket, character_id)
+  select k.band, k.bucket, r.id
+  from minhash_rows r, jsonb_to_recordset(r.buckets) as k(band smallint, bucket bigint)
+  on conflict do nothing;
+
+  update public.characters c
+  set minhash = r.minhash, cluster_id = r.cluster_id
+  from minhash_rows r
+  where c.id = r.id;
+
+  update public.characters c
+  set cluster_id = m.to_cluster_id
+  from jsonb_to_recordset(p_cluster_merges) as m(from_cluster_id uuid, to_cluster_id uuid)
+  where c.cluster_id = m.from_cluster_id;
+end;
+$$;
+
+-- Copy tags from one tagged member of each cluster to the members that have none.
+-- With p_character_ids, only those characters are used as sources.
+create or replace function public.propagate_cluster_tags(p_character_ids uuid[] default null)
+returns integer
+language plpgsql
+as $$
+declare
+  inserted integer;
+begin
+  with sources as (
+    select distinct on (c.cluster_id) c.id, c.cluster_id
+    from public.characters c
+    where c.cluster_id is not null
+      and (p_character_ids is null or c.id = any(p_character_ids))
+      and exists (select 1 from public.character_tags t where t.character_id = c.id)
+    order by c.cluster_id, c.id
+  )
+  insert into public.character_tags (character_id, tag_id)
+  select m.id, ct.tag_id
+  from sources s
+  join public.characters m on m.cluster_id = s.cluster_id and m.id <> s.id
+  join public.character_tags ct on ct.character_id = s.id
+  where not exists (select 1 from public.character_tags t where t.character_id = m.id)
+  on conflict (character_id, tag_id) do nothing;
+
+  get diagnostics inserted = row_count;
+  return inserted;
+end;
+$$;
+
+-- Catalog with forks collapsed: the most-liked member stands in for its cluster
+create or replace view public.catalog_characters with (security_invoker = true) as
+select distinct on (coalesce(c.cluster_id, c.id)) c.*
+from public.characters c
+order by coalesce(c.cluster_id, c.id), c.like_count desc nulls last, c.created_at;
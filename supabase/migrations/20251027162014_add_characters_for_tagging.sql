@@ -0,0 +1,19 @@
+-- Untagged characters with a name and description, paged by ID. Returned as one JSON
+-- array so the page isn't cut off by the API row limit.
+create or replace function public.characters_for_tagging(p_after_id uuid default null, p_limit integer default 100)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(c order by c.id), '[]'::jsonb)
+  from (
+    select c.id, c.name, c.description, c.cluster_id
+    from public.characters c
+    where (p_after_id is null or c.id > p_after_id)
+      and c.name <> ''
+      and c.description <> ''
+      and not exists (select 1 from public.character_tags t where t.character_id = c.id)
+    order by c.id
+    limit p_limit
+  ) c;
+$$;
@@ -0,0 +1,112 @@
+-- Tagging queue: untagged characters are tagged most popular first, with a head start
+-- for new ones. tagging_priority is log-scaled likes and chats plus a recency bonus of up
+-- to 3 points that halves every 30 days of age, as of when the counts were last written
+-- (every crawl that sees the character), so popularity decides among older characters.
+-- tagged_at is set once a character has any tag, or by mark_characters_tag_attempted
+-- when the model found no usable tags for it.
+create or replace function public.character_tagging_priority(
+  p_like_count integer,
+  p_chat_count integer,
+  p_created_at timestamptz,
+  p_now timestamptz default now()
+)
+returns double precision
+language sql
+stable
+as $$
+  select 2 * ln(1 + greatest(coalesce(p_like_count, 0), 0))
+    + ln(1 + greatest(coalesce(p_chat_count, 0), 0))
+    + 3 * power(2, -greatest(extract(epoch from p_now - p_created_at), 0) / 2592000.0);
+$$;
+
+alter table public.characters add column tagging_priority double precision not null default 0;
+alter table public.characters add column tagged_at timestamptz;
+
+update public.characters
+set tagging_priority = public.character_tagging_priority(like_count, chat_count, created_at);
+
+update public.characters c
+set tagged_at = now()
+where exists (select 1 from public.character_tags t where t.character_id = c.id);
+
+-- The queue itself: only untagged characters that can be tagged are indexed
+create index if not exists characters_tagging_queue_idx
+  on public.characters(tagging_priority desc, id desc)
+  where tagged_at is null and name <> '' and description <> '';
+
+create or replace function public.set_character_tagging_priority()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.tagging_priority := public.character_tagging_priority(
+    new.like_count, new.chat_count, new.created_at
+  );
+  return new;
+end;
+$$;
+
+create trigger characters_set_tagging_priority
+  before insert or update of like_count, chat_count on public.characters
+  for each row execute procedure public.set_character_tagging_priority();
+
+create or replace function public.mark_characters_tagged()
+returns trigger
+language plpgsql
+as $$
+begin
+  update public.characters c
+  set tagged_at = now()
+  from (select distinct character_id from new_character_tags) n
+  where c.id = n.character_id and c.tagged_at is null;
+  return null;
+end;
+$$;
+
+create trigger character_tags_mark_tagged
+  after insert on public.character_tags
+  referencing new table as new_character_tags
+  for each statement execute procedure public.mark_characters_tagged();
+
+-- Untagged characters in queue order, paged by (tagging_priority, id) of the last row
+drop function if exists public.characters_for_tagging(uuid, integer);
+
+create or replace function public.characters_for_tagging(
+  p_after_priority double precision default null,
+  p_after_id uuid default null,
+  p_limit integer default 100
+)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(c order by c.tagging_priority desc, c.id desc), '[]'::jsonb)
+  from (
+    select c.id, c.name, c.description, c.cluster_id, c.tagging_priority
+    from public.characters c
+    where c.tagged_at is null
+      and c.name <> ''
+      and c.description <> ''
+      and (p_after_id is null or (c.tagging_priority, c.id) < (p_after_priority, p_after_id))
+    order by c.tagging_priority desc, c.id desc
+    limit p_limit
+  ) c;
+$$;
+
+-- Take characters the model found no usable tags for out of the queue, along with the
+-- rest of their clusters, so later runs don't pay to tag them again
+create or replace function public.mark_characters_tag_attempted(p_character_ids uuid[])
+returns void
+language sql
+as $$
+  update public.characters c
+  set tagged_at = now()
+  where c.tagged_at is null
+    and (
+      c.id = any(p_character_ids)
+      or c.cluster_id in (
+        select cluster_id from public.characters
+        where id = any(p_character_ids) and cluster_id is not null
+      )
+    );
+$$;
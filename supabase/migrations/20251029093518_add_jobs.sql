@@ -0,0 +1,162 @@
+-- Work queue shared by scraping and tagging workers. A job is identified by (kind, key),
+-- so enqueueing work that is already pending or running is a no-op. Workers claim jobs
+-- with a lease that they renew while working; jobs whose lease expires are claimed again.
+create table if not exists public.jobs (
+  id uuid primary key default extensions.uuid_generate_v4(),
+  kind text not null,
+  key text not null,
+  payload jsonb not null default '{}'::jsonb,
+  -- Higher runs first
+  priority double precision not null default 0,
+  status text not null default 'pending' check (status in ('pending', 'running', 'done', 'failed')),
+  attempts integer not null default 0,
+  max_attempts integer not null default 3,
+  leased_by text,
+  lease_expires_at timestamptz,
+  last_error text,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now(),
+  completed_at timestamptz,
+  constraint jobs_kind_key_unique unique (kind, key)
+);
+
+-- What claim_jobs scans: pending jobs by priority, and running jobs by lease expiry
+create index if not exists jobs_pending_idx
+  on public.jobs(kind, priority desc, created_at) where status = 'pending';
+create index if not exists jobs_running_idx
+  on public.jobs(kind, lease_expires_at) where status = 'running';
+
+-- Internal queue, only accessed with the service role
+alter table public.jobs enable row level security;
+
+-- Add jobs given as [{key, payload, priority}]. Jobs that already finished are queued
+-- again; pending and running ones are left alone. Done jobs start over with fresh
+-- attempts, while failed ones keep theirs, so each time one is queued again it gets a
+-- single further attempt. Returns how many were queued.
+create or replace function public.enqueue_jobs(p_kind text, p_jobs jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  queued integer;
+begin
+  insert into public.jobs (kind, key, payload, priority)
+  select p_kind, j.key, coalesce(j.payload, '{}'::jsonb), coalesce(j.priority, 0)
+  from jsonb_to_recordset(p_jobs) as j(key text, payload jsonb, priority double precision)
+  on conflict (kind, key) do update
+  set payload = excluded.payload,
+    priority = excluded.priority,
+    status = 'pending',
+    attempts = case when jobs.status = 'done' then 0 else jobs.attempts end,
+    leased_by = null,
+    lease_expires_at = null,
+    last_error = null,
+    completed_at = null,
+    updated_at = now()
+  where jobs.status in ('done', 'failed');
+
+  get diagnostics queued = row_count;
+  return queued;
+end;
+$$;
+
+-- Lease up to p_limit jobs to a worker, highest priority first. Jobs with an expired lease
+-- count as pending until they run out of attempts. Concurrent claims never return the
+-- same job: rows being claimed by another transaction are skipped, not waited for.
+create or replace function public.claim_jobs(
+  p_kind text, p_worker text, p_limit integer, p_lease_seconds integer
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  claimed jsonb;
+begin
+  update public.jobs
+  set status = 'failed', last_error = 'Lease expired', leased_by = null, updated_at = now()
+  where kind = p_kind
+    and status = 'running'
+    and lease_expires_at < now()
+    and attempts >= max_attempts;
+
+  with candidates as (
+    select id
+    from public.jobs
+    where kind = p_kind
+      and (status = 'pending' or (status = 'running' and lease_expires_at < now()))
+    order by priority desc, created_at
+    limit p_limit
+    for update skip locked
+  ), updated as (
+    update public.jobs j
+    set status = 'running',
+      attempts = j.attempts + 1,
+      leased_by = p_worker,
+      lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+    from candidates c
+    where j.id = c.id
+    returning j.*
+  )
+  select coalesce(jsonb_agg(u order by u.priority desc, u.created_at), '[]'::jsonb)
+  into claimed
+  from updated u;
+
+  return claimed;
+end;
+$$;
+
+-- Renew a worker's leases. Returns the IDs it still holds; any others were lost to expiry.
+create or replace function public.heartbeat_jobs(
+  p_job_ids uuid[], p_worker text, p_lease_seconds integer
+)
+returns jsonb
+language sql
+as $$
+  with renewed as (
+    update public.jobs
+    set lease_expires_at = now() + make_interval(secs => p_lease_seconds), updated_at = now()
+    where id = any(p_job_ids) and leased_by = p_worker and status = 'running'
+    returning id
+  )
+  select coalesce(jsonb_agg(id), '[]'::jsonb) from renewed;
+$$;
+
+-- Finish leased jobs: 'done' marks them complete, 'failed' retries them until they run out
+-- of attempts, 'abandoned' fails them at once (for work retried on its own schedule), and
+-- 'released' hands them back without counting the attempt.
+create or replace function public.finish_jobs(
+  p_job_ids uuid[], p_worker text, p_outcome text, p_error text default null
+)
+returns void
+language sql
+as $$
+  update public.jobs
+  set status = case
+      when p_outcome = 'done' then 'done'
+      when p_outcome = 'abandoned' then 'failed'
+      when p_outcome = 'failed' and attempts >= max_attempts then 'failed'
+      else 'pending'
+    end,
+    attempts = case when p_outcome = 'released' then attempts - 1 else attempts end,
+    last_error = case when p_outcome in ('failed', 'abandoned') then p_error else last_error end,
+    completed_at = case when p_outcome = 'done' then now() else completed_at end,
+    leased_by = null,
+    lease_expires_at = null,
+    updated_at = now()
+  where id = any(p_job_ids) and leased_by = p_worker and status = 'running';
+$$;
+
+-- Queue depth: job counts by kind and status
+create or replace function public.job_queue_depth()
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(d order by d.kind, d.status), '[]'::jsonb)
+  from (
+    select kind, status, count(*) as jobs
+    from public.jobs
+    group by kind, status
+  ) d;
+$$;
@@ -0,0 +1,15 @@
+-- Listing page size and request timeout chosen for each site's next crawl, with the
+-- per-page-size measurements they were chosen from
+create table if not exists public.site_page_tuning (
+  site_id uuid primary key references public.sites(id) on delete cascade,
+  -- Null for sites whose server fixes the page size
+  page_size integer,
+  -- Null until a crawl has been measured, leaving the timeout to the scraper
+  timeout_seconds double precision,
+  -- {"<page size>": {runs, items_per_second, error_rate, bytes_per_page, slowest_page_seconds}}
+  observations jsonb not null default '{}'::jsonb,
+  updated_at timestamptz not null default now()
+);
+
+-- Internal crawler state, only accessed with the service role
+alter table public.site_page_tuning enable row level security;
@@ -0,0 +1,22 @@
+-- When and how deep each site is crawled next, chosen by the crawl scheduler from the
+-- site's rate of new characters and the cost of its previous crawls
+create table if not exists public.site_crawl_schedule (
+  site_id uuid primary key references public.sites(id) on delete cascade,
+  next_crawl_at timestamptz,
+  -- Null for a full crawl
+  max_pages integer,
+  -- Moving averages over previous crawls
+  new_per_hour double precision,
+  seconds_per_page double precision,
+  characters_per_page double precision,
+  full_crawl_pages integer,
+  last_crawl_at timestamptz,
+  last_full_crawl_at timestamptz,
+  -- Crawls failed in a row since the last one that finished
+  failed_crawls integer not null default 0,
+  last_failed_at timestamptz,
+  updated_at timestamptz not null default now()
+);
+
+-- Internal crawler state, only accessed with the service role
+alter table public.site_crawl_schedule enable row level security;
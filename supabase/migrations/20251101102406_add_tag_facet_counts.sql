@@ -0,0 +1,280 @@
+-- Character counts per tag and per (tag, site), kept current by triggers on
+-- character_tags and characters, so listing tags by count reads one row per tag instead
+-- of grouping the whole junction table.
+create table if not exists public.tag_counts (
+  tag_id uuid primary key references public.tags(id) on delete cascade,
+  character_count bigint not null default 0
+);
+
+create table if not exists public.tag_site_counts (
+  tag_id uuid not null references public.tags(id) on delete cascade,
+  site_id uuid not null references public.sites(id) on delete cascade,
+  character_count bigint not null default 0,
+  primary key (tag_id, site_id)
+);
+
+create index if not exists tag_counts_character_count_idx
+  on public.tag_counts(character_count desc);
+create index if not exists tag_site_counts_site_id_idx
+  on public.tag_site_counts(site_id, character_count desc);
+
+alter table public.tag_counts enable row level security;
+alter table public.tag_site_counts enable row level security;
+
+-- Derived from character_tags, so readable by everyone like it
+create policy "tag_counts_allow_select" on public.tag_counts
+  for select using (true);
+
+create policy "tag_site_counts_allow_select" on public.tag_site_counts
+  for select using (true);
+
+insert into public.tag_counts (tag_id, character_count)
+select tag_id, count(*) from public.character_tags group by tag_id;
+
+insert into public.tag_site_counts (tag_id, site_id, character_count)
+select ct.tag_id, cr.site_id, count(*)
+from public.character_tags ct
+join public.characters c on c.id = ct.character_id
+join public.creators cr on cr.id = c.creator_id
+group by ct.tag_id, cr.site_id;
+
+-- Counts are changed in key order, so concurrent writers don't deadlock on them
+create or replace function public.count_inserted_character_tags()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into public.tag_counts as tc (tag_id, character_count)
+  select tag_id, count(*)
+  from new_character_tags
+  group by tag_id
+  order by tag_id
+  on conflict (tag_id) do update
+  set character_count = tc.character_count + excluded.character_count;
+
+  insert into public.tag_site_counts as tsc (tag_id, site_id, character_count)
+  select n.tag_id, cr.site_id, count(*)
+  from new_character_tags n
+  join public.characters c on c.id = n.character_id
+  join public.creators cr on cr.id = c.creator_id
+  group by n.tag_id, cr.site_id
+  order by n.tag_id, cr.site_id
+  on conflict (tag_id, site_id) do update
+  set character_count = tsc.character_count + excluded.character_count;
+  return null;
+end;
+$$;
+
+create trigger character_tags_count_inserted
+  after insert on public.character_tags
+  referencing new table as new_character_tags
+  for each statement execute procedure public.count_inserted_character_tags();
+
+-- Only updates, so rows of tags deleted in the same statement aren't brought back.
+-- Characters deleted along with their tags are already gone here, so their site counts
+-- are taken off by characters_uncount_tag_sites instead.
+create or replace function public.count_deleted_character_tags()
+returns trigger
+language plpgsql
+as $$
+begin
+  update public.tag_counts tc
+  set character_count = tc.character_count - d.character_count
+  from (
+    select tag_id, count(*) as character_count
+    from old_character_tags
+    group by tag_id
+    order by tag_id
+  ) d
+  where tc.tag_id = d.tag_id;
+
+  update public.tag_site_counts tsc
+  set character_count = tsc.character_count - d.character_count
+  from (
+    select o.tag_id, cr.site_id, count(*) as character_count
+    from old_character_tags o
+    join public.characters c on c.id = o.character_id
+    join public.creators cr on cr.id = c.creator_id
+    group by o.tag_id, cr.site_id
+    order by o.tag_id, cr.site_id
+  ) d
+  where tsc.tag_id = d.tag_id and tsc.site_id = d.site_id;
+  return null;
+end;
+$$;
+
+create trigger character_tags_count_deleted
+  after delete on public.character_tags
+  referencing old table as old_character_tags
+  for each statement execute procedure public.count_deleted_character_tags();
+
+create or replace function public.uncount_character_tag_sites()
+returns trigger
+language plpgsql
+as $$
+begin
+  update public.tag_site_counts tsc
+  set character_count = tsc.character_count - 1
+  from public.character_tags ct, public.creators cr
+  where ct.character_id = old.id
+    and cr.id = old.creator_id
+    and tsc.tag_id = ct.tag_id
+    and tsc.site_id = cr.site_id;
+  return old;
+end;
+$$;
+
+create trigger characters_uncount_tag_sites
+  before delete on public.characters
+  for each row execute procedure public.uncount_character_tag_sites();
+
+-- Characters moved to a creator on another site take their tags' site counts along.
+-- Ingest updates every character it sees but hardly ever changes a creator, so this is
+-- a row trigger limited to creator changes: column lists can't be combined with the
+-- transition tables a statement trigger would need.
+create or replace function public.move_character_tag_site_counts()
+returns trigger
+language plpgsql
+as $$
+declare
+  old_site_id uuid;
+  new_site_id uuid;
+begin
+  select site_id into old_site_id from public.creators where id = old.creator_id;
+  select site_id into new_site_id from public.creators where id = new.creator_id;
+  if old_site_id is not distinct from new_site_id then
+    return null;
+  end if;
+
+  update public.tag_site_counts tsc
+  set character_count = tsc.character_count - 1
+  from public.character_tags ct
+  where ct.character_id = new.id
+    and tsc.tag_id = ct.tag_id
+    and tsc.site_id = old_site_id;
+
+  insert into public.tag_site_counts as tsc (tag_id, site_id, character_count)
+  select tag_id, new_site_id, 1
+  from public.character_tags
+  where character_id = new.id
+  order by tag_id
+  on conflict (tag_id, site_id) do update
+  set character_count = tsc.character_count + 1;
+  return null;
+end;
+$$;
+
+create trigger characters_move_tag_site_counts
+  after update of creator_id on public.characters
+  for each row
+  when (old.creator_id is distinct from new.creator_id)
+  execute procedure public.move_character_tag_site_counts();
+
+-- Tags with at least p_min_count characters, on one site or all of them, most-used
+-- first. Tags without characters have no count row, so they're never returned.
+create or replace function public.tag_facets(
+  p_site_id uuid default null,
+  p_type integer default null,
+  p_min_count integer default 1,
+  p_limit integer default null
+)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(f order by f.character_count desc, f.name), '[]'::jsonb)
+  from (
+    select t.id, t.name, t.type, c.character_count
+    from (
+      select tag_id, character_count from public.tag_counts where p_site_id is null
+      union all
+      select tag_id, character_count from public.tag_site_counts where site_id = p_site_id
+    ) c
+    join public.tags t on t.id = c.tag_id
+    where c.character_count >= greatest(p_min_count, 1)
+      and (p_type is null or t.type = p_type)
+    order by c.character_count desc, t.name
+    limit p_limit
+  ) f;
+$$;
+
+create or replace function public.tag_usage_counts()
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(t order by t.character_count desc, t.name), '[]'::jsonb)
+  from (
+    select tags.id, tags.name, tags.type, coalesce(tc.character_count, 0) as character_count
+    from public.tags
+    left join public.tag_counts tc on tc.tag_id = tags.id
+  ) t;
+$$;
+
+-- Recount both tables from character_tags and fix the rows that drifted. Writers to the
+-- counts wait until it's done, so nothing changes between the recount and the fix.
+create or replace function public.rebuild_tag_facet_counts()
+returns jsonb
+language plpgsql
+as $$
+declare
+  tag_counts_fixed integer;
+  tag_site_counts_fixed integer;
+begin
+  lock table public.tag_counts, public.tag_site_counts in exclusive mode;
+
+  create temp table actual_tag_counts on commit drop as
+  select tag_id, count(*) as character_count
+  from public.character_tags
+  group by tag_id;
+
+  create temp table actual_tag_site_counts on commit drop as
+  select ct.tag_id, cr.site_id, count(*) as character_count
+  from public.character_tags ct
+  join public.characters c on c.id = ct.character_id
+  join public.creators cr on cr.id = c.creator_id
+  group by ct.tag_id, cr.site_id;
+
+  with stale as (
+    delete from public.tag_counts tc
+    where not exists (select 1 from actual_tag_counts a where a.tag_id = tc.tag_id)
+    returning tc.character_count
+  ), fixed as (
+    insert into public.tag_counts as tc (tag_id, character_count)
+    select tag_id, character_count from actual_tag_counts
+    on conflict (tag_id) do update
+    set character_count = excluded.character_count
+    where tc.character_count <> excluded.character_count
+    returning 1
+  )
+  select (select count(*) from stale where character_count <> 0)
+    + (select count(*) from fixed)
+  into tag_counts_fixed;
+
+  with stale as (
+    delete from public.tag_site_counts tsc
+    where not exists (
+      select 1 from actual_tag_site_counts a
+      where a.tag_id = tsc.tag_id and a.site_id = tsc.site_id
+    )
+    returning tsc.character_count
+  ), fixed as (
+    insert into public.tag_site_counts as tsc (tag_id, site_id, character_count)
+    select tag_id, site_id, character_count from actual_tag_site_counts
+    on conflict (tag_id, site_id) do update
+    set character_count = excluded.character_count
+    where tsc.character_count <> excluded.character_count
+    returning 1
+  )
+  select (select count(*) from stale where character_count <> 0)
+    + (select count(*) from fixed)
+  into tag_site_counts_fixed;
+
+  drop table actual_tag_counts;
+  drop table actual_tag_site_counts;
+  return jsonb_build_object(
+    'tag_counts_fixed', tag_counts_fixed,
+    'tag_site_counts_fixed', tag_site_counts_fixed
+  );
+end;
+$$;
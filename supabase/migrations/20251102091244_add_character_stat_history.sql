@@ -0,0 +1,212 @@
+-- Popularity history: each change to a character's counts appends one row holding how
+-- much each count moved, so a crawl that sees nothing new writes nothing. The character
+-- row keeps the latest counts, and earlier ones are found by subtracting later deltas.
+-- Partitioned by month so old history is dropped a partition at a time.
+create table if not exists public.character_stat_snapshots (
+  character_id uuid not null references public.characters(id) on delete cascade,
+  captured_at timestamptz not null default now(),
+  chat_delta integer not null default 0,
+  message_delta integer not null default 0,
+  like_delta integer not null default 0
+) partition by range (captured_at);
+
+create index if not exists character_stat_snapshots_character_id_idx
+  on public.character_stat_snapshots(character_id, captured_at);
+
+-- Catches rows outside the monthly partitions until they're created
+create table if not exists public.character_stat_snapshots_default
+  partition of public.character_stat_snapshots default;
+
+alter table public.character_stat_snapshots enable row level security;
+alter table public.character_stat_snapshots_default enable row level security;
+
+create policy "character_stat_snapshots_allow_select" on public.character_stat_snapshots
+  for select using (true);
+
+create or replace function public.record_character_stats()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into public.character_stat_snapshots (character_id, chat_delta, message_delta, like_delta)
+    values (
+      new.id, coalesce(new.chat_count, 0), coalesce(new.message_count, 0), coalesce(new.like_count, 0)
+    );
+  else
+    insert into public.character_stat_snapshots (character_id, chat_delta, message_delta, like_delta)
+    values (
+      new.id,
+      coalesce(new.chat_count, 0) - coalesce(old.chat_count, 0),
+      coalesce(new.message_count, 0) - coalesce(old.message_count, 0),
+      coalesce(new.like_count, 0) - coalesce(old.like_count, 0)
+    );
+  end if;
+  return null;
+end;
+$$;
+
+create trigger characters_record_inserted_stats
+  after insert on public.characters
+  for each row
+  when (coalesce(new.chat_count, 0) <> 0 or coalesce(new.message_count, 0) <> 0 or coalesce(new.like_count, 0) <> 0)
+  execute procedure public.record_character_stats();
+
+create trigger characters_record_updated_stats
+  after update of chat_count, message_count, like_count on public.characters
+  for each row
+  when (
+    coalesce(new.chat_count, 0) <> coalesce(old.chat_count, 0)
+    or coalesce(new.message_count, 0) <> coalesce(old.message_count, 0)
+    or coalesce(new.like_count, 0) <> coalesce(old.like_count, 0)
+  )
+  execute procedure public.record_character_stats();
+
+-- Trending score: ln of the character's likes (counted twice) and chats gained, each
+-- weighted by 2^(days since 2025-01-01 / 3). Growth is worth half as much every three
+-- days, but the score is only changed when counts are, so characters compare by it
+-- directly: it goes up ln 2 for every three days later the same growth happens.
+create or replace function public.character_trending_score(
+  p_score double precision, p_growth double precision, p_at timestamptz
+)
+returns double precision
+language sql
+immutable
+as $$
+  select case
+    when p_growth <= 0 then p_score
+    when p_score is null then g
+    else greatest(p_score, g) + ln(1 + exp(-abs(p_score - g)))
+  end
+  from (
+    select ln(p_growth) + (extract(epoch from p_at) - 1735689600) / 259200.0 * ln(2) as g
+  ) added;
+$$;
+
+alter table public.characters add column trending_score double precision;
+
+create index if not exists characters_trending_idx
+  on public.characters(trending_score desc)
+  where trending_score is not null;
+
+-- Counts seen when a character is first crawled aren't growth, so new characters start
+-- without a score
+create or replace function public.set_character_trending_score()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.trending_score := public.character_trending_score(
+    old.trending_score,
+    2 * greatest(coalesce(new.like_count, 0) - coalesce(old.like_count, 0), 0)
+      + greatest(coalesce(new.chat_count, 0) - coalesce(old.chat_count, 0), 0),
+    now()
+  );
+  return new;
+end;
+$$;
+
+create trigger characters_set_trending_score
+  before update of like_count, chat_count on public.characters
+  for each row execute procedure public.set_character_trending_score();
+
+-- Create the next p_months_ahead monthly partitions and drop those older than
+-- p_keep_months. Safe to run as often as needed.
+create or replace function public.maintain_character_stat_partitions(
+  p_months_ahead integer default 2, p_keep_months integer default 12
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  partition_start date;
+  partition_name text;
+  created text[] := '{}';
+  dropped text[] := '{}';
+begin
+  for i in 0..p_months_ahead loop
+    partition_start := (date_trunc('month', now()) + make_interval(months => i))::date;
+    partition_name := 'character_stat_snapshots_' || to_char(partition_start, 'YYYY_MM');
+    if to_regclass('public.' || partition_name) is null then
+      execute format(
+        'create table public.%I partition of public.character_stat_snapshots for values from (%L) to (%L)',
+        partition_name, partition_start, (partition_start + interval '1 month')::date
+      );
+      execute format('alter table public.%I enable row level security', partition_name);
+      created := created || partition_name;
+    end if;
+  end loop;
+
+  for partition_name in
+    select c.relname
+    from pg_inherits i
+    join pg_class c on c.oid = i.inhrelid
+    where i.inhparent = 'public.character_stat_snapshots'::regclass
+      and c.relname ~ '^character_stat_snapshots_\d{4}_\d{2}$'
+      and to_date(right(c.relname, 7), 'YYYY_MM')
+        < date_trunc('month', now()) - make_interval(months => p_keep_months)
+  loop
+    execute format('drop table public.%I', partition_name);
+    dropped := dropped || partition_name;
+  end loop;
+
+  return jsonb_build_object('created', created, 'dropped', dropped);
+end;
+$$;
+
+select public.maintain_character_stat_partitions();
+
+-- Record the counts every existing character has now, so later changes have a baseline
+insert into public.character_stat_snapshots (character_id, chat_delta, message_delta, like_delta)
+select id, coalesce(chat_count, 0), coalesce(message_count, 0), coalesce(like_count, 0)
+from public.characters
+where coalesce(chat_count, 0) <> 0 or coalesce(message_count, 0) <> 0 or coalesce(like_count, 0) <> 0;
+
+-- Most trending characters, optionally on one site. growth_per_day is the decayed likes
+-- (counted twice) and chats gained, per day of the three-day half-life.
+create or replace function public.trending_characters(
+  p_site_id uuid default null, p_limit integer default 50
+)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(t order by t.trending_score desc), '[]'::jsonb)
+  from (
+    select c.id, c.name, c.url, c.image_url, c.chat_count, c.message_count, c.like_count,
+      c.trending_score,
+      exp(c.trending_score - (extract(epoch from now()) - 1735689600) / 259200.0 * ln(2))
+        * ln(2) / 3 as growth_per_day
+    from public.characters c
+    join public.creators cr on cr.id = c.creator_id
+    where c.trending_score is not null
+      and (p_site_id is null or cr.site_id = p_site_id)
+    order by c.trending_score desc
+    limit p_limit
+  ) t;
+$$;
+
+-- A character's counts after each change since p_since, oldest first, rebuilt from its
+-- current counts by undoing later deltas
+create or replace function public.character_stat_history(
+  p_character_id uuid, p_since timestamptz default null
+)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(h order by h.captured_at), '[]'::jsonb)
+  from (
+    select s.captured_at,
+      coalesce(c.chat_count, 0) - coalesce(sum(s.chat_delta) over later, 0) as chat_count,
+      coalesce(c.message_count, 0) - coalesce(sum(s.message_delta) over later, 0) as message_count,
+      coalesce(c.like_count, 0) - coalesce(sum(s.like_delta) over later, 0) as like_count
+    from public.character_stat_snapshots s
+    join public.characters c on c.id = s.character_id
+    where s.character_id = p_character_id
+      and (p_since is null or s.captured_at >= p_since)
+    window later as (
+      order by s.captured_at desc rows between unbounded preceding and 1 preceding
+    )
+  ) h;
+$$;